@@ -4,22 +4,77 @@
 Libraries used
 """
 
+import argparse
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-from numpy.linalg import svd
-from scipy import stats
-from scipy.optimize import minimize, curve_fit
-from statsmodels.tsa.arima.model import ARIMA
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import r2_score
-from scipy.stats import pearsonr
-from statsmodels.stats.stattools import durbin_watson
-from statsmodels.stats.diagnostic import het_breuschpagan
-from statsmodels.stats.stattools import jarque_bera
-import statsmodels.api as sm
-import statsmodels.stats.api as sms
-from scipy.stats import f_oneway, kstest
+
+from nz_mortality import (
+    load_life_death_table, LIFE_DEATH_VALUE_COLUMNS, period_labels, aggregate_life_death_table, iter_table_chunks,
+    aggregate_life_death_chunks, MortalityCube, fit_cache_dir, fit_cache,
+    truncated_svd, lee_carter_svd, objective_function, reestimate_kt, lee_carter_newton_raphson, print_convergence,
+    lee_carter_batch, IncrementalLeeCarter, li_lee, lee_carter_poisson,
+    linear_regression, project_li_lee, project_death_rates, Prediction_death_rates,
+    calculate_mape, interpret_mape, compute_error_metrics, stack_frames, calculate_mape_per_age_group, regression_diagnostics,
+    ARIMA_FIT_CACHE, prediction_kt_Arima, select_arima_orders,
+    age_group_bounds, age_group_widths, age_group_midpoints, life_table,
+    fit_kt_process, simulate_kt_paths, simulate_mortality_fan,
+    cohort_indices, cohort_log_rates, extend_cohort_effect, age_period_cohort, renshaw_haberman,
+    gompertz_makeham, fit_gompertz_makeham_populations,
+    BACKTEST_FORECASTERS, rolling_origin_backtest, score_backtest, bootstrap_lee_carter,
+    PLOT_OUTPUT_DIR, figures, plot_mape_per_age_group, plot_actual_vs_estimate_per_age_group, plot_death_rates_comparison
+)
+
+"""Choix des sections à exécuter
+
+Les fonctions sont dans le paquet nz_mortality et ce script n'en est que l'analyse. On peut n'exécuter que certaines sections, par exemple python estimations-predictions-analysis.py --sections simulation backtest --skip-plots : les sections dont dépend une section choisie sont ajoutées automatiquement. statsmodels, scipy et matplotlib ne sont importés que par les sections qui s'en servent.
+
+--resolution annual fait tous les calculs par année civile au lieu de périodes de 5 ans, avec tous les âges du fichier Excel : les âges de 95 ans et plus sont regroupés dans un groupe ouvert 95+ au lieu d'être retirés. Les fichiers fournis ne donnent que des groupes d'âge de 5 ans, mais avec un fichier par âge simple (0, 1, ..., 110+) les mêmes calculs se font âge par âge, les groupes d'âge et les périodes étant lus dans les données.
+"""
+
+SECTION_DEPENDENCIES = {
+    'lee-carter': [],
+    'simulation': ['lee-carter'],
+    'cohort': ['lee-carter'],
+    'update': ['lee-carter'],
+    'makeham': ['lee-carter'],
+    'populations': ['lee-carter'],
+    'summary': ['lee-carter', 'makeham', 'populations'],
+    'backtest': ['populations'],
+    'arima-selection': ['summary'],
+    'bootstrap': ['populations']
+}
+
+# Largeur des périodes en années, âges retirés et âge à partir duquel les âges sont regroupés dans un groupe ouvert
+RESOLUTIONS = {
+    'grouped': {'bin_width': 5, 'excluded_ages': {'100-104', '105-109', '110+'}, 'open_age': None},
+    'annual': {'bin_width': 1, 'excluded_ages': set(), 'open_age': 95}
+}
+
+def resolve_sections(requested):
+    sections = set()
+    pending = list(requested)
+    while pending:
+        section = pending.pop()
+        if section not in sections:
+            sections.add(section)
+            pending.extend(SECTION_DEPENDENCIES[section])
+    return sections
+
+parser = argparse.ArgumentParser(description="Estimation et prévision de la mortalité en Nouvelle Zélande")
+parser.add_argument('--sections', nargs='+', choices=list(SECTION_DEPENDENCIES), default=list(SECTION_DEPENDENCIES),
+                    help="Sections à exécuter (par défaut toutes)")
+parser.add_argument('--resolution', choices=list(RESOLUTIONS), default='grouped',
+                    help="Périodes de 5 ans (grouped) ou années civiles avec tous les âges (annual)")
+parser.add_argument('--skip-plots', action='store_true', help="Ne dessine aucun graphique")
+parser.add_argument('--nz-source', help="Extrait CSV ou Parquet (colonnes Year, Age, décès et populations) lu par morceaux à la place du fichier Excel NZ")
+
+# parse_known_args ignore les arguments ajoutés par Colab / Jupyter
+args, _ = parser.parse_known_args()
+sections = resolve_sections(args.sections)
+resolution = RESOLUTIONS[args.resolution]
+SKIP_PLOTS = args.skip_plots
+
 
 """# I- Estimation et prévision du taux de Mortalité en Nouvelle Zélande avec la méthode de Lee Carter
 
@@ -28,105 +83,85 @@ from scipy.stats import f_oneway, kstest
 
 #Si vous utilisez Google Colab, importez les fichiers excels fournis dans la section fichier du colab
 
-# On charge le fichier Excel
-df_lifedeath = pd.read_excel('Life and Death Table NZ.xlsx')
+# Lignes du fichier NZ : le fichier Excel en entier, ou un extrait CSV / Parquet (par exemple des enregistrements individuels trop
+# nombreux pour tenir en mémoire) lu par morceaux avec --nz-source
+def nz_chunks():
+    if args.nz_source is None:
+        return [df_lifedeath]
+    return iter_table_chunks(args.nz_source, columns=['Year', 'Age', *LIFE_DEATH_VALUE_COLUMNS])
 
-#On nettoie le fichier pour éliminer les plages d'années incomplètes ainsi que les âges trop avancées qui risqueraient de fausser les calculs
-df_lifedeath = df_lifedeath[df_lifedeath.Year != 1948]
-df_lifedeath = df_lifedeath[df_lifedeath.Year != 1949]
-df_lifedeath = df_lifedeath[df_lifedeath.Year != 2022]
-df_lifedeath = df_lifedeath[df_lifedeath.Year != 2021]
-df_lifedeath = df_lifedeath[df_lifedeath.Year != 2020]
-df_lifedeath = df_lifedeath[df_lifedeath.Age != '100-104']
-df_lifedeath = df_lifedeath[df_lifedeath.Age != '105-109']
-df_lifedeath = df_lifedeath[df_lifedeath.Age != '110+']
-
-df_lifedeath = df_lifedeath.reset_index(drop=True)
-
-# On crée une fonction qui convertit les intervalles pour une meilleure similarité avec l'exemple de l'article 1 pour la méthode de Lee Carter
-def convert_to_interval(year):
-    lower_bound = year - (year % 5)
-    upper_bound = lower_bound + 4
-    return f"{lower_bound}-{upper_bound}"
-
-df_lifedeath['Year Interval'] = df_lifedeath['Year'].apply(convert_to_interval)
-
-# On regroupe les données par intervalles d'années et par âge, de plus, on ne selectionne le nombre de mort et d'habitants pour la population générale
-aggregated_df = df_lifedeath.groupby(['Year Interval', 'Age']).agg({
-    'Total Death': 'sum',
-    'Total Population': 'sum'
-})
+"""Nettoyage et agrégation des données par intervalles d'années et par âge"""
 
-print(aggregated_df)
+#On nettoie le fichier pour éliminer les plages d'années incomplètes ainsi que les âges trop avancées qui risqueraient de fausser les calculs
+nz_excluded_years = {1948, 1949, 2020, 2021, 2022}
 
-"""On calcule le taux de mortalité (mortality rate) et le taux de décès (death rate)"""
+if args.nz_source is None:
+    # On charge le fichier Excel
+    df_lifedeath = load_life_death_table('Life and Death Table NZ.xlsx')
 
-# On met en forme le dataframe et on extrait le nombre de décès et la population par intervalle d'années
-unstacked_df = aggregated_df.unstack(level=1)
+    aggregated_all_df = aggregate_life_death_table(
+        df_lifedeath,
+        excluded_years=nz_excluded_years,
+        **resolution
+    )
+else:
+    # Les décès et populations sont ajoutés morceau par morceau dans des tableaux âge × année : seul un morceau est en mémoire
+    aggregated_all_df = aggregate_life_death_chunks(nz_chunks(), excluded_years=nz_excluded_years, **resolution)
 
-total_death_df = unstacked_df['Total Death']
+# Les ajustements sont gardés à côté du fichier NZ, comme le cache des tableaux, quel que soit le dossier courant
+fit_cache.cache_dir = fit_cache_dir(args.nz_source or 'Life and Death Table NZ.xlsx')
 
-total_population_df = unstacked_df['Total Population']
+# On ne selectionne le nombre de mort et d'habitants que pour la population générale
+aggregated_df = aggregated_all_df[['Total Death', 'Total Population']]
 
-# On calcule le taux de mortalité
-mortality_rate_df = total_death_df / total_population_df
+print(aggregated_df)
 
-# On calcule le taux de décès
-death_rate_df = np.log(1 / (1 - mortality_rate_df))
+# On charge et on regroupe dès maintenant le fichier des populations Maori pour construire une seule structure pour toutes les populations
+df_lifedeath_maori = load_life_death_table('Life and Death Table Maori.xlsx')
 
-#Evite que les noms des colonnes soient doublés
-mortality_rate_df.columns.name = None
-death_rate_df.columns.name = None
+aggregated_df_maori = aggregate_life_death_table(
+    df_lifedeath_maori,
+    excluded_years={1948, 1949},
+    value_columns=['Total Death', 'Total Population'],
+    **resolution
+)
 
-#On formatte les dataframes comme dans l'exemple
-total_death_df = total_death_df.T
-total_population_df = total_population_df.T
-mortality_rate_df = mortality_rate_df.T
-death_rate_df = death_rate_df.T
+print(aggregated_df_maori)
 
-total_death_df.index.names = ['Age']
-total_population_df.index.names = ['Age']
-mortality_rate_df.index.names = ['Age']
-death_rate_df.index.names = ['Age']
+"""On calcule le taux de mortalité (mortality rate) et le taux de décès (death rate)
 
-total_death_df.index = total_death_df.index.str.strip()
-total_population_df.index = total_population_df.index.str.strip()
-mortality_rate_df.index = mortality_rate_df.index.str.strip()
-death_rate_df.index = death_rate_df.index.str.strip()
+On range les décès et les populations de toutes les populations dans un seul tableau numpy (population × sexe × âge × période) construit une seule fois. Les taux sont calculés une seule fois sur tout le tableau et les dataframes utilisés par la suite ne sont que des vues sur ce tableau.
+"""
 
-total_death_df.index = total_death_df.index.fillna('0')
-total_population_df.index = total_population_df.index.fillna('0')
-mortality_rate_df.index = mortality_rate_df.index.fillna('0')
-death_rate_df.index = death_rate_df.index.fillna('0')
+# Les groupes d'âge et les périodes sont ceux présents dans les données
+mortality_cube = MortalityCube.from_aggregated({'NZ': aggregated_all_df, 'Maori': aggregated_df_maori})
 
-age_groups = [
-    "0", "01-04", "05-09", "10-14", "15-19", "20-24", "25-29", "30-34",
-    "35-39", "40-44", "45-49", "50-54", "55-59", "60-64", "65-69",
-    "70-74", "75-79", "80-84", "85-89", "90-94", "95-99"
-]
-time_periods_initial = [
-    "1950-1954", "1955-1959", "1960-1964", "1965-1969", "1970-1974",
-    "1975-1979", "1980-1984", "1985-1989", "1990-1994", "1995-1999",
-    "2000-2004", "2005-2009", "2010-2014", "2015-2019"
-]
+age_groups = mortality_cube.ages
+time_periods_initial = mortality_cube.periods
 
-age_sorting = pd.DataFrame(np.zeros, index=age_groups, columns=time_periods_initial)
+# On garde les 10 dernières années pour comparer les prédictions (2 périodes de 5 ans ou 10 années civiles)
+period_width = resolution['bin_width']
+prediction_horizon = 10 // period_width
+prediction_horizons = list(range(1, prediction_horizon + 1))
+time_periods = time_periods_initial[:-prediction_horizon]
+prediction_periods = time_periods_initial[-prediction_horizon:]
+prediction_years = f"{prediction_periods[0][:4]}-{prediction_periods[-1][-4:]}"
 
-# On réorganise les dataframes pour mettre les âges dans l'ordre
-total_death_df = total_death_df.reindex(age_sorting.index)
-total_population_df = total_population_df.reindex(age_sorting.index)
-mortality_rate_df = mortality_rate_df.reindex(age_sorting.index)
-death_rate_df = death_rate_df.reindex(age_sorting.index)
+# On extrait le nombre de décès et la population, le taux de mortalité et le taux de décès de la population générale
+total_death_df = mortality_cube.frame('deaths', 'NZ')
+total_population_df = mortality_cube.frame('exposures', 'NZ')
+mortality_rate_df = mortality_cube.frame('mortality_rate', 'NZ')
+death_rate_df = mortality_cube.frame('death_rate', 'NZ')
 
 #On crée les dataframes pour les calculs avec les données historiques
-total_death_df_HD = total_death_df.drop(columns=['2010-2014', '2015-2019'])
-total_population_df_HD = total_population_df.drop(columns=[ '2010-2014', '2015-2019'])
-mortality_rate_df_HD = mortality_rate_df.drop(columns=[ '2010-2014', '2015-2019'])
-death_rate_df_HD = death_rate_df.drop(columns=[ '2010-2014', '2015-2019'])
+total_death_df_HD = mortality_cube.frame('deaths', 'NZ', periods=time_periods)
+total_population_df_HD = mortality_cube.frame('exposures', 'NZ', periods=time_periods)
+mortality_rate_df_HD = mortality_cube.frame('mortality_rate', 'NZ', periods=time_periods)
+death_rate_df_HD = mortality_cube.frame('death_rate', 'NZ', periods=time_periods)
 
 #On crée le dataframe de comparaison
-death_rate_comparison_df = death_rate_df[[ '2010-2014', '2015-2019']]
-mortality_rate_comparison_df = mortality_rate_df[[ '2010-2014', '2015-2019']]
+death_rate_comparison_df = mortality_cube.frame('death_rate', 'NZ', periods=prediction_periods)
+mortality_rate_comparison_df = mortality_cube.frame('mortality_rate', 'NZ', periods=prediction_periods)
 
 print(total_death_df_HD)
 
@@ -134,911 +169,1036 @@ print(mortality_rate_df_HD)
 
 print(death_rate_df_HD)
 
-"""On calcule une estimation de ax en suivant la méthode énoncée dans l'article 1"""
-
-ax_df = death_rate_df_HD.apply(lambda row: np.mean(np.log(row)), axis=1)
-a_x = ax_df.values
-
-print(ax_df)
-
-"""On calcule une estimation de bx et kt avec SVD comme demandé dans l'article 1"""
+"""Âges moyens des groupes d'âge et largeur des intervalles, utilisés par les graphiques par âge et les tables de mortalité"""
 
-# On calcule la matrice résiduelle A_x,t = ln(m_x,t) - ax
-A_xt = np.log(death_rate_df_HD) - a_x[:, np.newaxis]
+age_midpoints = age_group_midpoints(age_groups)
+age_lower_bounds, _ = age_group_bounds(age_groups)
+life_table_age_widths = age_group_widths(age_groups)
 
-# On effectue la Singular Value Decomposition (SVD)
-U, sigma, Vt = svd(A_xt, full_matrices=False)
+# Avec des années civiles on ne dessine les graphiques par période qu'une année sur 5
+period_plot_stride = max(1, 5 // period_width)
 
-# On extrait bx et kt
-b_x_raw = U[:, 0]  # La première colonne de U
-k_t_raw = sigma[0] * Vt[0, :]  # "Première valeur singulière multipliée par la première ligne de Vt
+# Deux courbes par âge moyen pour une période (taux observé et ajusté, hommes et femmes, Maori et population générale)
+def plot_age_curves(curves, labels, title, filename):
+    figures.add(
+        'age_curves', filename,
+        x=age_midpoints, xticklabels=age_groups,
+        curves=[np.asarray(curve, dtype=np.float64) for curve in curves], labels=labels, colors=['blue', 'orange'],
+        title=title, xlabel='Age moyen', ylabel='Taux de mortalité'
+    )
 
-# On s'assure la somme des bx est égale à 1
-b_x = b_x_raw / np.sum(b_x_raw)
+if 'lee-carter' in sections:
 
-# On s'assure que la moyenne des kt est égale à 0
-k_t = k_t_raw - np.mean(k_t_raw)
+    """On calcule une estimation de ax en suivant la méthode énoncée dans l'article 1"""
 
+    ax_df = death_rate_df_HD.apply(lambda row: np.mean(np.log(row)), axis=1)
+    a_x = ax_df.values
 
-# On crée le dataframe pour bx et kt
-bx_df = pd.DataFrame({
-    'Age Group': death_rate_df_HD.index,
-    'b_x': b_x
-})
+    print(ax_df)
 
+    """On calcule une estimation de bx et kt avec SVD comme demandé dans l'article 1"""
 
-kt_df = pd.DataFrame({
-    'Year Group': death_rate_df_HD.columns,
-    'k_t': k_t
-})
+    # On calcule la matrice résiduelle A_x,t = ln(m_x,t) - ax
+    A_xt = np.log(death_rate_df_HD) - a_x[:, np.newaxis]
 
+    # On effectue la Singular Value Decomposition (SVD) en ne gardant que le premier triplet singulier
+    U, sigma, Vt = truncated_svd(A_xt, rank=1)
 
-print("b_x DataFrame:")
-print(bx_df)
+    # On extrait bx et kt
+    b_x_raw = U[:, 0]  # La première colonne de U
+    k_t_raw = sigma[0] * Vt[0, :]  # "Première valeur singulière multipliée par la première ligne de Vt
 
-print("\nk_t DataFrame:")
-print(kt_df)
-
-"""On optimise k en suivant la méthode de l'article 1
-
-
-"""
+    # On s'assure la somme des bx est égale à 1
+    b_x = b_x_raw / np.sum(b_x_raw)
 
-def objective_function(kt, ax, bx, D_xt, E_xt):
-    expected_deaths = np.sum(E_xt * np.exp(ax[:, np.newaxis] + bx[:, np.newaxis] * kt), axis=0)
-    observed_deaths = np.sum(D_xt, axis=0)
-    return np.sum((observed_deaths - expected_deaths)**2)
+    # On s'assure que la moyenne des kt est égale à 0
+    k_t = k_t_raw - np.mean(k_t_raw)
 
-initial_kt = k_t
+    # On crée le dataframe pour bx et kt
+    bx_df = pd.DataFrame({
+        'Age Group': death_rate_df_HD.index,
+        'b_x': b_x
+    })
 
-result = minimize(objective_function, initial_kt, args=(a_x, b_x, total_death_df_HD, total_population_df_HD))
+    kt_df = pd.DataFrame({
+        'Year Group': death_rate_df_HD.columns,
+        'k_t': k_t
+    })
 
-optimized_kt = result.x
+    print("b_x DataFrame:")
+    print(bx_df)
 
-print("k_t optimisé:", optimized_kt)
+    print("\nk_t DataFrame:")
+    print(kt_df)
 
-"""Calcul du taux de mortalité estimé"""
+    """On regarde la part de la variance expliquée par chaque terme d'un modèle de Lee Carter de rang 2"""
 
-estimated_death_rates = np.exp(a_x[:, np.newaxis] + b_x[:, np.newaxis] * optimized_kt)
+    a_x_rank2, b_x_rank2, k_t_rank2, sigma_rank2 = lee_carter_svd(np.log(death_rate_df_HD), rank=2)
 
-time_periods = [
-    "1950-1954", "1955-1959", "1960-1964", "1965-1969", "1970-1974",
-    "1975-1979", "1980-1984", "1985-1989", "1990-1994", "1995-1999",
-    "2000-2004", "2005-2009"
-]
+    explained_variance = sigma_rank2 ** 2 / np.sum(np.asarray(A_xt) ** 2)
+    print("Part de la variance expliquée par les deux premiers termes:", explained_variance)
 
-estimated_death_rate_df = pd.DataFrame(estimated_death_rates.T, index=time_periods, columns=age_groups)
-estimated_death_rate_df = estimated_death_rate_df.T
+    """On optimise k en suivant la méthode de l'article 1
 
-estimated_mortality_rate_df = 1 - np.exp(-estimated_death_rate_df)
-print("Taux de mortalité estimé :")
-print(estimated_mortality_rate_df)
-
-"""Calcul du Mean Absolute Deviation (MAD)"""
-
-# Mean Absolute Deviation (MAD) par intervalles d'années
-mad_per_year = np.abs(mortality_rate_df_HD.values - estimated_mortality_rate_df.values).mean(axis=1)
-
-# Création d'un dataframe par intervalle d'années
-mad_df = pd.DataFrame(mad_per_year, index=death_rate_df_HD.index, columns=["MAD"])
-
-print("Mean Absolute Deviation (MAD) par intervalles d'années :")
-print(mad_df)
-
-"""On calcule le  Mean Absolute Percentage Error (MAPE) avec la méthode de l'article 2"""
-
-def calculate_mape(actual_df, forecast_df):
-    mape = np.mean(np.abs((actual_df.values - forecast_df.values) / actual_df.values)) * 100
-    return mape
+"""
 
-def interpret_mape(mape):
-    if mape < 10:
-        return("Estimation très précise (MAPE < 10%).")
-    elif 10 <= mape < 20:
-        return("Bonne estimation (10% <= MAPE < 20%).")
-    elif 20 <= mape < 50:
-        return("Estimation raisonnable (20% <= MAPE < 50%).")
-    else:
-        return("Estimation peu précise (MAPE >= 50%).")
+    initial_kt = k_t
 
-mape = calculate_mape(mortality_rate_df_HD, estimated_mortality_rate_df)
+    optimized_kt = reestimate_kt(a_x, b_x, total_death_df_HD, total_population_df_HD, initial_kt)
 
-print(f"MAPE: {mape:.2f}%")
-interpret_mape(mape)
+    print("Valeur de la fonction objectif:", objective_function(optimized_kt, a_x, b_x, total_death_df_HD, total_population_df_HD))
+    print("k_t optimisé:", optimized_kt)
 
-"""On calcule MAPE par groupe d'âge pour une analyse plus précise"""
+    """Calcul du taux de mortalité estimé"""
 
-def calculate_mape_per_age_group(actual_df, forecast_df):
+    estimated_death_rates = np.exp(a_x[:, np.newaxis] + b_x[:, np.newaxis] * optimized_kt)
 
-    mape_series = np.mean(np.abs((actual_df - forecast_df) / actual_df), axis=1) * 100
+    estimated_death_rate_df = pd.DataFrame(estimated_death_rates.T, index=time_periods, columns=age_groups)
+    estimated_death_rate_df = estimated_death_rate_df.T
 
-    return mape_series
+    estimated_mortality_rate_df = 1 - np.exp(-estimated_death_rate_df)
+    print("Taux de mortalité estimé :")
+    print(estimated_mortality_rate_df)
 
-mape_series_classic = calculate_mape_per_age_group(mortality_rate_df_HD, estimated_mortality_rate_df)
+    """Calcul du Mean Absolute Deviation (MAD)"""
 
-for age_group, mape in mape_series_classic.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age Group: {age_group}, MAPE: {mape:.2f}%, Interpretation: {interpretation}")
+    # Mean Absolute Deviation (MAD) par intervalles d'années
+    mad_per_year = np.abs(mortality_rate_df_HD.values - estimated_mortality_rate_df.values).mean(axis=1)
 
-def plot_mape_per_age_group(mape_series):
+    # Création d'un dataframe par intervalle d'années
+    mad_df = pd.DataFrame(mad_per_year, index=death_rate_df_HD.index, columns=["MAD"])
 
-    interpretations = [interpret_mape(mape) for mape in mape_series]
+    print("Mean Absolute Deviation (MAD) par intervalles d'années :")
+    print(mad_df)
 
-    colors = ['green' if "Estimation très précise (MAPE < 10%)." in interp else
-              'yellow' if "Bonne estimation (10% <= MAPE < 20%)." in interp else
-              'orange' if "Estimation raisonnable (20% <= MAPE < 50%)." in interp else
-              'red' for interp in interpretations]
+    """On calcule le  Mean Absolute Percentage Error (MAPE) avec la méthode de l'article 2"""
 
-    plt.figure(figsize=(12, 8))
-    plt.bar(mape_series.index, mape_series.values, color=colors)
+    mape = calculate_mape(mortality_rate_df_HD, estimated_mortality_rate_df)
 
-    plt.title("MAPE par groupe d'âge", fontsize=16)
-    plt.xlabel('Age Group', fontsize=14)
-    plt.ylabel('MAPE (%)', fontsize=14)
-    plt.xticks(rotation=45)
-    plt.ylim(0, max(mape_series.values) + 10)
+    print(f"MAPE: {mape:.2f}%")
+    interpret_mape(mape)
 
-    plt.tight_layout()
-    plt.show()
+    """On calcule MAPE par groupe d'âge pour une analyse plus précise"""
 
-plot_mape_per_age_group(mape_series_classic)
+    mape_series_classic = calculate_mape_per_age_group(mortality_rate_df_HD, estimated_mortality_rate_df)
 
-"""Graphs pour comparer le taux de mortalité actuel et estimé pour chaque catégorie"""
+    for age_group, mape in mape_series_classic.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age Group: {age_group}, MAPE: {mape:.2f}%, Interpretation: {interpretation}")
 
-actual_color = 'green'
-estimated_color = 'blue'
+    """Rendu des graphiques
 
-num_age_groups = len(age_groups)
+Les graphiques ne sont plus affichés au fil des calculs : chaque graphique est mis dans une file d'attente avec ses données, puis tous les graphiques sont dessinés à la fin du script, sans interface graphique, par des processus séparés qui écrivent des fichiers PNG dans PLOT_OUTPUT_DIR. Les graphiques d'un même type réutilisent la même figure et on ne fait que mettre à jour les données des courbes (set_data). L'option --skip-plots permet de ne rien dessiner.
+"""
 
-fig, axes = plt.subplots(num_age_groups, 1, figsize=(10, 5 * num_age_groups), sharex=True)
+    plot_mape_per_age_group(mape_series_classic, "mape_classique.png")
 
-for i, age_group in enumerate(age_groups):
-    axes[i].plot(mortality_rate_df_HD.columns, mortality_rate_df_HD.loc[age_group], label='Actual', color=actual_color)
-    axes[i].plot(estimated_mortality_rate_df.columns, estimated_mortality_rate_df.loc[age_group], label='Estimate', color=estimated_color)
-    axes[i].set_title(f'Group age {age_group}')
-    axes[i].set_xlabel('Year')
-    axes[i].set_ylabel('Mortality Rate')
-    axes[i].legend()
+    """Graphs pour comparer le taux de mortalité actuel et estimé pour chaque catégorie"""
 
-plt.tight_layout()
-plt.show()
+    plot_actual_vs_estimate_per_age_group(mortality_rate_df_HD, estimated_mortality_rate_df, "taux_actuel_estime_classique.png")
 
-"""# b) Estimations utilisant la méthode de Lee Carter avec la méthode des Moindres Carrés and Newton Raphson
+    """# b) Estimations utilisant la méthode de Lee Carter avec la méthode des Moindres Carrés and Newton Raphson
 
 Utilisons la méthode de Newton Raphson suivant la méthode de l'article pour trouver ax, bx et kt
 """
 
-def lee_carter_newton_raphson(log_m_xt, max_iter=100, tol=1e-6):
-    log_m_xt = log_m_xt.values
-    n, m = log_m_xt.shape
+    a_x_MCoptimized, b_x_MCoptimized, k_t_MCoptimized, trace_MC = lee_carter_newton_raphson(np.log(death_rate_df_HD))
 
-    ax = np.zeros(n)
-    bx = np.ones(n) / n
-    kt = np.zeros(m)
+    print_convergence(trace_MC)
 
-    for iteration in range(max_iter):
-        ax_old = ax.copy()
-        bx_old = bx.copy()
-        kt_old = kt.copy()
+    print("a_x estimé:", a_x_MCoptimized)
+    print("b_x estimé:", b_x_MCoptimized)
+    print("k_t estimé:", k_t_MCoptimized)
 
-        for x in range(n):
-            sum_term = np.sum(log_m_xt[x, :] - ax_old[x] - bx_old[x] * kt_old)
-            ax[x] += sum_term / (m + 1)
+    """On calcule la Table de mortalité estimée"""
 
-        for t in range(m):
-            sum_bx_residual = np.sum(bx_old * (log_m_xt[:, t] - ax - bx_old * kt_old[t]))
-            sum_bx_squared = np.sum(bx_old ** 2)
-            kt[t] += sum_bx_residual / sum_bx_squared
+    estimated_death_rates_MC = np.exp(a_x_MCoptimized[:, np.newaxis] + b_x_MCoptimized[:, np.newaxis] * k_t_MCoptimized)
 
-        for x in range(n):
-            sum_k_residual = np.sum(kt * (log_m_xt[x, :] - ax[x] - bx_old[x] * kt))
-            sum_k_squared = np.sum(kt ** 2)
-            bx[x] += sum_k_residual / sum_k_squared
+    estimated_death_rate_MC_df = pd.DataFrame(estimated_death_rates_MC.T, index=time_periods, columns=age_groups)
+    estimated_death_rate_MC_df = estimated_death_rate_MC_df.T
 
-        # On vérifie la convergence
-        if (np.max(np.abs(ax - ax_old)) < tol and
-            np.max(np.abs(bx - bx_old)) < tol and
-            np.max(np.abs(kt - kt_old)) < tol):
-            print(f"coverge en {iteration+1} iterations.")
-            break
-    else:
-        print("On a atteint le maximum d'itérations sans que la convergence a été atteinte.")
+    estimated_mortality_rate_MC_df = 1 - np.exp(-estimated_death_rate_MC_df)
 
+    print("Taux de mortalité estimés:")
+    print(estimated_mortality_rate_MC_df)
 
-    a_xNR = ax
-    b_xNR = bx
-    k_tNR = kt
+    """MAPE Function"""
 
-    return a_xNR, b_xNR, k_tNR
+    mape_MC= calculate_mape(mortality_rate_df_HD, estimated_mortality_rate_MC_df)
 
-a_x_MCoptimized, b_x_MCoptimized, k_t_MCoptimized = lee_carter_newton_raphson(np.log(death_rate_df_HD))
+    print(f"MAPE: {mape_MC:.2f}%")
 
-print("a_x estimé:", a_x_MCoptimized)
-print("b_x estimé:", b_x_MCoptimized)
-print("k_t estimé:", k_t_MCoptimized)
+    interpret_mape(mape_MC)
 
-"""On calcule la Table de mortalité estimée"""
+    mape_series_MC = calculate_mape_per_age_group(mortality_rate_df_HD, estimated_mortality_rate_MC_df)
 
-estimated_death_rates_MC = np.exp(a_x_MCoptimized[:, np.newaxis] + b_x_MCoptimized[:, np.newaxis] * k_t_MCoptimized)
+    for age_group, mape in mape_series_MC.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age du Groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
 
-age_groups = [
-    "0", "01-04", "05-09", "10-14", "15-19", "20-24", "25-29", "30-34",
-    "35-39", "40-44", "45-49", "50-54", "55-59", "60-64", "65-69",
-    "70-74", "75-79", "80-84", "85-89", "90-94", "95-99"
-]
-time_periods = [
-    "1950-1954", "1955-1959", "1960-1964", "1965-1969", "1970-1974",
-    "1975-1979", "1980-1984", "1985-1989", "1990-1994", "1995-1999",
-    "2000-2004", "2005-2009"
-]
+    plot_mape_per_age_group(mape_series_MC, "mape_newton_raphson.png")
 
-estimated_death_rate_MC_df = pd.DataFrame(estimated_death_rates_MC.T, index=time_periods, columns=age_groups)
-estimated_death_rate_MC_df = estimated_death_rate_MC_df.T
+    """Graphs to compare estimation and calculations"""
 
-estimated_mortality_rate_MC_df = 1 - np.exp(-estimated_death_rate_MC_df)
+    plot_actual_vs_estimate_per_age_group(
+        mortality_rate_df_HD, estimated_mortality_rate_MC_df, "taux_actuel_estime_newton_raphson.png",
+        title_prefix='Age du groupe', xlabel='Année', ylabel='Taux de mortalité'
+    )
 
-print("Taux de mortalité estimés:")
-print(estimated_mortality_rate_MC_df)
+    """Estimations utilisant la méthode de Lee Carter par maximum de vraisemblance de Poisson
 
-"""MAPE Function"""
+On ajuste ax, bx et kt directement sur les décès et les populations observés (total_death_df_HD et total_population_df_HD), en partant de la solution SVD
+"""
 
-mape_MC= calculate_mape(mortality_rate_df_HD, estimated_mortality_rate_MC_df)
+    a_x_poisson, b_x_poisson, k_t_poisson, trace_poisson = fit_cache.call(lee_carter_poisson, total_death_df_HD, total_population_df_HD)
 
-print(f"MAPE: {mape_MC:.2f}%")
+    print_convergence(trace_poisson)
+    print("Déviance:", trace_poisson['objective'].iloc[-1])
 
-interpret_mape(mape_MC)
+    # Le modèle de Poisson ajuste directement le rapport décès / population, c'est-à-dire mortality_rate_df_HD
+    estimated_mortality_rate_poisson_df = pd.DataFrame(
+        np.exp(a_x_poisson[:, np.newaxis] + b_x_poisson[:, np.newaxis] * k_t_poisson),
+        index=age_groups,
+        columns=time_periods
+    )
 
-mape_series_MC = calculate_mape_per_age_group(mortality_rate_df_HD, estimated_mortality_rate_MC_df)
+    mape_poisson = calculate_mape(mortality_rate_df_HD, estimated_mortality_rate_poisson_df)
 
-for age_group, mape in mape_series_MC.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age du Groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
+    print(f"MAPE: {mape_poisson:.2f}%")
+    interpret_mape(mape_poisson)
 
-plot_mape_per_age_group(mape_series_MC)
+    """# c) Predictions utilisant la méthode de Lee Carter avec la régression linéaire
 
-"""Graphs to compare estimation and calculations"""
+On choisit la deuxième méthode car elle est plus fiable
+"""
 
-actual_color = 'green'
-estimated_color = 'blue'
+    # On prédit les deux périodes de temps suivante avec la régression linéaire
+    RL_prevision_kt, alpha, beta = linear_regression(k_t_MCoptimized, time_periods, periods_to_forecast=prediction_horizon)
 
-num_age_groups = len(age_groups)
+    print(f"kt pour les {prediction_horizon} prochaines périodes prévisionnel:", RL_prevision_kt)
+    print(f"alpha estimé (intercept): {alpha:.3f}")
+    print(f"beta estimé (slope): {beta:.3f}")
 
-fig, axes = plt.subplots(num_age_groups, 1, figsize=(10, 5 * num_age_groups), sharex=True)
+    """On effectue les tests pour la régression linéaire
 
-for i, age_group in enumerate(age_groups):
-    axes[i].plot(mortality_rate_df_HD.columns, mortality_rate_df_HD.loc[age_group], label='Actual', color=actual_color)
-    axes[i].plot(estimated_mortality_rate_MC_df.columns, estimated_mortality_rate_MC_df.loc[age_group], label='Estimate', color=estimated_color)
-    axes[i].set_title(f'Age du groupe {age_group}')
-    axes[i].set_xlabel('Année')
-    axes[i].set_ylabel('Taux de mortalité')
-    axes[i].legend()
+Tous les tests sont calculés à partir des résidus d'un seul ajustement par moindres carrés, pour autant de séries kt que l'on veut à la fois
+"""
 
+    diagnostics = regression_diagnostics(k_t_MCoptimized).iloc[0]
 
-plt.tight_layout()
-plt.show()
+    print("R-squared:", diagnostics['R-squared'])
+    print("Correlation (r):", diagnostics['Correlation'])
+    print("Durbin-Watson statistic:", diagnostics['Durbin-Watson'])
+    print("F-statistic:", diagnostics['F-statistic'], "p-value du F-test:", diagnostics['F p-value'])
+    print("KS-statistic:", diagnostics['KS-statistic'], "p-value de KS :", diagnostics['KS p-value'])
 
-"""# c) Predictions utilisant la méthode de Lee Carter avec la régression linéaire
+    # Test de Glejser Test
+    print("p-value du test de Glejser (Breusch-Pagan):", diagnostics['BP p-value'])
 
-On choisit la deuxième méthode car elle est plus fiable
-"""
+    Prediction_RL_death_rates_df = Prediction_death_rates(a_x_MCoptimized, b_x_MCoptimized, RL_prevision_kt, age_groups, prediction_periods)
 
-def create_sequential_time_variable(time_periods):
-    return np.arange(len(time_periods)).reshape(-1, 1)
+    Prediction_RL_mortality_rates_df = 1 - np.exp(-Prediction_RL_death_rates_df)
 
+    print(Prediction_RL_mortality_rates_df)
 
-def linear_regression(kt, time_periods, periods_to_forecast=2):
+    mape_RL = calculate_mape(mortality_rate_comparison_df, Prediction_RL_mortality_rates_df)
 
-    t = create_sequential_time_variable(time_periods)
+    print(f"MAPE: {mape_RL:.2f}%")
+    interpret_mape(mape_RL)
 
-    #On applique la régression linéaire
-    model = LinearRegression()
-    model.fit(t, kt)
+    mape_series_RL = calculate_mape_per_age_group(mortality_rate_comparison_df, Prediction_RL_mortality_rates_df)
 
-    # Forecast future periods based on the sequential index
-    t_future = np.arange(len(time_periods), len(time_periods) + periods_to_forecast).reshape(-1, 1)
-    RL_prevision_kt = model.predict(t_future)
+    for age_group, mape in mape_series_RL.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
 
-    alpha = model.intercept_
-    beta = model.coef_[0]
+    plot_mape_per_age_group(mape_series_RL, "mape_regression_lineaire.png")
 
-    return RL_prevision_kt, alpha, beta
+    plot_death_rates_comparison(mortality_rate_comparison_df, Prediction_RL_mortality_rates_df, title=f"Comparaison entre le taux de mortalité prédit par régression linéaire et le taux actuel ({prediction_years})", filename="comparaison_regression_lineaire.png")
 
-# On prédit les deux périodes de temps suivante avec la régression linéaire
-RL_prevision_kt, alpha, beta = linear_regression(k_t_MCoptimized, time_periods, periods_to_forecast=2)
+    """# d) Prédictions utilisant la méthode de Lee Carter avec ARIMA"""
 
-print("kt pour les 2 prochaines périodes prévisionnel:", RL_prevision_kt)
-print(f"alpha estimé (intercept): {alpha:.3f}")
-print(f"beta estimé (slope): {beta:.3f}")
+    ARIMA_kt = prediction_kt_Arima(k_t_MCoptimized, periods=prediction_horizon, arima_order=(0, 1, 0))
 
-"""On effectue les tests pour la régression linéaire
+    print(f"kt prévisionel pour les {prediction_horizon} prochaines périodes:", ARIMA_kt)
 
+    Prediction_ARIMA_death_rates_df = Prediction_death_rates(a_x_MCoptimized, b_x_MCoptimized, ARIMA_kt, age_groups, prediction_periods)
 
-"""
+    Prediction_ARIMA_mortality_rates_df = 1 - np.exp(-Prediction_ARIMA_death_rates_df)
 
-t = create_sequential_time_variable(time_periods)
+    print(Prediction_ARIMA_mortality_rates_df)
 
-model = LinearRegression()
-model.fit(t, k_t_MCoptimized)
+    mape_ARIMA = calculate_mape(mortality_rate_comparison_df, Prediction_ARIMA_mortality_rates_df)
 
+    print(f"MAPE: {mape_ARIMA:.2f}%")
 
-predictions = model.predict(t)
-residuals = k_t_MCoptimized - predictions
+    interpret_mape(mape_ARIMA)
 
-# Correlation (r), Coefficient de Determination (r²), et Durbin-Watson Test
-r_squared = model.score(t, k_t_MCoptimized)
-correlation = np.corrcoef(k_t_MCoptimized, t.flatten())[0, 1]
-dw_statistic = durbin_watson(residuals)
+    mape_series_ARIMA = calculate_mape_per_age_group(mortality_rate_comparison_df, Prediction_ARIMA_mortality_rates_df)
 
-print("R-squared:", r_squared)
-print("Correlation (r):", correlation)
-print("Durbin-Watson statistic:", dw_statistic)
+    for age_group, mape in mape_series_ARIMA.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
 
-X = sm.add_constant(t)
-ols_model = sm.OLS(k_t_MCoptimized, X).fit()
+    plot_mape_per_age_group(mape_series_ARIMA, "mape_arima.png")
 
-# F-Test
-f_value, p_value_f_test = ols_model.fvalue, ols_model.f_pvalue
-print("F-statistic:", f_value, "p-value du F-test:", p_value_f_test)
+    plot_death_rates_comparison(mortality_rate_comparison_df, Prediction_ARIMA_mortality_rates_df, title=f"Comparaison entre le taux de mortalité prédit avec ARIMA et le taux actuel ({prediction_years})", filename="comparaison_arima.png")
 
-# Kolmogorov-Smirnov
-ks_statistic, p_value_ks = kstest(residuals, 'norm', args=(np.mean(residuals), np.std(residuals)))
-print("KS-statistic:", ks_statistic, "p-value de KS :", p_value_ks)
+"""# e) Simulation stochastique de kt et intervalles de prédiction par Monte Carlo
 
-# Test de Glejser Test
-_, p_value_glejser, _, _ = sms.het_breuschpagan(residuals, X)
-print("p-value du test de Glejser (Breusch-Pagan):", p_value_glejser)
+On ajuste un processus ARIMA (par défaut une marche aléatoire avec dérive, ARIMA(0,1,0)) sur kt, on simule un grand nombre de trajectoires de kt en un seul tirage par bloc, puis on les projette avec le modèle de Lee Carter pour obtenir des intervalles de prédiction des taux de mortalité et de l'espérance de vie
+"""
 
-def Prediction_death_rates(ax, bx, forecasted_kt, age_groups, prediction_periods):
-    forecast_df = pd.DataFrame(index=age_groups, columns=prediction_periods)
+if 'simulation' in sections:
 
-    for i, period in enumerate(prediction_periods):
-        forecasted_death_rates = np.exp(ax + bx * forecasted_kt[i])
-        forecast_df[period] = forecasted_death_rates
+    # On simule 50 ans à partir de la première période de prédiction
+    simulation_horizon = 50 // period_width
+    simulation_quantiles = (0.05, 0.5, 0.95)
+    simulation_periods = period_labels(int(prediction_periods[0][:4]) + period_width * np.arange(simulation_horizon), period_width)
+    age_65 = int(np.searchsorted(age_lower_bounds, 65, side='right')) - 1
 
-    return forecast_df
+    mortality_fan, life_expectancy_fan = simulate_mortality_fan(
+        a_x_MCoptimized, b_x_MCoptimized, k_t_MCoptimized,
+        horizon=simulation_horizon,
+        n_paths=100000,
+        quantiles=simulation_quantiles,
+        age_widths=life_table_age_widths,
+        random_state=0
+    )
 
-prediction_periods = [ '2010-2014', '2015-2019']
+    life_expectancy_at_birth_fan_df = pd.DataFrame(life_expectancy_fan[:, 0, :], index=simulation_quantiles, columns=simulation_periods)
 
-Prediction_RL_death_rates_df = Prediction_death_rates(a_x_MCoptimized, b_x_MCoptimized, RL_prevision_kt, age_groups, prediction_periods)
+    print("Intervalles de prédiction de l'espérance de vie à la naissance :")
+    print(life_expectancy_at_birth_fan_df)
 
-Prediction_RL_mortality_rates_df = 1 - np.exp(-Prediction_RL_death_rates_df)
+    mortality_fan_65_df = pd.DataFrame(mortality_fan[:, age_65, :], index=simulation_quantiles, columns=simulation_periods)
 
-print(Prediction_RL_mortality_rates_df)
+    print(f"Intervalles de prédiction du taux de mortalité des {age_groups[age_65]} ans :")
+    print(mortality_fan_65_df)
 
-mape_RL = calculate_mape(mortality_rate_comparison_df, Prediction_RL_mortality_rates_df)
+    """Tables de mortalité et facteurs de rente à partir des taux estimés et simulés
 
-print(f"MAPE: {mape_RL:.2f}%")
-interpret_mape(mape_RL)
+On construit la table du moment de la dernière période historique à partir des taux estimés par Newton Raphson, puis la distribution de l'espérance de vie et du facteur de rente à 65 ans de la génération qui a 65-69 ans en 2010-2014, sur toutes les trajectoires simulées de kt
+"""
 
-mape_series_RL = calculate_mape_per_age_group(mortality_rate_comparison_df, Prediction_RL_mortality_rates_df)
+    life_table_interest_rate = 0.03
 
-for age_group, mape in mape_series_RL.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
+    period_table = life_table(estimated_death_rates_MC, life_table_age_widths, interest_rate=life_table_interest_rate, radix=100000)
+    period_table_df = pd.DataFrame({column: values[:, -1] for column, values in period_table.items()}, index=age_groups)
 
-plot_mape_per_age_group(mape_series_RL)
+    print(f"Table de mortalité du moment estimée ({time_periods[-1]}) :")
+    print(period_table_df.to_string())
 
-def plot_death_rates_comparison(actual_df, forecast_df, title="Comparaison entre le taux de mortalité prédit et le taux actuel"):
-    age_groups = actual_df.index
+    # La génération qui a 65-69 ans pendant la première période projetée atteint le dernier groupe d'âge (95-99 ans) six périodes de 5 ans plus tard
+    cohort_horizon = int((age_lower_bounds[-1] - age_lower_bounds[age_65]) // period_width) + 1
+    cohort_kt_paths = simulate_kt_paths(fit_kt_process(k_t_MCoptimized, cohort_horizon), 100000, np.random.default_rng(0))
+    cohort_death_rates = project_death_rates(a_x_MCoptimized[age_65:], b_x_MCoptimized[age_65:], cohort_kt_paths)
 
-    plt.figure(figsize=(10, 6))
+    cohort_table = life_table(cohort_death_rates, life_table_age_widths[age_65:], kind='cohort', period_width=period_width,
+                              interest_rate=life_table_interest_rate, first_age=age_lower_bounds[age_65])
 
-    plt.plot(age_groups, actual_df.values, label='Actuel', marker='o', color='blue')
+    cohort_65_df = pd.DataFrame({
+        "Espérance de vie à 65 ans": np.quantile(cohort_table['ex'][:, 0, 0], simulation_quantiles),
+        f"Facteur de rente à 65 ans ({life_table_interest_rate:.0%})": np.quantile(cohort_table['annuity'][:, 0, 0], simulation_quantiles)
+    }, index=simulation_quantiles)
 
-    plt.plot(age_groups, forecast_df.values, label='Prévisionnel', marker='o', color='orange')
+    print(f"Génération qui a {age_groups[age_65]} ans en {simulation_periods[0]} (quantiles sur les trajectoires simulées) :")
+    print(cohort_65_df)
 
-    plt.title(title)
-    plt.xlabel('Age du groupe')
-    plt.ylabel('Taux de mortalité')
+"""# f) Effet de génération : modèles âge-période-cohorte et de Renshaw-Haberman
 
-    plt.xticks(rotation=45)
+On ajuste par maximum de vraisemblance de Poisson, sur les mêmes décès et populations que le modèle de Lee Carter de Poisson, le modèle âge-période-cohorte log m_xt = ax + kt + gc et le modèle de Renshaw-Haberman log m_xt = ax + bx kt + gc, où c = t - x est la génération. Le décalage de chaque groupe d'âge en nombre de périodes est la borne inférieure du groupe divisée par la largeur des périodes, comme pour les tables par génération. Pour la prévision, kt suit ARIMA(0,1,0) et les générations trop jeunes pour avoir été estimées une marche aléatoire avec dérive.
+"""
 
-    plt.legend()
+if 'cohort' in sections:
+
+    cohort_age_offsets = (age_lower_bounds // period_width).astype(int)
+
+    a_x_apc, k_t_apc, g_c_apc, cohorts_HD, trace_apc = age_period_cohort(
+        total_death_df_HD, total_population_df_HD, age_offsets=cohort_age_offsets
+    )
+    a_x_rh, b_x_rh, k_t_rh, b0_x_rh, g_c_rh, _, trace_rh = renshaw_haberman(
+        total_death_df_HD, total_population_df_HD, age_offsets=cohort_age_offsets
+    )
+
+    print_convergence(trace_apc)
+    print_convergence(trace_rh)
+
+    # Indices de génération des périodes historiques et des périodes de prédiction
+    cohorts_all = cohort_indices(len(age_groups), len(time_periods) + prediction_horizon, cohort_age_offsets)
+    cohorts_prediction = cohorts_all[:, len(time_periods):]
+
+    cohort_model_names = ['Lee Carter (Poisson)', 'Âge-période-cohorte', 'Renshaw-Haberman']
+    cohort_model_estimates = [
+        a_x_poisson[:, np.newaxis] + b_x_poisson[:, np.newaxis] * k_t_poisson,
+        cohort_log_rates(a_x_apc, k_t_apc, g_c_apc, cohorts_HD),
+        cohort_log_rates(a_x_rh, k_t_rh, g_c_rh, cohorts_HD, bx=b_x_rh, b0x=b0_x_rh)
+    ]
+    cohort_model_predictions = [
+        a_x_poisson[:, np.newaxis] + b_x_poisson[:, np.newaxis] * prediction_kt_Arima(k_t_poisson, periods=prediction_horizon),
+        cohort_log_rates(
+            a_x_apc, prediction_kt_Arima(k_t_apc, periods=prediction_horizon),
+            extend_cohort_effect(g_c_apc, cohorts_all.max() + 1), cohorts_prediction
+        ),
+        cohort_log_rates(
+            a_x_rh, prediction_kt_Arima(k_t_rh, periods=prediction_horizon),
+            extend_cohort_effect(g_c_rh, cohorts_all.max() + 1), cohorts_prediction, bx=b_x_rh, b0x=b0_x_rh
+        )
+    ]
+
+    cohort_models_df = pd.DataFrame({
+        'Itérations': [len(trace) for trace in (trace_poisson, trace_apc, trace_rh)],
+        'Déviance': [trace['objective'].iloc[-1] for trace in (trace_poisson, trace_apc, trace_rh)],
+        'Temps (s)': [trace['wall_time'].iloc[-1] for trace in (trace_poisson, trace_apc, trace_rh)],
+        "MAPE d'estimation": compute_error_metrics(
+            mortality_rate_df_HD, np.exp(np.stack(cohort_model_estimates))[:, np.newaxis], cohort_model_names, ['NZ Total'], age_groups
+        ).query("Age == 'Tous'")['MAPE'].to_numpy(),
+        'MAPE de prédiction': compute_error_metrics(
+            mortality_rate_comparison_df, np.exp(np.stack(cohort_model_predictions))[:, np.newaxis], cohort_model_names, ['NZ Total'], age_groups
+        ).query("Age == 'Tous'")['MAPE'].to_numpy()
+    }, index=cohort_model_names)
+
+    print("Comparaison des modèles avec et sans effet de génération (population générale) :")
+    print(cohort_models_df.to_string())
+
+    cohort_effect_df = pd.DataFrame(
+        {'Âge-période-cohorte': g_c_apc, 'Renshaw-Haberman': g_c_rh},
+        index=pd.Index(int(time_periods[0][:4]) + period_width * (np.arange(len(g_c_apc)) - cohort_age_offsets.max()), name='Génération')
+    )
+
+    print("Effets de génération estimés (gc) :")
+    print(cohort_effect_df.dropna(how='all').iloc[::period_plot_stride].T.to_string())
+
+"""# g) Mise à jour incrémentale quand une nouvelle période est publiée
+
+Quand une nouvelle année est publiée, on n'agrège que ses lignes, on les ajoute au cube des périodes déjà agrégées et on met à jour le modèle de Lee Carter à partir de statistiques résumées (moyenne et dispersion des log taux par âge), sans relire l'historique. On simule ici la publication successive des périodes de prédiction et on compare à une réestimation complète (agrégation de tout le fichier puis Newton Raphson avec départ à chaud).
+"""
 
-    plt.tight_layout()
-    plt.show()
+if 'update' in sections:
+
+    # Le cube et le modèle tels qu'ils étaient avant la publication des périodes de prédiction
+    update_cube = MortalityCube.from_aggregated({'NZ': aggregated_all_df, 'Maori': aggregated_df_maori}, periods=time_periods)
+    incremental_lee_carter = IncrementalLeeCarter(np.log(update_cube.matrix('death_rate', 'NZ')))
+    full_refit = (a_x_MCoptimized, b_x_MCoptimized, k_t_MCoptimized)
+
+    update_rows = []
+    for period in prediction_periods:
+        # Lignes du fichier correspondant à la période publiée, comme si elles arrivaient dans un nouveau fichier
+        published_years = range(int(period[:4]), int(period[-4:]) + 1)
+        published_rows = pd.concat([chunk[chunk['Year'].isin(published_years)] for chunk in nz_chunks()])
+
+        start_time = time.perf_counter()
+        update_cube = update_cube.append_periods({'NZ': aggregate_life_death_table(published_rows, **resolution)})
+        incremental_aggregation_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        incremental_lee_carter.append(np.log(update_cube.matrix('death_rate', 'NZ', periods=[period])))
+        a_x_incremental, b_x_incremental = incremental_lee_carter.parameters()
+        next_kt_incremental = incremental_lee_carter.forecast_kt(1)[0]
+        incremental_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        refit_cube = MortalityCube.from_aggregated(
+            {'NZ': aggregate_life_death_chunks(nz_chunks(), excluded_years=nz_excluded_years, **resolution)},
+            periods=update_cube.periods
+        )
+        full_aggregation_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        log_death_rates_refit = np.log(refit_cube.matrix('death_rate', 'NZ'))
+        full_refit = lee_carter_newton_raphson(log_death_rates_refit, initial=full_refit)[:3]
+        next_kt_refit = linear_regression(full_refit[2], update_cube.periods, periods_to_forecast=1)[0][0]
+        refit_time = time.perf_counter() - start_time
+
+        k_t_incremental = incremental_lee_carter.kt(log_death_rates_refit)
+        fitted_gap = (a_x_incremental[:, np.newaxis] + b_x_incremental[:, np.newaxis] * k_t_incremental
+                      - full_refit[0][:, np.newaxis] - full_refit[1][:, np.newaxis] * full_refit[2])
+
+        update_rows.append({
+            'Période publiée': period,
+            'kt incrémental': k_t_incremental[-1],
+            'Écart max. des log taux ajustés': np.max(np.abs(fitted_gap)),
+            'Écart max. des log taux prévus (période suivante)': np.max(np.abs(
+                a_x_incremental + b_x_incremental * next_kt_incremental - full_refit[0] - full_refit[1] * next_kt_refit)),
+            'Agrégation des nouvelles lignes (ms)': incremental_aggregation_time * 1000,
+            'Agrégation complète (ms)': full_aggregation_time * 1000,
+            'Mise à jour incrémentale (ms)': incremental_time * 1000,
+            'Newton Raphson à chaud (ms)': refit_time * 1000
+        })
+
+    print(pd.DataFrame(update_rows).set_index('Période publiée').to_string())
 
-plot_death_rates_comparison(mortality_rate_comparison_df, Prediction_RL_mortality_rates_df, title="Comparaison entre le taux de mortalité prédit par régression linéaire et le taux actuel (2010-2019)")
+"""#II- Estimation et prévision du taux de Mortalité de mortalité avec la méthode de Makeham"""
 
-"""# d) Prédictions utilisant la méthode de Lee Carter avec ARIMA"""
+if 'makeham' in sections:
 
-def prediction_kt_Arima(kt, periods=2, arima_order=(0, 1, 0)):
+    # On applique le modèle de Gompertz-Makeham au dataset
+    gompertz_makeham_params, gompertz_makeham_covariances = fit_gompertz_makeham_populations(age_midpoints, [death_rate_df_HD], cache=fit_cache)
+    gompertz_makeham_params = gompertz_makeham_params[0]
+    gompertz_makeham_covariances = gompertz_makeham_covariances[0]
 
-    model = ARIMA(kt, order=arima_order)
-    model_fit = model.fit()
+    for period, (A, B, C) in zip(time_periods, gompertz_makeham_params):
+        print(f"Paramètres ajustés pour {period}: A = {A:.4f}, B = {B:.4f}, C = {C:.4f}")
 
-    forecast = model_fit.forecast(steps=periods)
+    estimated_death_rates_GM = gompertz_makeham(age_midpoints[:, np.newaxis], *gompertz_makeham_params.T[:, np.newaxis, :])
 
-    return forecast
+    for t, period in list(enumerate(time_periods))[::period_plot_stride]:
 
-ARIMA_kt = prediction_kt_Arima(k_t_MCoptimized, periods=2, arima_order=(0, 1, 0))
+        plot_age_curves(
+            [death_rate_df[period].values, estimated_death_rates_GM[:, t]],
+            [f'Taux de mortalité observé ({period})', f'Gompertz-Makeham Model ajusté ({period})'],
+            f'Gompertz-Makeham Model adapté à la mortalité par intervalles d age ({period})',
+            f"gompertz_makeham_{period}.png"
+        )
 
-print("kt prévisionel pour les 2 prochaines périodes:", ARIMA_kt)
+    # On extrait le dataset obtenu avec le modèle Gompertz-Makeham
+    estimated_death_rates_GM_df = pd.DataFrame(estimated_death_rates_GM, index=age_groups, columns=time_periods)
 
-Prediction_ARIMA_death_rates_df = Prediction_death_rates(a_x_MCoptimized, b_x_MCoptimized, ARIMA_kt, age_groups, prediction_periods)
+    estimated_mortality_rates_GM_df = 1 - np.exp(-estimated_death_rates_GM_df)
 
-Prediction_ARIMA_mortality_rates_df = 1 - np.exp(-Prediction_ARIMA_death_rates_df)
+    print(estimated_mortality_rates_GM_df)
 
-print(Prediction_ARIMA_mortality_rates_df)
+    mape_Makeham = calculate_mape(mortality_rate_df_HD, estimated_mortality_rates_GM_df)
 
-mape_ARIMA = calculate_mape(mortality_rate_comparison_df, Prediction_ARIMA_mortality_rates_df)
+    print(f"MAPE: {mape_Makeham:.2f}%")
 
-print(f"MAPE: {mape_ARIMA:.2f}%")
+    interpret_mape(mape_Makeham)
 
-interpret_mape(mape_ARIMA)
+    mape_series_Makeham = calculate_mape_per_age_group(mortality_rate_df_HD, estimated_mortality_rates_GM_df)
 
-mape_series_ARIMA = calculate_mape_per_age_group(mortality_rate_comparison_df, Prediction_ARIMA_mortality_rates_df)
+    for age_group, mape in mape_series_Makeham.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
 
-for age_group, mape in mape_series_ARIMA.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
+    """On compare l'espérance de vie à la naissance observée et celle des taux estimés par Gompertz-Makeham et par Lee Carter, en une seule table de mortalité sur les trois surfaces empilées"""
 
-plot_mape_per_age_group(mape_series_ARIMA)
+    life_expectancy_at_birth_df = pd.DataFrame(
+        life_table(np.stack([death_rate_df_HD, estimated_death_rates_GM, estimated_death_rates_MC]), life_table_age_widths)['ex'][:, 0, :],
+        index=['Observé', 'Gompertz-Makeham', 'Lee Carter (Newton Raphson)'],
+        columns=time_periods
+    )
 
-plot_death_rates_comparison(mortality_rate_comparison_df, Prediction_ARIMA_mortality_rates_df, title="Comparaison entre le taux de mortalité prédit avec ARIMA et le taux actuel (2010-2019)")
+    print("Espérance de vie à la naissance :")
+    print(life_expectancy_at_birth_df.to_string())
 
-"""#II- Estimation et prévision du taux de Mortalité de mortalité avec la méthode de Makeham"""
+"""# III- Analyse de l'aspect dynamique de la mortalité
 
-def gompertz_makeham(x, A, B, C):
-    return A + B * np.exp(C * x)
+Le modèle retenu est le modèle de Lee-Carter avec pour méthode de prédiction la régression linéaire
 
-age_midpoints = []
-for group in age_groups:
-    if '-' in group:
-        start, end = map(int, group.split('-'))
-        midpoint = (start + end) / 2
-    else:
-        midpoint = int(group)
-    age_midpoints.append(midpoint)
+On va comparer la mortalité des hommes néo-zélandais à celles des femmes néo-zélandaise pour observer les différences liées au sexe puis celles des populations Maori et non Maori pour observer les différences liées aux critères sociaux économiques. Et par la suite, tester le modèle pour voir si il prend mieux en compte certaines populations que d'autres dans ses prédictions
 
-age_midpoints = np.array(age_midpoints)
+# a) Comparaison de mortalité entre Hommes et Femmes en Nouvelle Zélande
+"""
 
-fitted_params = {}
-estimated_death_rates_GM_dict = {}
+if 'populations' in sections:
 
-for period in time_periods:
+    #Création des dataframes pour les hommes
+    mortality_rate_men_df_HD = mortality_cube.frame('mortality_rate', 'NZ', 'Male', periods=time_periods)
+    death_rate_men_df_HD = mortality_cube.frame('death_rate', 'NZ', 'Male', periods=time_periods)
 
-    # On applique le modèle de Gompertz-Makeham au dataset
-    popt, pcov = curve_fit(gompertz_makeham, age_midpoints, death_rate_df[period].values, bounds=(0, np.inf))
+    death_rate_men_comparison_df = mortality_cube.frame('death_rate', 'NZ', 'Male', periods=prediction_periods)
+    mortality_rate_men_comparison_df = mortality_cube.frame('mortality_rate', 'NZ', 'Male', periods=prediction_periods)
 
-    A, B, C = popt
-    fitted_params[period] = {'A': A, 'B': B, 'C': C}
-    print(f"Paramètres ajustés pour {period}: A = {A:.4f}, B = {B:.4f}, C = {C:.4f}")
+    #Création des dataframes pour les femmes
+    mortality_rate_women_df_HD = mortality_cube.frame('mortality_rate', 'NZ', 'Female', periods=time_periods)
+    death_rate_women_df_HD = mortality_cube.frame('death_rate', 'NZ', 'Female', periods=time_periods)
 
-    estimated_death_rates_GM = gompertz_makeham(age_midpoints, A, B, C)
-    estimated_death_rates_GM_dict[period] = estimated_death_rates_GM
+    death_rate_women_comparison_df = mortality_cube.frame('death_rate', 'NZ', 'Female', periods=prediction_periods)
+    mortality_rate_women_comparison_df = mortality_cube.frame('mortality_rate', 'NZ', 'Female', periods=prediction_periods)
 
-    plt.figure(figsize=(10, 6))
-    plt.plot(age_midpoints, death_rate_df[period].values, '-', label=f'Taux de mortalité observé ({period})', color='blue')
-    plt.plot(age_midpoints, estimated_death_rates_GM, '-', label=f'Gompertz-Makeham Model ajusté ({period})', color='orange')
-    plt.xlabel('Age moyen')
-    plt.ylabel('Taux de mortalité')
-    plt.title(f'Gompertz-Makeham Model adapté à la mortalité par intervalles d age ({period})')
-    plt.xticks(age_midpoints, age_groups, rotation=45)
-    plt.legend()
-    plt.show()
+    """On compare les mportalité par intervalle de temps"""
 
-# On extrait le dataset obtenu avec le modèle Gompertz-Makeham
-estimated_death_rates_GM_df = pd.DataFrame(estimated_death_rates_GM_dict, index=age_groups)
+    for period in time_periods[::period_plot_stride]:
 
-estimated_mortality_rates_GM_df = 1 - np.exp(-estimated_death_rates_GM_df)
+        plot_age_curves(
+            [death_rate_men_df_HD[period].values, death_rate_women_df_HD[period].values],
+            [f'Taux de mortalité chez les hommes ({period})', f'Taux de mortalité chez les femmes ({period})'],
+            f'Différences entre hommes et femmes sur le taux de mortalité par intervalles d age ({period})',
+            f"hommes_femmes_{period}.png"
+        )
 
-print(estimated_mortality_rates_GM_df)
+    """# b) Testons la précision du modèle retenu sur les deux datasets
 
-mape_Makeham = calculate_mape(mortality_rate_df_HD, estimated_mortality_rates_GM_df)
+On teste le modèle sur la population masculine
+"""
 
-print(f"MAPE: {mape_Makeham:.2f}%")
+    a_x_men_MCoptimized, b_x_men_MCoptimized, k_t_men_MCoptimized, trace_men_MC = lee_carter_newton_raphson(np.log(death_rate_men_df_HD))
 
-interpret_mape(mape_Makeham)
+    print_convergence(trace_men_MC)
 
-mape_series_Makeham = calculate_mape_per_age_group(mortality_rate_df_HD, estimated_mortality_rates_GM_df)
+    print("a_x estimé:", a_x_men_MCoptimized)
+    print("b_x estimé:", b_x_men_MCoptimized)
+    print("k_t estimé:", k_t_men_MCoptimized)
 
-for age_group, mape in mape_series_Makeham.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
+    # On calcule le taux de décès estimé
+    estimated_death_rates_men_MC = np.exp(a_x_men_MCoptimized[:, np.newaxis] + b_x_men_MCoptimized[:, np.newaxis] * k_t_men_MCoptimized)
 
-"""# III- Analyse de l'aspect dynamique de la mortalité
+    estimated_death_rate_men_MC_df = pd.DataFrame(estimated_death_rates_men_MC.T, index=time_periods, columns=age_groups)
+    estimated_death_rate_men_MC_df = estimated_death_rate_men_MC_df.T
 
-Le modèle retenu est le modèle de Lee-Carter avec pour méthode de prédiction la régression linéaire
+    estimated_mortality_rate_men_MC_df = 1 - np.exp(-estimated_death_rate_men_MC_df)
 
-On va comparer la mortalité des hommes néo-zélandais à celles des femmes néo-zélandaise pour observer les différences liées au sexe puis celles des populations Maori et non Maori pour observer les différences liées aux critères sociaux économiques. Et par la suite, tester le modèle pour voir si il prend mieux en compte certaines populations que d'autres dans ses prédictions
+    print("Taux de mortalité estimés:")
+    print(estimated_death_rate_men_MC_df)
 
-# a) Comparaison de mortalité entre Hommes et Femmes en Nouvelle Zélande
-"""
+    mape_men = calculate_mape(mortality_rate_men_df_HD, estimated_mortality_rate_men_MC_df)
 
-#Création des dataframes pour les hommes
-aggregated_men_df = df_lifedeath.groupby(['Year Interval', 'Age']).agg({
-    'Male Death': 'sum',
-    'Male Population': 'sum'
-})
+    print(f"MAPE: {mape_men:.2f}%")
+    interpret_mape(mape_men)
 
-unstacked_men_df = aggregated_men_df.unstack(level=1)
+    RL_prevision_men_kt, alpha_men, beta_men = linear_regression(k_t_men_MCoptimized, time_periods, periods_to_forecast=prediction_horizon)
 
-total_men_death_df = unstacked_men_df['Male Death']
+    print(f"kt estimé pour les {prediction_horizon} prochaines périodes:", RL_prevision_men_kt)
+    print(f"Alpha estimé (intercept): {alpha_men:.3f}")
+    print(f"Beta estimé (slope): {beta_men:.3f}")
 
-total_men_population_df = unstacked_men_df['Male Population']
+    Prediction_RL_death_rates_men_df = Prediction_death_rates(a_x_men_MCoptimized, b_x_men_MCoptimized, RL_prevision_men_kt, age_groups, prediction_periods)
 
-mortality_rate_men_df = total_men_death_df / total_men_population_df
+    Prediction_RL_mortality_rates_men_df = 1 - np.exp(-Prediction_RL_death_rates_men_df)
 
-death_rate_men_df = np.log(1 / (1 - mortality_rate_men_df))
+    print(Prediction_RL_mortality_rates_men_df)
 
-mortality_rate_men_df.columns.name = None
-death_rate_men_df.columns.name = None
+    mape_men_prediction = calculate_mape(mortality_rate_men_comparison_df, Prediction_RL_mortality_rates_men_df)
 
-total_men_death_df = total_men_death_df.T
-total_men_population_df = total_men_population_df.T
-mortality_rate_men_df = mortality_rate_men_df.T
-death_rate_men_df = death_rate_men_df.T
+    print(f"MAPE: {mape_men_prediction:.2f}%")
 
-total_men_death_df.index.names = ['Age']
-total_men_population_df.index.names = ['Age']
-mortality_rate_men_df.index.names = ['Age']
-death_rate_men_df.index.names = ['Age']
+    interpret_mape(mape_men_prediction)
 
-total_men_death_df.index = total_men_death_df.index.str.strip()
-total_men_population_df.index = total_men_population_df.index.str.strip()
-mortality_rate_men_df.index = mortality_rate_men_df.index.str.strip()
-death_rate_men_df.index = death_rate_men_df.index.str.strip()
+    mape_series_men = calculate_mape_per_age_group(mortality_rate_men_comparison_df, Prediction_RL_mortality_rates_men_df)
 
-total_men_death_df.index = total_men_death_df.index.fillna('0')
-total_men_population_df.index = total_men_population_df.index.fillna('0')
-mortality_rate_men_df.index = mortality_rate_men_df.index.fillna('0')
-death_rate_men_df.index = death_rate_men_df.index.fillna('0')
+    for age_group, mape in mape_series_men.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
 
-total_men_death_df = total_men_death_df.reindex(age_sorting.index)
-total_men_population_df = total_men_population_df.reindex(age_sorting.index)
-mortality_rate_men_df = mortality_rate_men_df.reindex(age_sorting.index)
-death_rate_men_df = death_rate_men_df.reindex(age_sorting.index)
+    plot_mape_per_age_group(mape_series_men, "mape_hommes.png")
 
-total_men_death_df_HD = total_men_death_df.drop(columns=['2010-2014', '2015-2019'])
-total_men_population_df_HD = total_men_population_df.drop(columns=[ '2010-2014', '2015-2019'])
-mortality_rate_men_df_HD = mortality_rate_men_df.drop(columns=[ '2010-2014', '2015-2019'])
-death_rate_men_df_HD = death_rate_men_df.drop(columns=[ '2010-2014', '2015-2019'])
+    """On teste les modèles retenus chez les femmes"""
 
-death_rate_men_comparison_df = death_rate_men_df[[ '2010-2014', '2015-2019']]
-mortality_rate_men_comparison_df = mortality_rate_men_df[[ '2010-2014', '2015-2019']]
+    a_x_women_MCoptimized, b_x_women_MCoptimized, k_t_women_MCoptimized, trace_women_MC = lee_carter_newton_raphson(np.log(death_rate_women_df_HD))
 
-#Création des dataframes pour les femmes
+    print_convergence(trace_women_MC)
 
-aggregated_women_df = df_lifedeath.groupby(['Year Interval', 'Age']).agg({
-    'Female Death': 'sum',
-    'Female Population': 'sum'
-})
+    print("a_x estimé:", a_x_women_MCoptimized)
+    print("b_x estimé:", b_x_women_MCoptimized)
+    print("k_t estimé:", k_t_women_MCoptimized)
 
-unstacked_women_df = aggregated_women_df.unstack(level=1)
+    # On calcule le taux de décès estimé
+    estimated_death_rates_women_MC = np.exp(a_x_women_MCoptimized[:, np.newaxis] + b_x_women_MCoptimized[:, np.newaxis] * k_t_women_MCoptimized)
 
-total_women_death_df = unstacked_women_df['Female Death']
+    estimated_death_rate_women_MC_df = pd.DataFrame(estimated_death_rates_women_MC.T, index=time_periods, columns=age_groups)
+    estimated_death_rate_women_MC_df = estimated_death_rate_women_MC_df.T
 
-total_women_population_df = unstacked_women_df['Female Population']
+    estimated_mortality_rate_women_MC_df = 1 - np.exp(-estimated_death_rate_women_MC_df)
 
-mortality_rate_women_df = total_women_death_df / total_women_population_df
+    print("Taux de mortalité estimés:")
+    print(estimated_mortality_rate_women_MC_df)
 
-death_rate_women_df = np.log(1 / (1 - mortality_rate_women_df))
+    mape_women = calculate_mape(mortality_rate_women_df_HD, estimated_mortality_rate_women_MC_df)
 
-mortality_rate_women_df.columns.name = None
-death_rate_women_df.columns.name = None
+    print(f"MAPE: {mape_women:.2f}%")
+    interpret_mape(mape_women)
 
-total_women_death_df = total_women_death_df.T
-total_women_population_df = total_women_population_df.T
-mortality_rate_women_df = mortality_rate_women_df.T
-death_rate_women_df = death_rate_women_df.T
+    RL_prevision_women_kt, alpha_women, beta_women = linear_regression(k_t_women_MCoptimized, time_periods, periods_to_forecast=prediction_horizon)
 
-total_women_death_df.index.names = ['Age']
-total_women_population_df.index.names = ['Age']
-mortality_rate_women_df.index.names = ['Age']
-death_rate_women_df.index.names = ['Age']
+    print(f"kt prévisionnel pour les {prediction_horizon} prochaines périodes:", RL_prevision_women_kt)
+    print(f"Alpha estimé (intercept): {alpha_women:.3f}")
+    print(f"Beta estimé (slope): {beta_women:.3f}")
 
-total_women_death_df.index = total_women_death_df.index.str.strip()
-total_women_population_df.index = total_women_population_df.index.str.strip()
-mortality_rate_women_df.index = mortality_rate_women_df.index.str.strip()
-death_rate_women_df.index = death_rate_women_df.index.str.strip()
+    Prediction_RL_death_rates_women_df = Prediction_death_rates(a_x_women_MCoptimized, b_x_women_MCoptimized, RL_prevision_women_kt, age_groups, prediction_periods)
 
-total_women_death_df.index = total_women_death_df.index.fillna('0')
-total_women_population_df.index = total_women_population_df.index.fillna('0')
-mortality_rate_women_df.index = mortality_rate_women_df.index.fillna('0')
-death_rate_women_df.index = death_rate_women_df.index.fillna('0')
+    Prediction_RL_mortality_rates_women_df = 1 - np.exp(-Prediction_RL_death_rates_women_df)
 
-total_women_death_df = total_women_death_df.reindex(age_sorting.index)
-total_women_population_df = total_women_population_df.reindex(age_sorting.index)
-mortality_rate_women_df = mortality_rate_women_df.reindex(age_sorting.index)
-death_rate_women_df = death_rate_women_df.reindex(age_sorting.index)
+    print(Prediction_RL_mortality_rates_women_df)
 
-total_women_death_df_HD = total_women_death_df.drop(columns=['2010-2014', '2015-2019'])
-total_women_population_df_HD = total_women_population_df.drop(columns=[ '2010-2014', '2015-2019'])
-mortality_rate_women_df_HD = mortality_rate_women_df.drop(columns=[ '2010-2014', '2015-2019'])
-death_rate_women_df_HD = death_rate_women_df.drop(columns=[ '2010-2014', '2015-2019'])
+    mape_women_prediction = calculate_mape(mortality_rate_women_comparison_df, Prediction_RL_mortality_rates_women_df)
 
-death_rate_women_comparison_df = death_rate_women_df[[ '2010-2014', '2015-2019']]
-mortality_rate_women_comparison_df = mortality_rate_women_df[[ '2010-2014', '2015-2019']]
+    print(f"MAPE: {mape_women_prediction:.2f}%")
+    interpret_mape(mape_women_prediction)
 
-"""On compare les mportalité par intervalle de temps"""
+    mape_series_women = calculate_mape_per_age_group(mortality_rate_women_comparison_df, Prediction_RL_mortality_rates_women_df)
 
-for period in time_periods:
+    for age_group, mape in mape_series_women.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
 
-    plt.figure(figsize=(10, 6))
-    plt.plot(age_midpoints, death_rate_men_df_HD[period].values, '-', label=f'Taux de mortalité chez les hommes ({period})', color='blue')
-    plt.plot(age_midpoints, death_rate_women_df_HD[period].values, '-', label=f'Taux de mortalité chez les femmes ({period})', color='orange')
-    plt.xlabel('Age moyen')
-    plt.ylabel('Taux de mortalité')
-    plt.title(f'Différences entre hommes et femmes sur le taux de mortalité par intervalles d age ({period})')
-    plt.xticks(age_midpoints, age_groups, rotation=45)
-    plt.legend()
-    plt.show()
+    plot_mape_per_age_group(mape_series_women, "mape_femmes.png")
 
-"""# b) Testons la précision du modèle retenu sur les deux datasets
+    """# c) Comparaison de la mortalité Maori à celle de la population générale
 
-On teste le modèle sur la population masculine
+On met en forme le dataset pour les populations maoris
 """
 
-a_x_men_MCoptimized, b_x_men_MCoptimized, k_t_men_MCoptimized = lee_carter_newton_raphson(np.log(death_rate_men_df_HD))
-
-print("a_x estimé:", a_x_men_MCoptimized)
-print("b_x estimé:", b_x_men_MCoptimized)
-print("k_t estimé:", k_t_men_MCoptimized)
+    # Le fichier Maori s'arrête en 2008 : on ne garde que les périodes observées
+    maori_periods = [
+        period for period, observed in zip(time_periods, np.isfinite(mortality_cube.matrix('exposures', 'Maori', periods=time_periods)).all(axis=0))
+        if observed
+    ]
+    time_periods_maori = maori_periods[:-prediction_horizon]
+    prediction_periods_maori = maori_periods[-prediction_horizon:]
 
-# On calcule le taux de décès estimé
-estimated_death_rates_men_MC = np.exp(a_x_men_MCoptimized[:, np.newaxis] + b_x_men_MCoptimized[:, np.newaxis] * k_t_men_MCoptimized)
+    mortality_rate_df_maori = mortality_cube.frame('mortality_rate', 'Maori', periods=time_periods)
 
-estimated_death_rate_men_MC_df = pd.DataFrame(estimated_death_rates_men_MC.T, index=time_periods, columns=age_groups)
-estimated_death_rate_men_MC_df = estimated_death_rate_men_MC_df.T
+    #On crée les dataframes pour les calculs avec les données historiques
+    mortality_rate_maori_df_HD = mortality_cube.frame('mortality_rate', 'Maori', periods=time_periods_maori)
+    death_rate_df_maori_HD = mortality_cube.frame('death_rate', 'Maori', periods=time_periods_maori)
 
-estimated_mortality_rate_men_MC_df = 1 - np.exp(-estimated_death_rate_men_MC_df)
+    #On crée le dataframe de prédiction
+    death_rate_comparison_maori_df = mortality_cube.frame('death_rate', 'Maori', periods=prediction_periods_maori)
+    mortality_rate_comparison_maori_df = mortality_cube.frame('mortality_rate', 'Maori', periods=prediction_periods_maori)
 
-print("Taux de mortalité estimés:")
-print(estimated_death_rate_men_MC_df)
+    for period in time_periods[::period_plot_stride]:
 
-mape_men = calculate_mape(mortality_rate_men_df_HD, estimated_mortality_rate_men_MC_df)
+        plot_age_curves(
+            [mortality_rate_df_HD[period].values, mortality_rate_df_maori[period].values],
+            [f'Taux de mortalité Nouvelle Zélande ({period})', f'Taux de mortalité Maori ({period})'],
+            f'Différences de taux de mortalité par intervalle d age entre Maori et non Maori ({period})',
+            f"maori_nouvelle_zelande_{period}.png"
+        )
 
-print(f"MAPE: {mape_men:.2f}%")
-interpret_mape(mape_men)
+    """#  d) Testons la précision des modèles d'estimation et de prédictions retenus sur la population Maori"""
 
-RL_prevision_men_kt, alpha_men, beta_men = linear_regression(k_t_men_MCoptimized, time_periods, periods_to_forecast=2)
+    a_x_maori_MCoptimized, b_x_maori_MCoptimized, k_t_maori_MCoptimized, trace_maori_MC = lee_carter_newton_raphson(np.log(death_rate_df_maori_HD))
 
-print("kt estimé pour les deux prochaines périodes:", RL_prevision_men_kt)
-print(f"Alpha estimé (intercept): {alpha_men:.3f}")
-print(f"Beta estimé (slope): {beta_men:.3f}")
+    print_convergence(trace_maori_MC)
 
-Prediction_RL_death_rates_men_df = Prediction_death_rates(a_x_men_MCoptimized, b_x_men_MCoptimized, RL_prevision_men_kt, age_groups, prediction_periods)
+    print("a_x estimé:", a_x_maori_MCoptimized)
+    print("b_x estimé:", b_x_maori_MCoptimized)
+    print("k_t estimé:", k_t_maori_MCoptimized)
 
-Prediction_RL_mortality_rates_men_df = 1 - np.exp(-Prediction_RL_death_rates_men_df)
+    # On calcule le taux de décès estimé
+    estimated_death_rates_maori_MC = np.exp(a_x_maori_MCoptimized[:, np.newaxis] + b_x_maori_MCoptimized[:, np.newaxis] * k_t_maori_MCoptimized)
 
-print(Prediction_RL_mortality_rates_men_df)
+    estimated_death_rate_maori_MC_df = pd.DataFrame(estimated_death_rates_maori_MC.T, index=time_periods_maori, columns=age_groups)
+    estimated_death_rate_maori_MC_df = estimated_death_rate_maori_MC_df.T
 
-mape_men_prediction = calculate_mape(mortality_rate_men_comparison_df, Prediction_RL_mortality_rates_men_df)
+    estimated_mortality_rate_maori_MC_df = 1 - np.exp(-estimated_death_rate_maori_MC_df)
 
-print(f"MAPE: {mape_men_prediction:.2f}%")
+    print("Taux de mortalité estimés:")
+    print(estimated_mortality_rate_maori_MC_df)
 
-interpret_mape(mape_men_prediction)
+    mape_maori = calculate_mape(mortality_rate_maori_df_HD, estimated_mortality_rate_maori_MC_df)
 
-mape_series_men = calculate_mape_per_age_group(mortality_rate_men_comparison_df, Prediction_RL_mortality_rates_men_df)
+    print(f"MAPE: {mape_maori:.2f}%")
+    interpret_mape(mape_maori)
 
-for age_group, mape in mape_series_men.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
+    RL_prevision_maori_kt, alpha_maori, beta_maori = linear_regression(k_t_maori_MCoptimized, time_periods_maori, periods_to_forecast=prediction_horizon)
 
-plot_mape_per_age_group(mape_series_men)
+    print(f"kt prévisionnel pour les {prediction_horizon} prochaines périodes:", RL_prevision_maori_kt)
+    print(f"Alpha estimé (intercept): {alpha_maori:.3f}")
+    print(f"Beta estimé (slope): {beta_maori:.3f}")
 
-"""On teste les modèles retenus chez les femmes"""
+    Prediction_RL_death_rates_maori_df = Prediction_death_rates(a_x_maori_MCoptimized, b_x_maori_MCoptimized, RL_prevision_maori_kt, age_groups, prediction_periods_maori)
 
-a_x_women_MCoptimized, b_x_women_MCoptimized, k_t_women_MCoptimized = lee_carter_newton_raphson(np.log(death_rate_women_df_HD))
+    Prediction_RL_mortality_rates_maori_df = 1 - np.exp(-Prediction_RL_death_rates_maori_df)
 
-print("a_x estimé:", a_x_women_MCoptimized)
-print("b_x estimé:", b_x_women_MCoptimized)
-print("k_t estimé:", k_t_women_MCoptimized)
+    print(Prediction_RL_mortality_rates_maori_df)
 
-# On calcule le taux de décès estimé
-estimated_death_rates_women_MC = np.exp(a_x_women_MCoptimized[:, np.newaxis] + b_x_women_MCoptimized[:, np.newaxis] * k_t_women_MCoptimized)
+    mape_maori_prediction = calculate_mape(mortality_rate_comparison_maori_df, Prediction_RL_mortality_rates_maori_df)
 
-estimated_death_rate_women_MC_df = pd.DataFrame(estimated_death_rates_women_MC.T, index=time_periods, columns=age_groups)
-estimated_death_rate_women_MC_df = estimated_death_rate_women_MC_df.T
+    print(f"MAPE: {mape_maori_prediction:.2f}%")
+    interpret_mape(mape_maori_prediction)
 
-estimated_mortality_rate_women_MC_df = 1 - np.exp(-estimated_death_rate_women_MC_df)
+    mape_series_maori_RL = calculate_mape_per_age_group(mortality_rate_comparison_maori_df, Prediction_RL_mortality_rates_maori_df)
 
-print("Taux de mortalité estimés:")
-print(estimated_mortality_rate_women_MC_df)
+    for age_group, mape in mape_series_maori_RL.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
 
-mape_women = calculate_mape(mortality_rate_women_df_HD, estimated_mortality_rate_women_MC_df)
+    plot_mape_per_age_group(mape_series_maori_RL, "mape_maori_regression_lineaire.png")
 
-print(f"MAPE: {mape_women:.2f}%")
-interpret_mape(mape_women)
+    """On va tester avec ARIMA"""
 
-RL_prevision_women_kt, alpha_women, beta_women = linear_regression(k_t_women_MCoptimized, time_periods, periods_to_forecast=2)
+    ARIMA_kt_maori = prediction_kt_Arima(k_t_maori_MCoptimized, periods=prediction_horizon, arima_order=(0, 1, 0))
 
-print("kt prévisionnel pour les 2 prochaines périodes:", RL_prevision_women_kt)
-print(f"Alpha estimé (intercept): {alpha_women:.3f}")
-print(f"Beta estimé (slope): {beta_women:.3f}")
+    print(f"kt prévisionnel pour les {prediction_horizon} prochaines périodes:", ARIMA_kt_maori)
 
-Prediction_RL_death_rates_women_df = Prediction_death_rates(a_x_women_MCoptimized, b_x_women_MCoptimized, RL_prevision_women_kt, age_groups, prediction_periods)
+    Prediction_ARIMA_death_rates_maori_df = Prediction_death_rates(a_x_maori_MCoptimized, b_x_maori_MCoptimized, ARIMA_kt_maori, age_groups, prediction_periods_maori)
 
-Prediction_RL_mortality_rates_women_df = 1 - np.exp(-Prediction_RL_death_rates_women_df)
+    Prediction_ARIMA_mortality_rates_maori_df = 1 - np.exp(-Prediction_ARIMA_death_rates_maori_df)
 
-print(Prediction_RL_mortality_rates_women_df)
+    print(Prediction_ARIMA_mortality_rates_maori_df)
 
-mape_women_prediction = calculate_mape(mortality_rate_women_comparison_df, Prediction_RL_mortality_rates_women_df)
+    mape_maori_ARIMA_prediction = calculate_mape(mortality_rate_comparison_maori_df, Prediction_ARIMA_mortality_rates_maori_df)
 
-print(f"MAPE: {mape_women_prediction:.2f}%")
-interpret_mape(mape_women_prediction)
+    print(f"MAPE: {mape_maori_ARIMA_prediction:.2f}%")
+    interpret_mape(mape_maori_ARIMA_prediction)
 
-mape_series_women = calculate_mape_per_age_group(mortality_rate_women_comparison_df, Prediction_RL_mortality_rates_women_df)
+    mape_series_maori_ARIMA = calculate_mape_per_age_group(mortality_rate_comparison_maori_df, Prediction_ARIMA_mortality_rates_maori_df)
 
-for age_group, mape in mape_series_women.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
+    for age_group, mape in mape_series_maori_ARIMA.items():
+        interpretation = interpret_mape(mape)
+        print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
 
-plot_mape_per_age_group(mape_series_women)
+    plot_mape_per_age_group(mape_series_maori_ARIMA, "mape_maori_arima.png")
 
-"""# c) Comparaison de la mortalité Maori à celle de la population générale
+    """# e) Ajustement simultané du modèle de Lee Carter sur toutes les populations
 
-On importe et on met en forme le dataset pour les populations maoris
+On ajuste les quatre populations en un seul appel : les matrices sont empilées et les périodes de prédiction des Maori sont masquées
 """
 
-# Charger le fichier Excel
-df_lifedeath_maori = pd.read_excel('Life and Death Table Maori.xlsx')
-
-#On nettoie le fichier pour éliminer les plages d'années incomplètes ainsi que les âges trop avancées qui risqueraient de fausser les calculs
-df_lifedeath_maori = df_lifedeath_maori[df_lifedeath_maori.Year != 1948]
-df_lifedeath_maori = df_lifedeath_maori[df_lifedeath_maori.Year != 1949]
-df_lifedeath_maori = df_lifedeath_maori[df_lifedeath_maori.Age != '100-104']
-df_lifedeath_maori = df_lifedeath_maori[df_lifedeath_maori.Age != '105-109']
-df_lifedeath_maori = df_lifedeath_maori[df_lifedeath_maori.Age != '110+']
-
-df_lifedeath_maori = df_lifedeath_maori.reset_index(drop=True)
-
-df_lifedeath_maori['Year Interval'] = df_lifedeath_maori['Year'].apply(convert_to_interval)
+    batch_populations = [('NZ', 'Total'), ('NZ', 'Male'), ('NZ', 'Female'), ('Maori', 'Total')]
 
-# On regroupe les données par intervalles d'années et par âge, de plus, on calcul le nombre de mort et d'habitants pour la population générale
-aggregated_df_maori = df_lifedeath_maori.groupby(['Year Interval', 'Age']).agg({
-    'Total Death': 'sum',
-    'Total Population': 'sum'
-})
+    log_death_rate_batch = np.log(np.stack([
+        mortality_cube.matrix('death_rate', population, sex, periods=time_periods) for population, sex in batch_populations
+    ]))
+    batch_mask = np.isfinite(log_death_rate_batch)
+    batch_mask[3, :, len(time_periods_maori):] = False
 
-print(aggregated_df_maori)
-
-# On met en forme le dataframe et on extrait le nombre de décès et la population par intervalle d'années
-unstacked_df_maori = aggregated_df_maori.unstack(level=1)
+    a_x_batch, b_x_batch, k_t_batch, trace_batch = lee_carter_batch(log_death_rate_batch, mask=batch_mask)
 
-total_death_df_maori = unstacked_df_maori['Total Death']
+    trace_batch.index = [f'{population} {sex}' for population, sex in batch_populations]
+    print(trace_batch)
 
-total_population_df_maori = unstacked_df_maori['Total Population']
+    # On vérifie que les taux ajustés sont les mêmes qu'avec les ajustements séparés. Partie de la SVD, la méthode a convergé dès la première
+    # itération et la comparaison ne vérifierait que la SVD : on refait l'ajustement depuis le point de départ des ajustements séparés
+    a_x_batch_zeros, b_x_batch_zeros, k_t_batch_zeros, trace_batch_zeros = lee_carter_batch(log_death_rate_batch, mask=batch_mask, init='zeros')
+    print(f"Itérations depuis le point de départ des ajustements séparés : {trace_batch_zeros['iterations'].tolist()}")
+    separate_fits = [
+        (a_x_MCoptimized, b_x_MCoptimized, k_t_MCoptimized),
+        (a_x_men_MCoptimized, b_x_men_MCoptimized, k_t_men_MCoptimized),
+        (a_x_women_MCoptimized, b_x_women_MCoptimized, k_t_women_MCoptimized),
+        (a_x_maori_MCoptimized, b_x_maori_MCoptimized, k_t_maori_MCoptimized)
+    ]
 
-# On calcule le taux de mortalité
-mortality_rate_df_maori = total_death_df_maori / total_population_df_maori
+    for p, (ax, bx, kt) in enumerate(separate_fits):
+        fitted_separate = ax[:, np.newaxis] + bx[:, np.newaxis] * kt
+        fitted_batch = a_x_batch_zeros[p][:, np.newaxis] + b_x_batch_zeros[p][:, np.newaxis] * k_t_batch_zeros[p][:len(kt)]
+        fitted_batch_svd = a_x_batch[p][:, np.newaxis] + b_x_batch[p][:, np.newaxis] * k_t_batch[p][:len(kt)]
+        print(f"{trace_batch.index[p]} : écart maximal entre les log taux ajustés = {np.max(np.abs(fitted_separate - fitted_batch)):.2e}"
+              f" (départ SVD : {np.max(np.abs(fitted_separate - fitted_batch_svd)):.2e})")
 
-# On calcule le taux de décès
-death_rate_df_maori = np.log(1 / (1 - mortality_rate_df_maori))
+    """# f) Modèle cohérent de Li et Lee
 
-mortality_rate_df_maori.columns.name = None
-death_rate_df_maori.columns.name = None
+Les ajustements séparés donnent à chaque population son propre kt : prolongés indépendamment, les taux des hommes, des femmes et des Maori s'écartent sans limite. Le modèle de Li et Lee log m_pxt = a_px + Bx Kt + b_px k_pt ajuste en une seule fois un facteur commun Bx Kt sur toutes les populations et un facteur propre à chaque population. Kt est prolongé par une marche aléatoire avec dérive et chaque k_pt par un AR(1) qui revient vers 0, ce qui garde les écarts entre populations bornés. Les périodes de prédiction des Maori sont masquées comme pour l'ajustement simultané : Kt y est connu grâce aux autres populations.
+"""
 
-#On formatte les dataframes comme dans l'exemple
-total_death_df_maori = total_death_df_maori.T
-total_population_df_maori = total_population_df_maori.T
-mortality_rate_df_maori = mortality_rate_df_maori.T
-death_rate_df_maori = death_rate_df_maori.T
+    a_x_li_lee, B_x_li_lee, K_t_li_lee, b_x_li_lee, k_t_li_lee, trace_li_lee = li_lee(log_death_rate_batch, mask=batch_mask)
+
+    trace_li_lee.index = trace_batch.index
+    print(trace_li_lee)
+    print("B_x estimé:", B_x_li_lee)
+    print("K_t estimé:", K_t_li_lee)
+
+    li_lee_horizon = 50 // period_width
+    log_death_rates_li_lee, phi_li_lee = project_li_lee(a_x_li_lee, B_x_li_lee, K_t_li_lee, b_x_li_lee, k_t_li_lee, li_lee_horizon)
+    mortality_rates_li_lee = 1 - np.exp(-np.exp(log_death_rates_li_lee))
+
+    # Périodes d'estimation et de prédiction de chaque population (position dans time_periods)
+    li_lee_fit_ends = [len(time_periods)] * 3 + [len(time_periods_maori)]
+
+    li_lee_comparison_df = pd.DataFrame({
+        'phi (AR(1) de k_pt)': phi_li_lee,
+        "MAPE d'estimation séparée": [
+            calculate_mape(actual, estimated) for actual, estimated in zip(
+                [mortality_rate_df_HD, mortality_rate_men_df_HD, mortality_rate_women_df_HD, mortality_rate_maori_df_HD],
+                [estimated_mortality_rate_MC_df, estimated_mortality_rate_men_MC_df, estimated_mortality_rate_women_MC_df, estimated_mortality_rate_maori_MC_df])
+        ],
+        "MAPE d'estimation Li-Lee": [
+            calculate_mape(actual, pd.DataFrame(rates[:, :end])) for actual, rates, end in zip(
+                [mortality_rate_df_HD, mortality_rate_men_df_HD, mortality_rate_women_df_HD, mortality_rate_maori_df_HD], mortality_rates_li_lee, li_lee_fit_ends)
+        ],
+        'MAPE de prédiction séparée (RL)': [
+            calculate_mape(actual, predicted) for actual, predicted in zip(
+                [mortality_rate_comparison_df, mortality_rate_men_comparison_df, mortality_rate_women_comparison_df, mortality_rate_comparison_maori_df],
+                [Prediction_RL_mortality_rates_df, Prediction_RL_mortality_rates_men_df, Prediction_RL_mortality_rates_women_df, Prediction_RL_mortality_rates_maori_df])
+        ],
+        'MAPE de prédiction Li-Lee': [
+            calculate_mape(actual, pd.DataFrame(rates[:, end:end + prediction_horizon])) for actual, rates, end in zip(
+                [mortality_rate_comparison_df, mortality_rate_men_comparison_df, mortality_rate_women_comparison_df, mortality_rate_comparison_maori_df],
+                mortality_rates_li_lee, li_lee_fit_ends)
+        ]
+    }, index=trace_batch.index)
+
+    print(li_lee_comparison_df.to_string())
+
+    # Cohérence à long terme : écart moyen des log taux de décès entre hommes et femmes à la dernière période observée puis dans
+    # li_lee_horizon périodes, avec les régressions linéaires séparées et avec le modèle de Li et Lee
+    separate_long_horizon = [
+        a_x[:, np.newaxis] + b_x[:, np.newaxis] * linear_regression(k_t, time_periods, periods_to_forecast=li_lee_horizon)[0]
+        for a_x, b_x, k_t in separate_fits[1:3]
+    ]
+    sex_gap_df = pd.DataFrame({
+        'Dernière période observée': [
+            np.mean(np.log(death_rate_men_df_HD.values[:, -1] / death_rate_women_df_HD.values[:, -1]))
+        ] * 2,
+        f'Dans {li_lee_horizon} périodes': [
+            np.mean(separate_long_horizon[0][:, -1] - separate_long_horizon[1][:, -1]),
+            np.mean(log_death_rates_li_lee[1, :, -1] - log_death_rates_li_lee[2, :, -1])
+        ]
+    }, index=['Ajustements séparés (RL)', 'Li-Lee'])
+
+    print("Écart moyen des log taux de décès entre hommes et femmes :")
+    print(sex_gap_df.to_string())
+
+"""# g) Tableau récapitulatif des erreurs de tous les modèles sur toutes les populations
+
+Les taux estimés par chaque méthode sont empilés dans un tableau modèle × population × âge × période et toutes les mesures d'erreur sont calculées en un seul appel
+"""
 
-total_death_df_maori.index.names = ['Age']
-total_population_df_maori.index.names = ['Age']
-mortality_rate_df_maori.index.names = ['Age']
-death_rate_df_maori.index.names = ['Age']
+if 'summary' in sections:
 
-total_death_df_maori.index = total_death_df_maori.index.str.strip()
-total_population_df_maori.index = total_population_df_maori.index.str.strip()
-mortality_rate_df_maori.index = mortality_rate_df_maori.index.str.strip()
-death_rate_df_maori.index = death_rate_df_maori.index.str.strip()
+    summary_populations = ['NZ Total', 'NZ Male', 'NZ Female', 'Maori Total']
+    summary_models = ['Classique', 'Newton Raphson', 'Poisson', 'Gompertz-Makeham']
 
-total_death_df_maori.index = total_death_df_maori.index.fillna('0')
-total_population_df_maori.index = total_population_df_maori.index.fillna('0')
-mortality_rate_df_maori.index = mortality_rate_df_maori.index.fillna('0')
-death_rate_df_maori.index = death_rate_df_maori.index.fillna('0')
+    estimation_frames = [
+        [estimated_mortality_rate_df, None, None, None],
+        [estimated_mortality_rate_MC_df, estimated_mortality_rate_men_MC_df, estimated_mortality_rate_women_MC_df, estimated_mortality_rate_maori_MC_df],
+        [estimated_mortality_rate_poisson_df, None, None, None],
+        [estimated_mortality_rates_GM_df, None, None, None]
+    ]
+    actual_estimation_frames = [mortality_rate_df_HD, mortality_rate_men_df_HD, mortality_rate_women_df_HD, mortality_rate_maori_df_HD]
 
-time_periods_maori = [
-    "1950-1954", "1955-1959", "1960-1964", "1965-1969", "1970-1974",
-    "1975-1979", "1980-1984", "1985-1989", "1990-1994", "1995-1999"
-]
+    estimation_metrics_df = compute_error_metrics(
+        stack_frames(actual_estimation_frames, age_groups, time_periods),
+        stack_frames(estimation_frames, age_groups, time_periods),
+        summary_models, summary_populations, age_groups
+    )
 
+    print("Erreurs d'estimation (tous âges confondus) :")
+    print(estimation_metrics_df[estimation_metrics_df['Age'] == 'Tous'].dropna(subset=['MAPE']).to_string(index=False))
 
-age_sorting = pd.DataFrame(np.zeros, index=age_groups, columns=time_periods)
+    # Les périodes de prédiction ne sont pas les mêmes pour les Maori : on utilise la position de la période prédite (1 ou 2)
+    prediction_frames = [
+        [Prediction_RL_mortality_rates_df, Prediction_RL_mortality_rates_men_df, Prediction_RL_mortality_rates_women_df, Prediction_RL_mortality_rates_maori_df],
+        [Prediction_ARIMA_mortality_rates_df, None, None, Prediction_ARIMA_mortality_rates_maori_df]
+    ]
+    actual_prediction_frames = [mortality_rate_comparison_df, mortality_rate_men_comparison_df, mortality_rate_women_comparison_df, mortality_rate_comparison_maori_df]
 
-# On réorganise les dataframes pour mettre les âges dans l'ordre
-total_death_df_maori = total_death_df_maori.reindex(age_sorting.index)
-total_population_df_maori = total_population_df_maori.reindex(age_sorting.index)
-mortality_rate_df_maori = mortality_rate_df_maori.reindex(age_sorting.index)
-death_rate_df_maori = death_rate_df_maori.reindex(age_sorting.index)
+    def by_horizon(frames):
+        if frames is None or isinstance(frames, pd.DataFrame):
+            return None if frames is None else frames.set_axis(range(1, frames.shape[1] + 1), axis=1)
+        return [by_horizon(frame) for frame in frames]
 
-#On crée les dataframes pour les calculs avec les données historiques
-total_death_df_maori_HD = total_death_df_maori.drop(columns=["2000-2004", "2005-2009"])
-total_population_df_HD = total_population_df_maori.drop(columns=[ "2000-2004", "2005-2009"])
-mortality_rate_maori_df_HD = mortality_rate_df_maori.drop(columns=[ "2000-2004", "2005-2009"])
-death_rate_df_maori_HD = death_rate_df_maori.drop(columns=[ "2000-2004", "2005-2009"])
+    prediction_metrics_df = compute_error_metrics(
+        stack_frames(by_horizon(actual_prediction_frames), age_groups, prediction_horizons),
+        stack_frames(by_horizon(prediction_frames), age_groups, prediction_horizons),
+        ['Régression linéaire', 'ARIMA'], summary_populations, age_groups
+    )
 
-#On crée le dataframe de prédiction
-death_rate_comparison_maori_df = death_rate_df_maori[[ "2000-2004", "2005-2009"]]
-mortality_rate_comparison_maori_df = mortality_rate_df_maori[[ "2000-2004", "2005-2009"]]
+    print("Erreurs de prédiction (tous âges confondus) :")
+    print(prediction_metrics_df[prediction_metrics_df['Age'] == 'Tous'].dropna(subset=['MAPE']).to_string(index=False))
 
-for period in time_periods:
+"""# h) Backtesting à origine glissante des méthodes de prévision de kt
 
-    plt.figure(figsize=(10, 6))
-    plt.plot(age_midpoints, mortality_rate_df_HD[period].values, '-', label=f'Taux de mortalité Nouvelle Zélande ({period})', color='blue')
-    plt.plot(age_midpoints, mortality_rate_df_maori[period].values, '-', label=f'Taux de mortalité Maori ({period})', color='orange')
-    plt.xlabel('Age moyen')
-    plt.ylabel('Taux de mortalité')
-    plt.title(f'Différences de taux de mortalité par intervalle d age entre Maori et non Maori ({period})')
-    plt.xticks(age_midpoints, age_groups, rotation=45)
-    plt.legend()
-    plt.show()
+Au lieu d'une seule séparation entre données historiques et périodes de prédiction, on réestime le modèle de Lee Carter pour chaque origine de prévision (nombre de périodes d'apprentissage) et on compare les prévisions de la régression linéaire et d'ARIMA à chaque horizon. Il ne s'agit pas d'un pseudo-backtest sur le kt de l'ajustement complet : à chaque origine, ax, bx, kt et la méthode de prévision de kt sont estimés sur les seules périodes antérieures à l'origine, aucune donnée postérieure n'entre dans la prévision. Chaque origine part à chaud de l'ajustement de l'origine précédente, elle-même plus courte, et les origines sont réparties sur plusieurs processus.
+"""
 
-"""#  d) Testons la précision des modèles d'estimation et de prédictions retenus sur la population Maori"""
+if 'backtest' in sections:
 
-a_x_maori_MCoptimized, b_x_maori_MCoptimized, k_t_maori_MCoptimized = lee_carter_newton_raphson(np.log(death_rate_df_maori_HD))
+    # On utilise toutes les périodes observées de chaque population, y compris celles mises de côté pour la prédiction plus haut
+    backtest_populations = [f'{population} {sex}' for population, sex in batch_populations]
+    backtest_log_death_rates = [
+        np.log(mortality_cube.matrix('death_rate', population, sex, periods=time_periods_initial if population == 'NZ' else maori_periods))
+        for population, sex in batch_populations
+    ]
+    backtest_step = max(1, 5 // period_width)
+    backtest_origins = np.arange(5 * backtest_step, len(time_periods_initial), backtest_step)
 
-print("a_x estimé:", a_x_maori_MCoptimized)
-print("b_x estimé:", b_x_maori_MCoptimized)
-print("k_t estimé:", k_t_maori_MCoptimized)
+    backtest_forecasts, backtest_actual, backtest_kts, backtest_fits_df = fit_cache.call(
+        rolling_origin_backtest, backtest_log_death_rates, backtest_origins, horizon=prediction_horizon
+    )
+    backtest_fits_df['Population'] = np.array(backtest_populations)[backtest_fits_df['Population']]
 
-# On calcule le taux de décès estimé
-estimated_death_rates_maori_MC = np.exp(a_x_maori_MCoptimized[:, np.newaxis] + b_x_maori_MCoptimized[:, np.newaxis] * k_t_maori_MCoptimized)
+    print("Ajustements par origine (nombre d'itérations avec départ à chaud) :")
+    print(backtest_fits_df.pivot(index='Origin', columns='Population', values='Iterations'))
 
-estimated_death_rate_maori_MC_df = pd.DataFrame(estimated_death_rates_maori_MC.T, index=time_periods_maori, columns=age_groups)
-estimated_death_rate_maori_MC_df = estimated_death_rate_maori_MC_df.T
+    backtest_metrics_df = score_backtest(backtest_forecasts, backtest_actual, list(BACKTEST_FORECASTERS), backtest_populations, age_groups)
 
-estimated_mortality_rate_maori_MC_df = 1 - np.exp(-estimated_death_rate_maori_MC_df)
+    print("Erreurs de prévision moyennes sur toutes les origines (tous âges confondus) :")
+    print(backtest_metrics_df[backtest_metrics_df['Age'] == 'Tous'].to_string(index=False))
 
-print("Taux de mortalité estimés:")
-print(estimated_mortality_rate_maori_MC_df)
+    # Diagnostics de la régression linéaire de kt pour toutes les populations et toutes les origines en un seul appel
+    backtest_diagnostics_df = regression_diagnostics(backtest_kts)
+    backtest_diagnostics_df.insert(0, 'Population', backtest_fits_df['Population'])
+    backtest_diagnostics_df.insert(1, 'Origin', backtest_fits_df['Origin'])
+    backtest_diagnostics_df = backtest_diagnostics_df[backtest_diagnostics_df['n'] > 0]
 
-mape_maori = calculate_mape(mortality_rate_maori_df_HD, estimated_mortality_rate_maori_MC_df)
+    print("Diagnostics de la régression linéaire de kt par population et par origine :")
+    print(backtest_diagnostics_df[['Population', 'Origin', 'R-squared', 'Durbin-Watson', 'F p-value', 'KS p-value', 'BP p-value']].to_string(index=False))
 
-print(f"MAPE: {mape_maori:.2f}%")
-interpret_mape(mape_maori)
+"""# i) Sélection de l'ordre ARIMA de kt pour chaque population
 
-RL_prevision_maori_kt, alpha_maori, beta_maori = linear_regression(k_t_maori_MCoptimized, time_periods_maori, periods_to_forecast=2)
+On évalue une grille d'ordres (p, d, q) sur le kt de chaque population avec l'AIC, le BIC et l'erreur de prévision de kt sur les dernières origines. Tous les ajustements sont faits en parallèle et gardés dans ARIMA_FIT_CACHE, ils sont donc réutilisés pour comparer ensuite les prévisions.
+"""
 
-print("kt prévisionnel pour les 2 prochaines périodes:", RL_prevision_maori_kt)
-print(f"Alpha estimé (intercept): {alpha_maori:.3f}")
-print(f"Beta estimé (slope): {beta_maori:.3f}")
+if 'arima-selection' in sections:
 
-prediction_periods_maori = [ "2000-2004", "2005-2009"]
+    arima_orders = [(p, d, q) for p in range(3) for d in (1, 2) for q in range(3)]
+    arima_kt_series = [k_t_MCoptimized, k_t_men_MCoptimized, k_t_women_MCoptimized, k_t_maori_MCoptimized]
 
-Prediction_RL_death_rates_maori_df = Prediction_death_rates(a_x_maori_MCoptimized, b_x_maori_MCoptimized, RL_prevision_maori_kt, age_groups, prediction_periods_maori)
+    arima_selection_df, best_arima_orders = select_arima_orders(arima_kt_series, summary_populations, arima_orders, criterion='BIC', horizon=prediction_horizon)
 
-Prediction_RL_mortality_rates_maori_df = 1 - np.exp(-Prediction_RL_death_rates_maori_df)
+    print("Meilleurs ordres par population (BIC) :")
+    print(arima_selection_df.sort_values('BIC').groupby('Population').head(3).sort_values(['Population', 'BIC']).to_string(index=False))
 
-print(Prediction_RL_mortality_rates_maori_df)
+    # On compare les prévisions avec l'ordre sélectionné à la régression linéaire et à la marche aléatoire : les ajustements viennent du cache
+    selected_arima_frames = [[], []]
+    for population, kt, (ax, bx), actual_df in zip(summary_populations, arima_kt_series, [
+        (a_x_MCoptimized, b_x_MCoptimized), (a_x_men_MCoptimized, b_x_men_MCoptimized),
+        (a_x_women_MCoptimized, b_x_women_MCoptimized), (a_x_maori_MCoptimized, b_x_maori_MCoptimized)
+    ], actual_prediction_frames):
+        for frames, arima_order in zip(selected_arima_frames, [(0, 1, 0), best_arima_orders[population]]):
+            forecast_kt = prediction_kt_Arima(kt, periods=prediction_horizon, arima_order=arima_order)
+            frames.append(1 - np.exp(-Prediction_death_rates(ax, bx, forecast_kt, age_groups, actual_df.columns)))
 
-mape_maori_prediction = calculate_mape(mortality_rate_comparison_maori_df, Prediction_RL_mortality_rates_maori_df)
+    arima_comparison_df = compute_error_metrics(
+        stack_frames(by_horizon(actual_prediction_frames), age_groups, prediction_horizons),
+        stack_frames(by_horizon([prediction_frames[0]] + selected_arima_frames), age_groups, prediction_horizons),
+        ['Régression linéaire', 'ARIMA(0, 1, 0)', 'ARIMA sélectionné'], summary_populations, age_groups
+    )
 
-print(f"MAPE: {mape_maori_prediction:.2f}%")
-interpret_mape(mape_maori_prediction)
+    print("Erreurs de prédiction avec l'ordre ARIMA sélectionné (tous âges confondus) :")
+    print(arima_comparison_df[arima_comparison_df['Age'] == 'Tous'].to_string(index=False))
+    print(f"{len(ARIMA_FIT_CACHE)} ajustements ARIMA en cache")
 
-mape_series_maori_RL = calculate_mape_per_age_group(mortality_rate_comparison_maori_df, Prediction_RL_mortality_rates_maori_df)
+"""# j) Incertitude des paramètres de Lee Carter par bootstrap paramétrique
 
-for age_group, mape in mape_series_maori_RL.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
+On tire 1000 fois les décès de chaque case selon une loi de Poisson de moyenne les décès observés, on réajuste le modèle de Lee Carter des quatre populations sur chaque réplique et on en déduit des intervalles de confiance à 95% de bx, de kt et des taux de mortalité prévus par marche aléatoire avec dérive. Les périodes de prédiction des Maori sont masquées comme pour l'ajustement simultané. En tirant aussi une trajectoire de kt par réplique, on obtient des intervalles de prédiction qui tiennent compte de l'incertitude des paramètres.
+"""
 
-plot_mape_per_age_group(mape_series_maori_RL)
+if 'bootstrap' in sections:
 
-"""On va tester avec ARIMA"""
+    bootstrap_quantiles = (0.025, 0.5, 0.975)
+    bootstrap_deaths = np.stack([mortality_cube.matrix('deaths', population, sex, periods=time_periods) for population, sex in batch_populations])
+    bootstrap_exposures = np.stack([mortality_cube.matrix('exposures', population, sex, periods=time_periods) for population, sex in batch_populations])
 
-ARIMA_kt_maori = prediction_kt_Arima(k_t_maori_MCoptimized, periods=2, arima_order=(0, 1, 0))
+    bx_bands, kt_bands, parameter_forecast_bands, trace_bootstrap = fit_cache.call(
+        bootstrap_lee_carter, bootstrap_deaths, bootstrap_exposures, mask=batch_mask, n_replicates=1000,
+        horizon=prediction_horizon, quantiles=bootstrap_quantiles, random_state=0
+    )
+    _, _, prediction_forecast_bands, _ = fit_cache.call(
+        bootstrap_lee_carter, bootstrap_deaths, bootstrap_exposures, mask=batch_mask, n_replicates=1000,
+        horizon=prediction_horizon, quantiles=bootstrap_quantiles, process_noise=True, random_state=0
+    )
 
-print("kt prévisionnel pour les 2 prochaines périodes:", ARIMA_kt_maori)
+    trace_bootstrap.index = trace_batch.index
+    print(trace_bootstrap.to_string())
 
-Prediction_ARIMA_death_rates_maori_df = Prediction_death_rates(a_x_maori_MCoptimized, b_x_maori_MCoptimized, ARIMA_kt_maori, age_groups, prediction_periods_maori)
+    bx_bands_df = pd.DataFrame(bx_bands[:, 0].T, index=age_groups, columns=bootstrap_quantiles)
+    bx_bands_df.insert(1, 'Estimation', b_x_batch[0])
+    print("Intervalle de confiance de bx (NZ Total) :")
+    print(bx_bands_df.to_string())
 
-Prediction_ARIMA_mortality_rates_maori_df = 1 - np.exp(-Prediction_ARIMA_death_rates_maori_df)
+    print("Intervalle de confiance de kt (NZ Total) :")
+    print(pd.DataFrame(kt_bands[:, 0], index=bootstrap_quantiles, columns=time_periods).iloc[:, ::period_plot_stride].to_string())
 
-print(Prediction_ARIMA_mortality_rates_maori_df)
+    # Part des taux observés des périodes de prédiction qui tombent dans les intervalles à 95%
+    bootstrap_actual = [mortality_rate_comparison_df, mortality_rate_men_comparison_df, mortality_rate_women_comparison_df, mortality_rate_comparison_maori_df]
+    bootstrap_coverage_df = pd.DataFrame({
+        name: [
+            np.mean((bands[0, p] <= actual.values) & (actual.values <= bands[-1, p])) * 100
+            for p, actual in enumerate(bootstrap_actual)
+        ]
+        for name, bands in [('Paramètres seuls (%)', parameter_forecast_bands), ('Paramètres et kt (%)', prediction_forecast_bands)]
+    }, index=trace_batch.index)
 
-mape_maori_ARIMA_prediction = calculate_mape(mortality_rate_comparison_maori_df, Prediction_ARIMA_mortality_rates_maori_df)
+    print("Taux observés des périodes de prédiction compris dans les intervalles à 95% :")
+    print(bootstrap_coverage_df.to_string())
 
-print(f"MAPE: {mape_maori_ARIMA_prediction:.2f}%")
-interpret_mape(mape_maori_ARIMA_prediction)
+print(f"Cache des ajustements : {fit_cache.hits} ajustements relus, {fit_cache.misses} ajustements calculés")
 
-mape_series_maori_ARIMA = calculate_mape_per_age_group(mortality_rate_comparison_maori_df, Prediction_ARIMA_mortality_rates_maori_df)
+"""Rendu de tous les graphiques, une fois tous les calculs terminés"""
 
-for age_group, mape in mape_series_maori_ARIMA.items():
-    interpretation = interpret_mape(mape)
-    print(f"Age du groupe: {age_group}, MAPE: {mape:.2f}%, Interprétation: {interpretation}")
+figure_paths = figures.render(output_dir=PLOT_OUTPUT_DIR, skip=SKIP_PLOTS)
 
-plot_mape_per_age_group(mape_series_maori_ARIMA)
+print(f"{len(figure_paths)} graphiques enregistrés dans {PLOT_OUTPUT_DIR}")
@@ -0,0 +1,64 @@
+"""Modèles de mortalité pour la Nouvelle Zélande (Lee Carter, Gompertz-Makeham, ARIMA)
+
+Les fonctions du script estimations-predictions-analysis.py, rangées par module. Le paquet n'importe rien à son chargement : chaque nom est importé depuis son module au premier accès (from nz_mortality import linear_regression), et les dépendances lourdes (pandas, scipy, statsmodels, matplotlib) ne sont importées que par les fonctions qui en ont besoin. Importer nz_mortality.projection ne charge que numpy.
+"""
+
+import importlib
+
+SUBMODULES = {
+    'data': [
+        'CACHE_FORMAT_VERSION', 'file_sha256', 'normalize_age_label', 'write_columnar_cache', 'read_columnar_cache',
+        'load_cached_meta', 'load_life_death_table', 'LIFE_DEATH_VALUE_COLUMNS', 'period_labels', 'aggregate_life_death_table',
+        'iter_table_chunks', 'aggregate_life_death_chunks', 'MortalityCube'
+    ],
+    'cache': ['FIT_CACHE_DIR', 'FIT_CACHE_MAX_BYTES', 'FIT_CACHE_VERSION', 'FIT_CACHE_ENABLED', 'update_fingerprint', 'fit_cache_dir', 'CODE_FINGERPRINTS', 'code_fingerprint', 'FitCache', 'fit_cache'],
+    'lee_carter': [
+        'truncated_svd', 'lee_carter_svd', 'objective_function', 'reestimate_kt', 'lee_carter_newton_raphson',
+        'print_convergence', 'lee_carter_batch', 'normalize_lee_carter', 'IncrementalLeeCarter', 'li_lee', 'lee_carter_poisson'
+    ],
+    'projection': [
+        'create_sequential_time_variable', 'fit_linear_trends', 'linear_regression', 'project_death_rates',
+        'project_mortality_rates', 'project_li_lee', 'Prediction_death_rates'
+    ],
+    'metrics': [
+        'calculate_mape', 'MAPE_BANDS', 'MAPE_INTERPRETATIONS', 'interpret_mape', 'masked_mean', 'compute_error_metrics',
+        'stack_frames', 'calculate_mape_per_age_group', 'regression_diagnostics'
+    ],
+    'arima': [
+        'ARIMA_FIT_CACHE', 'kt_series_key', 'ArimaFit', 'fit_arima', 'fit_kt_arima', 'prediction_kt_Arima', 'fit_arima_task',
+        'fit_arima_batch', 'select_arima_orders'
+    ],
+    'life_tables': ['age_group_bounds', 'age_group_widths', 'age_group_midpoints', 'life_table', 'period_life_expectancy'],
+    'cohort': [
+        'cohort_indices', 'cohort_log_rates', 'extend_cohort_effect', 'normalize_apc', 'normalize_renshaw_haberman', 'cohort_model_data',
+        'poisson_deviance', 'fisher_scoring_step', 'cohort_trace', 'age_period_cohort', 'renshaw_haberman'
+    ],
+    'simulation': ['fit_kt_process', 'simulate_kt_paths', 'simulate_mortality_fan'],
+    'makeham': [
+        'gompertz_makeham', 'gompertz_makeham_jacobian', 'fit_gompertz_makeham', 'fit_gompertz_makeham_chunk',
+        'fit_gompertz_makeham_populations'
+    ],
+    'bootstrap': ['BOOTSTRAP_ARRAYS', 'BOOTSTRAP_SEGMENTS', 'attach_bootstrap_arrays', 'random_walk_forecast', 'bootstrap_chunk', 'bootstrap_lee_carter'],
+    'backtest': ['BACKTEST_FORECASTERS', 'backtest_origin_chunk', 'rolling_origin_backtest', 'score_backtest'],
+    'plotting': [
+        'PLOT_OUTPUT_DIR', 'FigureQueue', 'figures', 'FIGURE_RENDERERS', 'render_figure_batch', 'plot_mape_per_age_group',
+        'plot_actual_vs_estimate_per_age_group', 'plot_death_rates_comparison'
+    ]
+}
+
+NAME_TO_SUBMODULE = {name: module for module, names in SUBMODULES.items() for name in names}
+
+__all__ = list(NAME_TO_SUBMODULE)
+
+# Import à la demande (PEP 562) : le module n'est importé qu'au premier accès à l'un de ses noms
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    if name not in NAME_TO_SUBMODULE:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'{__name__}.{NAME_TO_SUBMODULE[name]}'), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
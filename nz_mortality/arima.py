@@ -0,0 +1,149 @@
+"""Prévision de kt avec ARIMA et sélection de l'ordre (p, d, q)
+
+statsmodels n'est importé qu'au premier ajustement.
+"""
+
+import os
+import hashlib
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from .cache import fit_cache
+
+# Les ARIMA ajustés sont gardés en mémoire, indexés par l'empreinte de la série kt et l'ordre (p, d, q) :
+# une même série n'est ajustée qu'une fois par ordre, quelle que soit la section du script qui en a besoin
+ARIMA_FIT_CACHE = {}
+
+def kt_series_key(kt, arima_order):
+    return hashlib.sha1(np.ascontiguousarray(kt, dtype=np.float64).tobytes()).hexdigest(), tuple(arima_order)
+
+# Ajustement ARIMA réduit à ce qu'on en utilise : la série, l'ordre, les paramètres estimés, sigma2, l'AIC et le BIC. C'est lui qui est
+# gardé dans le cache sur disque et renvoyé par les processus, au lieu des résultats complets de statsmodels (plus de 100 ko chacun,
+# avec les matrices du filtre de Kalman). Les prévisions repassent le filtre de Kalman sur la série avec les paramètres fixés, sans
+# réestimer le modèle ; ces résultats ne sont gardés qu'en mémoire.
+class ArimaFit:
+
+    def __init__(self, kt, arima_order, model_fit):
+        self.kt = np.asarray(kt, dtype=np.float64)
+        self.order = tuple(arima_order)
+        self.param_names = list(model_fit.model.param_names)
+        self.params = np.asarray(model_fit.params, dtype=np.float64)
+        self.sigma2 = float(dict(zip(self.param_names, self.params))['sigma2'])
+        self.aic = float(model_fit.aic)
+        self.bic = float(model_fit.bic)
+        self.results = model_fit
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['results'] = None
+        return state
+
+    def forecast(self, steps=1):
+        if self.results is None:
+            from statsmodels.tsa.arima.model import ARIMA
+
+            self.results = ARIMA(self.kt, order=self.order).filter(self.params)
+        return self.results.forecast(steps=steps)
+
+def fit_arima(kt, arima_order):
+    from statsmodels.tsa.arima.model import ARIMA
+
+    return ArimaFit(kt, arima_order, ARIMA(kt, order=arima_order).fit())
+
+# Si l'ajustement n'est pas en mémoire on le cherche dans le cache sur disque avant de le calculer
+def fit_kt_arima(kt, arima_order=(0, 1, 0)):
+    key = kt_series_key(kt, arima_order)
+    if key not in ARIMA_FIT_CACHE:
+        ARIMA_FIT_CACHE[key] = fit_cache.call(fit_arima, np.asarray(kt, dtype=np.float64), tuple(arima_order))
+    return ARIMA_FIT_CACHE[key]
+
+def prediction_kt_Arima(kt, periods=2, arima_order=(0, 1, 0)):
+
+    model_fit = fit_kt_arima(kt, arima_order)
+
+    forecast = model_fit.forecast(steps=periods)
+
+    return forecast
+
+# Ajustement d'un ARIMA dans un processus. Sur des séries aussi courtes certains ordres ne peuvent pas être estimés : on renvoie alors None.
+def fit_arima_task(task):
+    kt, arima_order = task
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            return fit_arima(kt, arima_order)
+        except (np.linalg.LinAlgError, ValueError):
+            return None
+
+# Ajuste en parallèle tous les couples (série, ordre) absents du cache et renvoie les ajustements dans l'ordre demandé.
+# Un ajustement impossible (None) n'est gardé qu'en mémoire : il n'est pas écrit sur disque et sera retenté à la prochaine exécution.
+def fit_arima_batch(series_orders, n_jobs=None):
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    keys = [kt_series_key(kt, arima_order) for kt, arima_order in series_orders]
+    pending = {}
+    for key, (kt, arima_order) in zip(keys, series_orders):
+        if key not in ARIMA_FIT_CACHE and key not in pending:
+            task = (np.asarray(kt, dtype=np.float64), tuple(arima_order))
+            found, model_fit = fit_cache.get(fit_cache.key(fit_arima, *task))
+            if found:
+                ARIMA_FIT_CACHE[key] = model_fit
+            else:
+                pending[key] = task
+
+    if n_jobs == 1 or len(pending) <= 1:
+        results = [fit_arima_task(task) for task in pending.values()]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(fit_arima_task, pending.values(), chunksize=max(1, len(pending) // (4 * n_jobs))))
+    for (key, task), model_fit in zip(pending.items(), results):
+        ARIMA_FIT_CACHE[key] = model_fit
+        if model_fit is not None:
+            fit_cache.put(fit_cache.key(fit_arima, *task), model_fit)
+
+    return [ARIMA_FIT_CACHE[key] for key in keys]
+
+# Pour chaque population et chaque ordre : AIC et BIC de l'ajustement sur toute la série, et RMSE des prévisions de kt à horizon
+# 1..horizon depuis chacune des n_backtest dernières origines. On renvoie le tableau complet et le meilleur ordre de chaque population.
+# Si aucun ordre n'a pu être estimé pour une population (critère toujours NaN), on garde default_order et on émet un avertissement.
+def select_arima_orders(kt_series, populations, orders, criterion='BIC', horizon=2, n_backtest=3, n_jobs=None, default_order=(0, 1, 0)):
+    kt_series = [np.asarray(kt, dtype=np.float64) for kt in kt_series]
+
+    series_orders = []
+    for kt in kt_series:
+        for origin in [len(kt)] + list(range(len(kt) - n_backtest, len(kt))):
+            series_orders.extend((kt[:origin], arima_order) for arima_order in orders)
+    fits = iter(fit_arima_batch(series_orders, n_jobs=n_jobs))
+
+    rows = []
+    for population, kt in zip(populations, kt_series):
+        full_fits = [next(fits) for _ in orders]
+        squared_errors = [[] for _ in orders]
+        for origin in range(len(kt) - n_backtest, len(kt)):
+            actual_kt = kt[origin:origin + horizon]
+            for errors, model_fit in zip(squared_errors, [next(fits) for _ in orders]):
+                forecast = np.full(len(actual_kt), np.nan) if model_fit is None else model_fit.forecast(steps=len(actual_kt))
+                errors.extend((forecast - actual_kt) ** 2)
+
+        for arima_order, model_fit, errors in zip(orders, full_fits, squared_errors):
+            rows.append({
+                'Population': population,
+                'Order': arima_order,
+                'AIC': np.nan if model_fit is None else model_fit.aic,
+                'BIC': np.nan if model_fit is None else model_fit.bic,
+                'Backtest RMSE': np.sqrt(np.mean(errors))
+            })
+
+    results_df = pd.DataFrame(rows)
+    estimated_df = results_df[results_df[criterion].notna()]
+    best_orders = estimated_df.loc[estimated_df.groupby('Population', sort=False)[criterion].idxmin()].set_index('Population')['Order'].to_dict()
+
+    for population in populations:
+        if population not in best_orders:
+            warnings.warn(f"Aucun ordre ARIMA n'a pu être estimé pour {population} : on garde l'ordre {tuple(default_order)}", RuntimeWarning)
+            best_orders[population] = tuple(default_order)
+
+    return results_df, {population: best_orders[population] for population in populations}
@@ -0,0 +1,114 @@
+"""Backtesting à origine glissante des méthodes de prévision de kt
+
+Au lieu d'une seule séparation entre données historiques et périodes de prédiction, on réestime le modèle de Lee Carter pour chaque origine de prévision (nombre de périodes d'apprentissage) et on compare les prévisions de la régression linéaire et d'ARIMA à chaque horizon. Il ne s'agit pas d'un pseudo-backtest sur le kt de l'ajustement complet : à chaque origine, ax, bx, kt et la méthode de prévision de kt sont estimés sur les seules périodes antérieures à l'origine, aucune donnée postérieure n'entre dans la prévision. Chaque origine part à chaud de l'ajustement de l'origine précédente, elle-même plus courte, et les origines sont réparties sur plusieurs processus.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from .arima import prediction_kt_Arima
+from .lee_carter import lee_carter_newton_raphson, lee_carter_svd
+from .metrics import compute_error_metrics
+from .projection import linear_regression, project_mortality_rates
+
+# Méthodes de prévision de kt comparées : chacune reçoit kt et l'horizon et renvoie les kt prévus
+BACKTEST_FORECASTERS = {
+    'Régression linéaire': lambda kt, horizon: linear_regression(kt, kt, periods_to_forecast=horizon)[0],
+    'ARIMA': lambda kt, horizon: np.asarray(prediction_kt_Arima(kt, periods=horizon, arima_order=(0, 1, 0)))
+}
+
+# Ajustements successifs sur un bloc d'origines consécutives d'une population : chaque origine est réajustée sur log_m_xt[:, :origin]
+# seulement et part de l'ajustement de la précédente, seule la nouvelle période de kt est à initialiser (quelques itérations au lieu
+# de plusieurs dizaines en partant de zéro).
+# On renvoie les taux de mortalité prévus (méthode × origine × âge × horizon), les kt ajustés (origine × période, NaN après l'origine)
+# et, pour chaque origine, le nombre d'itérations et le temps d'ajustement.
+def backtest_origin_chunk(task):
+    log_m_xt, origins, horizon, methods, max_iter, tol = task
+
+    forecasts = np.full((len(methods), len(origins), log_m_xt.shape[0], horizon), np.nan)
+    kts = np.full((len(origins), log_m_xt.shape[1]), np.nan)
+    iterations = np.zeros(len(origins), dtype=int)
+    wall_times = np.zeros(len(origins))
+
+    # La première origine du bloc part de la solution SVD, qui est déjà l'optimum des moindres carrés au premier ordre
+    ax, bx, kt, _ = lee_carter_svd(log_m_xt[:, :origins[0]], rank=1)
+    fit = (ax, bx[:, 0], kt[0])
+    for i, origin in enumerate(origins):
+        ax, bx, kt, trace = lee_carter_newton_raphson(log_m_xt[:, :origin], max_iter=max_iter, tol=tol, initial=fit)
+        fit = (ax, bx, kt)
+        kts[i, :origin] = kt
+        iterations[i] = len(trace)
+        wall_times[i] = trace['wall_time'].iloc[-1]
+
+        for j, method in enumerate(methods):
+            project_mortality_rates(ax, bx, BACKTEST_FORECASTERS[method](kt, horizon), out=forecasts[j, i])
+
+    return forecasts, kts, iterations, wall_times
+
+# Backtesting de plusieurs populations. log_death_rates est une liste de matrices âge × période (une par population, de longueurs
+# éventuellement différentes), origins la liste des nombres de périodes d'apprentissage. Les origines de chaque population sont découpées
+# en blocs consécutifs répartis sur les processus, comme pour l'ajustement de Gompertz-Makeham.
+# On renvoie les taux prévus (méthode × population × origine × âge × horizon), les taux observés (population × origine × âge × horizon,
+# NaN au-delà des données), les kt ajustés (population × origine × période) et un tableau des ajustements par population et par origine.
+def rolling_origin_backtest(log_death_rates, origins, horizon=2, methods=tuple(BACKTEST_FORECASTERS), n_jobs=None, max_iter=100, tol=1e-6):
+    log_death_rates = [np.asarray(matrix, dtype=np.float64) for matrix in log_death_rates]
+    origins = np.asarray(origins)
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    P, O, n = len(log_death_rates), len(origins), log_death_rates[0].shape[0]
+
+    # On ne garde pour chaque population que les origines laissant au moins une période observée à prévoir ; une population trop courte
+    # pour toutes les origines n'a aucune tâche et ses prévisions restent NaN
+    chunks_per_population = max(1, n_jobs // P)
+    tasks = []
+    for p, matrix in enumerate(log_death_rates):
+        valid_origins = np.flatnonzero(origins < matrix.shape[1])
+        if len(valid_origins) == 0:
+            continue
+        for chunk in np.array_split(valid_origins, min(chunks_per_population, len(valid_origins))):
+            tasks.append((p, chunk, (matrix, origins[chunk], horizon, list(methods), max_iter, tol)))
+
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = [backtest_origin_chunk(task) for _, _, task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as executor:
+            results = list(executor.map(backtest_origin_chunk, [task for _, _, task in tasks]))
+
+    forecasts = np.full((len(methods), P, O, n, horizon), np.nan)
+    kts = np.full((P, O, max(matrix.shape[1] for matrix in log_death_rates)), np.nan)
+    iterations = np.zeros((P, O), dtype=int)
+    wall_times = np.full((P, O), np.nan)
+    for (p, chunk, _), (chunk_forecasts, chunk_kts, chunk_iterations, chunk_wall_times) in zip(tasks, results):
+        forecasts[:, p, chunk] = chunk_forecasts
+        kts[p, chunk, :chunk_kts.shape[1]] = chunk_kts
+        iterations[p, chunk] = chunk_iterations
+        wall_times[p, chunk] = chunk_wall_times
+
+    # Taux observés aux périodes origine + h, pris dans chaque matrice par indexation
+    actual = np.full((P, O, n, horizon), np.nan)
+    target_periods = origins[:, np.newaxis] + np.arange(horizon)
+    for p, matrix in enumerate(log_death_rates):
+        observed = target_periods < matrix.shape[1]
+        actual[p, observed.nonzero()[0], :, observed.nonzero()[1]] = -np.expm1(-np.exp(matrix[:, target_periods[observed]].T))
+
+    fits_df = pd.DataFrame({
+        'Population': np.repeat(np.arange(P), O),
+        'Origin': np.tile(origins, P),
+        'Iterations': iterations.ravel(),
+        'Wall Time': wall_times.ravel()
+    })
+
+    return forecasts, actual, kts, fits_df
+
+# Mesures d'erreur par méthode, population et horizon, moyennées sur toutes les origines
+def score_backtest(forecasts, actual, methods, populations, ages):
+    tables = []
+    for h in range(forecasts.shape[-1]):
+        table = compute_error_metrics(actual[..., h].swapaxes(-1, -2), forecasts[..., h].swapaxes(-1, -2), methods, populations, ages)
+        table.insert(2, 'Horizon', h + 1)
+        tables.append(table)
+
+    return pd.concat(tables, ignore_index=True).sort_values(['Model', 'Population', 'Horizon'], kind='stable', ignore_index=True)
@@ -0,0 +1,175 @@
+"""Bootstrap paramétrique de l'incertitude des paramètres de Lee Carter
+
+On tire des décès D*_xt ~ Poisson(D_xt), ou on rééchantillonne les résidus du modèle ajusté, on réajuste le modèle de Lee Carter sur chaque réplique et on en déduit des intervalles de confiance de bx, de kt et des taux de mortalité prévus. Les répliques sont ajustées par blocs avec lee_carter_batch (toutes les répliques et toutes les populations d'un bloc en un seul appel) et les blocs sont répartis sur plusieurs processus. Les tableaux d'entrée sont placés une seule fois en mémoire partagée : chaque tâche ne transmet que sa taille et sa graine, pas les données.
+"""
+
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+from .lee_carter import lee_carter_batch
+
+# Tableaux d'entrée dans chaque processus : des vues sur la mémoire partagée, ou les tableaux eux-mêmes quand on n'utilise qu'un processus.
+# On garde aussi les segments ouverts pour qu'ils ne soient pas fermés tant que les vues sont utilisées.
+BOOTSTRAP_ARRAYS = {}
+BOOTSTRAP_SEGMENTS = []
+
+def attach_bootstrap_arrays(specs):
+    for name, (segment_name, shape, dtype) in specs.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        BOOTSTRAP_SEGMENTS.append(segment)
+        BOOTSTRAP_ARRAYS[name] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+# Prévision de kt par marche aléatoire avec dérive pour toutes les séries à la fois. kt est de taille (..., période) et peut se terminer
+# par des NaN (périodes masquées) : chaque série est prolongée à partir de sa dernière période observée. Avec rng, on ajoute les
+# innovations de la marche aléatoire (écart type des différences de la série) pour obtenir des intervalles de prédiction.
+def random_walk_forecast(kt, horizon, rng=None):
+    kt = np.asarray(kt, dtype=np.float64)
+    differences = np.diff(kt, axis=-1)
+
+    n_observed = np.isfinite(kt).sum(axis=-1)
+    last = np.take_along_axis(kt, np.maximum(n_observed - 1, 0)[..., np.newaxis], axis=-1)
+    drift = np.nanmean(differences, axis=-1, keepdims=True)
+    forecast = last + drift * np.arange(1, horizon + 1)
+
+    if rng is not None:
+        sigma = np.nanstd(differences, axis=-1, ddof=1, keepdims=True)
+        forecast += np.cumsum(sigma * rng.standard_normal(forecast.shape), axis=-1)
+
+    return forecast
+
+# Ajustement d'un bloc de répliques : on tire les log taux de décès des size répliques, on les ajuste en un seul appel à lee_carter_batch
+# (réplique × population empilées) et on prévoit les taux de mortalité des horizon périodes qui suivent la dernière période observée
+# de chaque population. On renvoie bx (réplique × population × âge), kt (réplique × population × période), les taux prévus
+# (réplique × population × âge × horizon), le nombre d'itérations de chaque ajustement et s'il a convergé.
+def bootstrap_chunk(task):
+    size, seed, method, horizon, process_noise, max_iter, tol = task
+    rng = np.random.default_rng(seed)
+    mask = BOOTSTRAP_ARRAYS['mask']
+    P, n, m = mask.shape
+
+    if method == 'poisson':
+        deaths = rng.poisson(BOOTSTRAP_ARRAYS['deaths'], size=(size, P, n, m))
+        # Taux de décès ln(1 / (1 - q)) des décès tirés ; les cases sans décès tiré (log infini) sont masquées
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_m_xt = np.log(-np.log1p(-deaths / BOOTSTRAP_ARRAYS['exposures']))
+        replicate_mask = mask & np.isfinite(log_m_xt)
+    else:
+        # Chaque population tire ses résidus parmi ses propres résidus observés
+        log_m_xt = np.repeat(BOOTSTRAP_ARRAYS['fitted'][np.newaxis], size, axis=0).reshape(size, P, n * m)
+        for p in range(P):
+            observed = np.flatnonzero(mask[p])
+            residuals = BOOTSTRAP_ARRAYS['residuals'][p].ravel()[observed]
+            log_m_xt[:, p, observed] += residuals[rng.integers(0, len(observed), size=(size, len(observed)))]
+        log_m_xt = log_m_xt.reshape(size, P, n, m)
+        replicate_mask = np.broadcast_to(mask, log_m_xt.shape)
+
+    ax, bx, kt, trace = lee_carter_batch(log_m_xt.reshape(size * P, n, m), mask=replicate_mask.reshape(size * P, n, m), max_iter=max_iter, tol=tol)
+
+    kt_forecast = random_walk_forecast(kt, horizon, rng if process_noise else None)
+    forecasts = -np.expm1(-np.exp(ax[:, :, np.newaxis] + bx[:, :, np.newaxis] * kt_forecast[:, np.newaxis, :]))
+
+    return (bx.reshape(size, P, n), kt.reshape(size, P, m), forecasts.reshape(size, P, n, horizon),
+            trace['iterations'].to_numpy().reshape(size, P), trace['converged'].to_numpy().reshape(size, P))
+
+# Bootstrap de plusieurs populations : deaths et exposures sont des tableaux population × âge × période, mask les cases à utiliser
+# (par défaut celles où décès et expositions sont observés ; par exemple les périodes de prédiction des Maori peuvent être masquées).
+# method='poisson' tire les décès, method='residuals' rééchantillonne les résidus de l'ajustement de Lee Carter des log taux de décès.
+# Avec process_noise, chaque réplique tire aussi une trajectoire de kt : les bandes des taux prévus deviennent des intervalles de
+# prédiction qui tiennent compte de l'incertitude des paramètres. Les répliques sont découpées en blocs de chunk_size, chacun avec sa
+# propre graine tirée de random_state : le résultat ne dépend pas du nombre de processus.
+# On renvoie les quantiles de bx (quantile × population × âge), de kt (quantile × population × période) et des taux de mortalité
+# prévus (quantile × population × âge × horizon), et un tableau des ajustements par population.
+# Les répliques dont l'ajustement n'a pas convergé en max_iter itérations sont écartées des bandes de leur population, et celles où un
+# âge n'a aucun décès tiré (petits groupes d'âge des Maori par exemple) n'ont ni bx ni prévision pour cet âge : le tableau les compte
+# pour chaque population (failed_replicates, incomplete_replicates) et un avertissement est émis, plutôt que de les laisser disparaître
+# sans bruit des quantiles.
+def bootstrap_lee_carter(deaths, exposures, mask=None, n_replicates=1000, method='poisson', horizon=2, quantiles=(0.025, 0.5, 0.975),
+                         process_noise=False, chunk_size=50, n_jobs=None, random_state=None, max_iter=100, tol=1e-6):
+    deaths = np.asarray(deaths, dtype=np.float64)
+    exposures = np.asarray(exposures, dtype=np.float64)
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    observed = np.isfinite(deaths) & np.isfinite(exposures) & (exposures > 0)
+    mask = observed if mask is None else observed & np.broadcast_to(mask, deaths.shape)
+    P, n, m = deaths.shape
+
+    if method == 'poisson':
+        arrays = {'deaths': np.where(mask, deaths, 0.0), 'exposures': np.where(mask, exposures, 1.0)}
+    elif method == 'residuals':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_m_xt = np.log(-np.log1p(-deaths / exposures))
+        mask = mask & np.isfinite(log_m_xt)
+        ax, bx, kt, _ = lee_carter_batch(log_m_xt, mask=mask, max_iter=max_iter, tol=tol)
+        fitted = ax[:, :, np.newaxis] + bx[:, :, np.newaxis] * np.nan_to_num(kt)[:, np.newaxis, :]
+        arrays = {'fitted': fitted, 'residuals': np.where(mask, log_m_xt - fitted, 0.0)}
+    else:
+        raise ValueError(f"method doit valoir 'poisson' ou 'residuals', pas {method!r}")
+    arrays['mask'] = np.ascontiguousarray(mask)
+
+    sizes = [min(chunk_size, n_replicates - start) for start in range(0, n_replicates, chunk_size)]
+    seeds = np.random.SeedSequence(random_state).spawn(len(sizes))
+    tasks = [(size, seed, method, horizon, process_noise, max_iter, tol) for size, seed in zip(sizes, seeds)]
+
+    start_time = time.perf_counter()
+    if n_jobs == 1 or len(tasks) == 1:
+        BOOTSTRAP_ARRAYS.update(arrays)
+        try:
+            results = [bootstrap_chunk(task) for task in tasks]
+        finally:
+            BOOTSTRAP_ARRAYS.clear()
+    else:
+        # Un segment de mémoire partagée par tableau, que les processus ouvrent une seule fois à leur démarrage
+        segments = []
+        try:
+            specs = {}
+            for name, values in arrays.items():
+                segment = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                segments.append(segment)
+                np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf)[...] = values
+                specs[name] = (segment.name, values.shape, values.dtype.str)
+
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks)), initializer=attach_bootstrap_arrays, initargs=(specs,)) as executor:
+                results = list(executor.map(bootstrap_chunk, tasks))
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+    wall_time = time.perf_counter() - start_time
+
+    bx_replicates, kt_replicates, forecast_replicates, iterations, converged = (np.concatenate(values) for values in zip(*results))
+
+    # Une case observée sans bx dans une réplique convergée est un âge sans aucun décès tiré
+    incomplete = converged & (np.isnan(bx_replicates) & mask.any(axis=2)).any(axis=2)
+    bx_replicates[~converged] = np.nan
+    kt_replicates[~converged] = np.nan
+    forecast_replicates[~converged] = np.nan
+
+    trace = pd.DataFrame({
+        'replicates': np.full(P, n_replicates),
+        'failed_replicates': np.sum(~converged, axis=0),
+        'incomplete_replicates': incomplete.sum(axis=0),
+        'mean_iterations': iterations.mean(axis=0),
+        'max_iterations': iterations.max(axis=0)
+    })
+    trace.index.name = 'population'
+    trace.attrs['wall_time'] = wall_time
+    if trace['failed_replicates'].any() or trace['incomplete_replicates'].any():
+        warnings.warn(
+            f"Bootstrap : {trace['failed_replicates'].sum()} ajustements sans convergence écartés et {trace['incomplete_replicates'].sum()} "
+            "ajustements avec un âge sans décès tiré, voir failed_replicates et incomplete_replicates", RuntimeWarning)
+
+    # Les périodes masquées d'une population n'ont de kt dans aucune réplique
+    kt_bands = np.full((len(quantiles), P, m), np.nan)
+    valid_periods = np.isfinite(kt_replicates).any(axis=0)
+    kt_bands[:, valid_periods] = np.nanquantile(kt_replicates[:, valid_periods], quantiles, axis=0)
+
+    with warnings.catch_warnings():
+        # Une population dont toutes les répliques ont échoué a des bandes NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanquantile(bx_replicates, quantiles, axis=0), kt_bands, np.nanquantile(forecast_replicates, quantiles, axis=0), trace
@@ -0,0 +1,171 @@
+"""Cache persistant des ajustements
+
+Les ajustements coûteux (Newton Raphson, Poisson, Gompertz-Makeham, ARIMA, backtesting, bootstrap) sont gardés sur disque, un fichier pickle par ajustement, dans le dossier .mortality_cache/fits placé à côté du fichier de données comme le cache des tableaux (fit_cache_dir), ou par défaut dans FIT_CACHE_DIR. La clé est le hash des données d'entrée, du nom de la méthode, du code source de son paquet et de ses hyperparamètres : tant que les fichiers Excel et le code ne changent pas, une nouvelle exécution relit les résultats au lieu de refaire les calculs, et seules les populations dont les données ont changé sont réestimées. Quand la taille du cache dépasse FIT_CACHE_MAX_BYTES, on supprime les ajustements utilisés le moins récemment. Une entrée illisible (fichier tronqué ou écrit par une ancienne version du code) est supprimée et recalculée. FIT_CACHE_VERSION permet d'invalider tout le cache, par exemple quand le format des résultats change.
+"""
+
+import os
+import sys
+import hashlib
+import inspect
+import pickle
+import numpy as np
+import pandas as pd
+
+# Par défaut à côté du paquet, c'est-à-dire à côté des fichiers Excel, et non dans le dossier courant
+FIT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.mortality_cache', 'fits')
+
+FIT_CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+FIT_CACHE_VERSION = 1
+
+FIT_CACHE_ENABLED = True
+
+# Empreinte d'une valeur quelconque (tableaux, dataframes, listes, dictionnaires, scalaires) ajoutée au hash digest
+def update_fingerprint(digest, value):
+    if isinstance(value, pd.DataFrame):
+        update_fingerprint(digest, ('DataFrame', list(value.index), list(value.columns), value.to_numpy()))
+    elif isinstance(value, pd.Series):
+        update_fingerprint(digest, ('Series', list(value.index), value.to_numpy()))
+    elif isinstance(value, (np.ndarray, np.generic)) and value.dtype != object:
+        value = np.ascontiguousarray(value)
+        digest.update(f'{value.dtype.str}{value.shape}'.encode())
+        digest.update(value.tobytes())
+    elif isinstance(value, np.ndarray):
+        update_fingerprint(digest, ('ndarray', value.shape, value.tolist()))
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            update_fingerprint(digest, item)
+    elif isinstance(value, dict):
+        update_fingerprint(digest, sorted(value.items()))
+    else:
+        digest.update(repr(value).encode())
+    digest.update(b'\0')
+
+# Dossier du cache des ajustements à côté du fichier de données path, comme le cache des tableaux de load_life_death_table
+def fit_cache_dir(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), '.mortality_cache', 'fits')
+
+# Empreinte du code d'une fonction : le source de tous les modules de son paquet (nz_mortality), pour que la modification d'une fonction
+# appelée depuis un autre module (lee_carter_batch pour le bootstrap par exemple) invalide aussi les ajustements. Une fonction hors d'un
+# paquet est identifiée par le source de son module et, sans source disponible, par son bytecode.
+CODE_FINGERPRINTS = {}
+
+def code_fingerprint(function):
+    package = sys.modules.get(function.__module__.partition('.')[0])
+    module = sys.modules.get(function.__module__)
+    name = package.__name__ if hasattr(package, '__path__') else function.__module__ if module is not None else function.__qualname__
+    if name not in CODE_FINGERPRINTS:
+        digest = hashlib.sha256()
+        try:
+            if hasattr(package, '__path__'):
+                for directory in package.__path__:
+                    for filename in sorted(os.listdir(directory)):
+                        if filename.endswith('.py'):
+                            with open(os.path.join(directory, filename), 'rb') as f:
+                                digest.update(filename.encode() + b'\0' + f.read())
+            else:
+                digest.update(inspect.getsource(module).encode())
+        except (TypeError, OSError):
+            code = getattr(function, '__code__', None)
+            digest.update(code.co_code + repr(code.co_consts).encode() if code is not None else function.__qualname__.encode())
+        CODE_FINGERPRINTS[name] = digest.hexdigest()
+    return CODE_FINGERPRINTS[name]
+
+# Les paramètres laissés à None sont lus dans FIT_CACHE_DIR, FIT_CACHE_MAX_BYTES et FIT_CACHE_ENABLED au moment de l'utilisation,
+# pour qu'une modification de ces constantes après l'import s'applique aussi à fit_cache
+class FitCache:
+
+    def __init__(self, cache_dir=None, max_bytes=None, enabled=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def directory(self):
+        return FIT_CACHE_DIR if self.cache_dir is None else self.cache_dir
+
+    def size_limit(self):
+        return FIT_CACHE_MAX_BYTES if self.max_bytes is None else self.max_bytes
+
+    def is_enabled(self):
+        return FIT_CACHE_ENABLED if self.enabled is None else self.enabled
+
+    def key(self, function, *args, **params):
+        digest = hashlib.sha256()
+        update_fingerprint(digest, (FIT_CACHE_VERSION, function.__qualname__, code_fingerprint(function), args, params))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory(), f'{key}.pkl')
+
+    # On renvoie (True, valeur) si l'ajustement est dans le cache, (False, None) sinon. Une entrée qui ne se relit pas (fichier tronqué,
+    # ou pickle d'une ancienne version du code qui lève AttributeError ou ModuleNotFoundError) est supprimée et comptée comme absente.
+    def get(self, key):
+        if not self.is_enabled():
+            return False, None
+
+        try:
+            with open(self.path(key), 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        except Exception:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            self.misses += 1
+            return False, None
+
+        # La date de modification sert de date de dernière utilisation pour l'éviction
+        os.utime(self.path(key))
+        self.hits += 1
+        return True, value
+
+    def put(self, key, value):
+        if not self.is_enabled():
+            return
+
+        # On écrit dans un fichier temporaire puis on le renomme, pour ne jamais laisser une entrée à moitié écrite
+        os.makedirs(self.directory(), exist_ok=True)
+        temporary_path = f'{self.path(key)}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.path(key))
+
+        self.evict()
+
+    # Plusieurs processus peuvent écrire dans le cache en même temps : une entrée peut disparaître pendant le parcours
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory()):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.size_limit():
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    # Appel mémoïsé : function(*args, **params) n'est exécutée que si le résultat n'est pas déjà dans le cache
+    def call(self, function, *args, **params):
+        key = self.key(function, *args, **params)
+        found, value = self.get(key)
+        if not found:
+            value = function(*args, **params)
+            self.put(key, value)
+        return value
+
+fit_cache = FitCache()
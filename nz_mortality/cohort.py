@@ -0,0 +1,269 @@
+"""Modèles avec effet de génération : âge-période-cohorte (APC) et Renshaw-Haberman
+
+Les deux modèles sont ajustés par maximum de vraisemblance de Poisson sur les mêmes matrices de décès et de populations que lee_carter_poisson :
+D_xt ~ Poisson(E_xt exp(ax + kt + gc)) pour le modèle APC et D_xt ~ Poisson(E_xt exp(ax + bx kt + b0x gc)) pour Renshaw-Haberman,
+où c = t - x est la génération. Les indices de génération sont calculés une seule fois sur toute la matrice (diagonales âge × période)
+et les sommes par génération sont faites avec np.bincount, sans boucle sur les cases.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+from .lee_carter import normalize_lee_carter
+
+# Indice de génération de chaque case âge × période : période - âge, décalé pour commencer à 0.
+# age_offsets donne le décalage de chaque âge en nombre de périodes (par défaut 0, 1, 2, ... quand âges et périodes ont la même largeur) ;
+# avec des groupes d'âge on prend comme pour les tables par génération la borne inférieure divisée par la largeur des périodes.
+def cohort_indices(n_ages, n_periods, age_offsets=None):
+    if age_offsets is None:
+        age_offsets = np.arange(n_ages)
+    age_offsets = np.asarray(age_offsets, dtype=int)
+    return np.arange(n_periods)[np.newaxis, :] - age_offsets[:, np.newaxis] + age_offsets.max()
+
+# Log taux ajustés ax + bx kt + b0x gc, bx = b0x = 1 pour le modèle APC. Les générations sans effet estimé donnent des NaN.
+def cohort_log_rates(ax, kt, gc, cohorts, bx=1.0, b0x=1.0):
+    bx = np.asarray(bx, dtype=np.float64)
+    b0x = np.asarray(b0x, dtype=np.float64)
+    gc = np.asarray(gc, dtype=np.float64)
+    bx = bx[:, np.newaxis] if bx.ndim else bx
+    b0x = b0x[:, np.newaxis] if b0x.ndim else b0x
+    gc_xt = np.where(cohorts < len(gc), gc[np.minimum(cohorts, len(gc) - 1)], np.nan)
+    return ax[:, np.newaxis] + bx * kt[np.newaxis, :] + b0x * gc_xt
+
+# Effet de génération prolongé à n_cohorts générations pour la prévision : les générations qui n'ont pas été estimées après la dernière
+# génération estimée (les plus jeunes, pas encore ou trop peu observées) suivent une marche aléatoire avec dérive ajustée sur les
+# générations estimées, comme kt avec ARIMA(0, 1, 0)
+def extend_cohort_effect(gc, n_cohorts):
+    gc = np.asarray(gc, dtype=np.float64)
+    fitted = np.flatnonzero(np.isfinite(gc))
+    first, last = fitted[0], fitted[-1]
+    drift = (gc[last] - gc[first]) / (last - first)
+
+    extended = np.full(n_cohorts, np.nan)
+    extended[:last + 1] = gc[:last + 1]
+    extended[last + 1:] = gc[last] + drift * np.arange(1, n_cohorts - last)
+    return extended
+
+# On retire de gc sa tendance linéaire et sa moyenne (sur les générations estimées) et on la reporte sur ax et kt : dans le modèle APC,
+# gc + a + b c, kt - b t et ax - a - b (c - t) donnent les mêmes taux puisque c - t ne dépend que de l'âge. Puis on centre kt.
+def normalize_apc(ax, kt, gc, cohorts, fitted_cohorts):
+    c = np.flatnonzero(fitted_cohorts)
+    slope, intercept = np.polyfit(c, gc[c], 1)
+    gc = np.where(fitted_cohorts, gc - intercept - slope * np.arange(len(gc)), np.nan)
+    kt = kt + slope * np.arange(len(kt))
+    ax = ax + intercept + slope * cohorts[:, 0]
+
+    kt_mean = kt.mean()
+    return ax + kt_mean, kt - kt_mean, gc
+
+# Pour Renshaw-Haberman on impose la somme des bx égale à 1, la moyenne des kt et des gc égale à 0, et la somme des b0x égale à 1
+# quand ils sont estimés
+def normalize_renshaw_haberman(ax, bx, kt, b0x, gc, fitted_cohorts, fit_b0x):
+    ax, bx, kt = (values[0] for values in normalize_lee_carter(
+        ax[np.newaxis], bx[np.newaxis], kt[np.newaxis], np.ones((1, len(kt)), dtype=bool)))
+
+    if fit_b0x:
+        sum_b0x = b0x.sum()
+        b0x = b0x / sum_b0x
+        gc = gc * sum_b0x
+
+    gc_mean = np.mean(gc[fitted_cohorts])
+    ax = ax + b0x * gc_mean
+    gc = np.where(fitted_cohorts, gc - gc_mean, np.nan)
+
+    return ax, bx, kt, b0x, gc
+
+# Décès, populations et poids communs aux deux modèles. Les cases sans décès ou sans population observés ne participent pas à la
+# vraisemblance, ni les générations observées dans moins de min_cohort_cells cases (les coins de la matrice), dont l'effet est
+# trop mal estimé.
+def cohort_model_data(D_xt, E_xt, age_offsets, min_cohort_cells):
+    D_xt = np.asarray(D_xt, dtype=np.float64)
+    E_xt = np.asarray(E_xt, dtype=np.float64)
+
+    cohorts = cohort_indices(*D_xt.shape, age_offsets=age_offsets)
+    n_cohorts = cohorts.max() + 1
+
+    W = np.isfinite(D_xt) & np.isfinite(E_xt) & (E_xt > 0)
+    cohort_cells = np.bincount(cohorts[W], minlength=n_cohorts)
+    W &= cohort_cells[cohorts] >= min_cohort_cells
+    fitted_cohorts = np.bincount(cohorts[W], minlength=n_cohorts) > 0
+
+    D_xt = np.where(W, D_xt, 0.0)
+    E_xt = np.where(W, E_xt, 0.0)
+
+    return D_xt, E_xt, W, cohorts, fitted_cohorts
+
+def poisson_deviance(D_xt, D_hat, W):
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        log_ratio = np.where(D_xt > 0, np.log(D_xt / D_hat), 0.0)
+    return 2 * np.sum(np.where(W, D_xt * log_ratio - (D_xt - D_hat), 0.0))
+
+# Pas de Fisher scoring (IRLS) sur tous les paramètres à la fois. Chaque case observée ne dépend que de quelques paramètres : columns
+# donne leurs positions dans le vecteur des paramètres et derivatives les dérivées du log taux par rapport à chacun (cases × k).
+# Le gradient et la matrice d'information sont assemblés avec np.bincount en temps linéaire en nombre de cases, puis on résout un
+# système de la taille du nombre de paramètres. Un très petit amortissement sur la diagonale rend le système inversible malgré les
+# directions non identifiées (le gradient y est nul), qui sont ensuite fixées par la normalisation.
+def fisher_scoring_step(columns, derivatives, residuals, D_hat, n_params, cross_pairs=()):
+    gradient = np.bincount(columns.ravel(), weights=(derivatives * residuals[:, np.newaxis]).ravel(), minlength=n_params)
+    pairs = columns[:, :, np.newaxis] * n_params + columns[:, np.newaxis, :]
+    weights = derivatives[:, :, np.newaxis] * derivatives[:, np.newaxis, :] * D_hat[:, np.newaxis, np.newaxis]
+    information = np.bincount(pairs.ravel(), weights=weights.ravel(), minlength=n_params ** 2).reshape(n_params, n_params)
+    for i, j in cross_pairs:
+        information -= np.bincount(columns[:, i] * n_params + columns[:, j], weights=residuals, minlength=n_params ** 2).reshape(n_params, n_params)
+        information -= np.bincount(columns[:, j] * n_params + columns[:, i], weights=residuals, minlength=n_params ** 2).reshape(n_params, n_params)
+    information[np.diag_indices(n_params)] += 1e-9 * np.abs(np.diagonal(information)).mean()
+    return np.linalg.solve(information, gradient)
+
+def cohort_trace(trace, columns, converged):
+    trace = pd.DataFrame(trace, columns=['iteration'] + columns + ['objective', 'wall_time']).set_index('iteration')
+    trace.attrs['converged'] = converged
+    return trace
+
+# Modèle âge-période-cohorte : log m_xt = ax + kt + gc. Le modèle est linéaire en ses paramètres (un modèle linéaire généralisé de
+# Poisson), les pas de Fisher scoring sur tous les paramètres à la fois sont donc des pas de Newton et convergent en quelques itérations.
+# On renvoie ax, kt, gc (NaN pour les générations non estimées), la matrice des indices de génération et la trace.
+def age_period_cohort(D_xt, E_xt, age_offsets=None, min_cohort_cells=3, max_iter=100, tol=1e-6):
+    D_xt, E_xt, W, cohorts, fitted_cohorts = cohort_model_data(D_xt, E_xt, age_offsets, min_cohort_cells)
+    n_ages, n_periods = D_xt.shape
+    n_cohorts = len(fitted_cohorts)
+
+    # Point de départ : taux moyen par âge, sans effet de période ni de génération
+    ax = np.log(D_xt.sum(axis=1) / E_xt.sum(axis=1))
+    kt = np.zeros(n_periods)
+    gc = np.zeros(n_cohorts)
+
+    x, t = np.nonzero(W)
+    c = cohorts[x, t]
+    D_obs = D_xt[x, t]
+    E_obs = E_xt[x, t]
+
+    starts = np.cumsum([0, n_ages, n_periods, n_cohorts])
+    columns = np.stack([x, starts[1] + t, starts[2] + c], axis=1)
+    derivatives = np.ones(columns.shape)
+
+    def expected_deaths(ax, kt, gc):
+        return E_obs * np.exp(ax[x] + kt[t] + gc[c])
+
+    trace = []
+    start_time = time.perf_counter()
+    converged = False
+    D_hat = expected_deaths(ax, kt, gc)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for iteration in range(max_iter):
+            ax_old, kt_old, gc_old = ax, kt, gc
+
+            step = fisher_scoring_step(columns, derivatives, D_obs - D_hat, D_hat, starts[-1])
+            ax, kt, gc = (old + step[start:end] for old, start, end in zip((ax_old, kt_old, gc_old), starts[:3], starts[1:]))
+
+            ax, kt, gc = normalize_apc(ax, kt, gc, cohorts, fitted_cohorts)
+            gc = np.nan_to_num(gc)
+            D_hat = expected_deaths(ax, kt, gc)
+
+            trace.append([
+                iteration + 1,
+                np.max(np.abs(ax - ax_old)),
+                np.max(np.abs(kt - kt_old)),
+                np.max(np.abs(gc - gc_old)),
+                poisson_deviance(D_obs, D_hat, True),
+                time.perf_counter() - start_time
+            ])
+
+            if max(trace[-1][1:4]) < tol:
+                converged = True
+                break
+
+    gc = np.where(fitted_cohorts, gc, np.nan)
+
+    return ax, kt, gc, cohorts, cohort_trace(trace, ['delta_ax', 'delta_kt', 'delta_gc'], converged)
+
+# Modèle de Renshaw-Haberman : log m_xt = ax + bx kt + b0x gc. Par défaut b0x = 1 (modèle H1 de Haberman et Renshaw, beaucoup plus
+# stable), fit_b0x=True estime aussi b0x. Les mises à jour paramètre par paramètre de lee_carter_poisson convergent ici très lentement,
+# parce que la tendance linéaire de gc est presque confondue avec bx kt : on fait donc des pas de Fisher scoring sur tous les paramètres
+# à la fois, en partant du modèle APC comme le recommandent Renshaw et Haberman, et on divise le pas par deux tant que la déviance
+# augmente. On renvoie ax, bx, kt, b0x, gc (NaN pour les générations non estimées), la matrice des indices de génération et la trace.
+def renshaw_haberman(D_xt, E_xt, age_offsets=None, fit_b0x=False, min_cohort_cells=3, max_iter=100, tol=1e-9):
+    D_xt, E_xt, W, cohorts, fitted_cohorts = cohort_model_data(D_xt, E_xt, age_offsets, min_cohort_cells)
+    n_ages, n_periods = D_xt.shape
+    n_cohorts = len(fitted_cohorts)
+
+    ax, kt, gc, _, _ = age_period_cohort(D_xt, E_xt, age_offsets, min_cohort_cells)
+    bx = np.full(n_ages, 1 / n_ages)
+    kt = kt * n_ages
+    gc = np.nan_to_num(gc)
+    b0x = np.ones(n_ages)
+    if fit_b0x:
+        b0x, gc = b0x / n_ages, gc * n_ages
+
+    # On ne garde que les cases observées, avec l'âge, la période et la génération de chacune
+    x, t = np.nonzero(W)
+    c = cohorts[x, t]
+    D_obs = D_xt[x, t]
+    E_obs = E_xt[x, t]
+
+    # Positions de ax, bx, kt, gc et b0x dans le vecteur des paramètres
+    starts = np.cumsum([0, n_ages, n_ages, n_periods, n_cohorts, n_ages if fit_b0x else 0])
+    columns = np.stack([x, starts[1] + x, starts[2] + t, starts[3] + c] + ([starts[4] + x] if fit_b0x else []), axis=1)
+
+    def expected_deaths(ax, bx, kt, b0x, gc):
+        return E_obs * np.exp(ax[x] + bx[x] * kt[t] + b0x[x] * gc[c])
+
+    def deviance(D_hat):
+        return poisson_deviance(D_obs, D_hat, True)
+
+    trace = []
+    start_time = time.perf_counter()
+    converged = False
+    D_hat = expected_deaths(ax, bx, kt, b0x, gc)
+
+    # Un pas d'essai trop long peut déborder : sa déviance est alors infinie ou NaN et il est divisé par deux
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        for iteration in range(max_iter):
+            ax_old, bx_old, kt_old, b0x_old, gc_old, D_hat_old = ax, bx, kt, b0x, gc, D_hat
+            objective_old = deviance(D_hat)
+
+            derivatives = np.stack([np.ones_like(D_obs), kt[t], bx[x], b0x[x]] + ([gc[c]] if fit_b0x else []), axis=1)
+            # On essaie d'abord le pas de Newton (information observée, avec les dérivées croisées bx kt et b0x gc), qui converge bien
+            # plus vite près de l'optimum, puis le pas de Fisher scoring qui fait toujours diminuer la déviance
+            for cross_pairs, max_halvings in ([(1, 2)] + ([(3, 4)] if fit_b0x else []), 4), ((), 30):
+                step = fisher_scoring_step(columns, derivatives, D_obs - D_hat_old, D_hat_old, starts[-1], cross_pairs)
+                for _ in range(max_halvings):
+                    ax, bx, kt, gc = (old + step[start:end] for old, start, end in zip(
+                        (ax_old, bx_old, kt_old, gc_old), starts[:4], starts[1:5]))
+                    b0x = b0x_old + step[starts[4]:] if fit_b0x else b0x_old
+                    D_hat = expected_deaths(ax, bx, kt, b0x, gc)
+                    if deviance(D_hat) <= objective_old:
+                        break
+                    step = step / 2
+                else:
+                    continue
+                break
+            else:
+                # Aucun pas n'a fait diminuer la déviance : on revient à l'itéré précédent et on s'arrête sans convergence
+                ax, bx, kt, b0x, gc, D_hat = ax_old, bx_old, kt_old, b0x_old, gc_old, D_hat_old
+                break
+
+            ax, bx, kt, b0x, gc = normalize_renshaw_haberman(ax, bx, kt, b0x, gc, fitted_cohorts, fit_b0x)
+            gc = np.nan_to_num(gc)
+
+            trace.append([
+                iteration + 1,
+                np.max(np.abs(ax - ax_old)),
+                np.max(np.abs(bx - bx_old)),
+                np.max(np.abs(kt - kt_old)),
+                np.max(np.abs(b0x - b0x_old)),
+                np.max(np.abs(gc - gc_old)),
+                deviance(D_hat),
+                time.perf_counter() - start_time
+            ])
+
+            # Le long de la direction presque non identifiée les paramètres bougent encore quand la déviance ne change plus : on
+            # s'arrête quand la déviance ne diminue plus relativement de plus de tol
+            if objective_old - trace[-1][-2] < tol * trace[-1][-2]:
+                converged = True
+                break
+
+    gc = np.where(fitted_cohorts, gc, np.nan)
+
+    return ax, bx, kt, b0x, gc, cohorts, cohort_trace(trace, ['delta_ax', 'delta_bx', 'delta_kt', 'delta_b0x', 'delta_gc'], converged)
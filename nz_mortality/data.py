@@ -0,0 +1,309 @@
+"""Chargement et mise en forme des tables de décès et de population
+
+La lecture d'un fichier Excel avec openpyxl est lente, on convertit donc chaque fichier une seule fois en colonnes numpy typées (un fichier .npy par colonne) que l'on relit ensuite en memory-map. Le cache est invalidé si la date de modification et le hash du fichier source changent.
+
+Les décès et les populations de toutes les populations sont rangés dans un seul tableau numpy (population × sexe × âge × période), MortalityCube, dont les dataframes ne sont que des vues.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from .life_tables import age_group_bounds
+
+CACHE_FORMAT_VERSION = 1
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_age_label(age):
+    # Les âges sont lus tantôt comme un entier (0), tantôt comme une chaîne avec des espaces (' 01-04')
+    if pd.isna(age):
+        return None
+    return str(age).strip()
+
+def write_columnar_cache(df, cache_path, source_path):
+    os.makedirs(cache_path, exist_ok=True)
+
+    # On supprime l'ancien fichier de métadonnées en premier : un cache sans meta.json est considéré comme invalide
+    meta_path = os.path.join(cache_path, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    ages = df['Age'].map(normalize_age_label)
+    age_labels = list(ages.dropna().unique())
+    age_codes = pd.Categorical(ages, categories=age_labels).codes
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        if name == 'Age':
+            values = age_codes.astype(np.int16)
+        elif name == 'Year':
+            values = df[name].to_numpy(dtype=np.int32)
+        else:
+            values = df[name].to_numpy(dtype=np.float64)
+        np.save(os.path.join(cache_path, f'col_{i}.npy'), values)
+        columns.append(name)
+
+    stat = os.stat(source_path)
+    meta = {
+        'version': CACHE_FORMAT_VERSION,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_size': stat.st_size,
+        'source_sha256': file_sha256(source_path),
+        'columns': columns,
+        'age_labels': age_labels,
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+    return meta
+
+def read_columnar_cache(cache_path, meta):
+    data = {}
+    for i, name in enumerate(meta['columns']):
+        values = np.load(os.path.join(cache_path, f'col_{i}.npy'), mmap_mode='r')
+        if name == 'Age':
+            values = pd.Categorical.from_codes(values, categories=meta['age_labels'])
+        data[name] = values
+
+    return pd.DataFrame(data, copy=False)
+
+def load_cached_meta(source_path, cache_path):
+    meta_path = os.path.join(cache_path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('version') != CACHE_FORMAT_VERSION:
+        return None
+
+    stat = os.stat(source_path)
+    if meta['source_mtime_ns'] == stat.st_mtime_ns and meta['source_size'] == stat.st_size:
+        return meta
+
+    # La date de modification a changé : on ne reconstruit le cache que si le contenu a réellement changé
+    if meta['source_size'] != stat.st_size or meta['source_sha256'] != file_sha256(source_path):
+        return None
+
+    meta['source_mtime_ns'] = stat.st_mtime_ns
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+    return meta
+
+def load_life_death_table(path, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), '.mortality_cache')
+    cache_path = os.path.join(cache_dir, os.path.splitext(os.path.basename(path))[0])
+
+    meta = load_cached_meta(path, cache_path)
+    if meta is None:
+        meta = write_columnar_cache(pd.read_excel(path), cache_path, path)
+
+    return read_columnar_cache(cache_path, meta)
+
+LIFE_DEATH_VALUE_COLUMNS = [
+    'Total Death', 'Male Death', 'Female Death',
+    'Total Population', 'Male Population', 'Female Population'
+]
+
+# Libellés des périodes à partir de leur première année : '1950-1954' pour des intervalles de 5 ans, '1950' pour des années civiles
+def period_labels(lower_bounds, bin_width=5):
+    if bin_width == 1:
+        return [f"{lower_bound}" for lower_bound in lower_bounds]
+    return [f"{lower_bound}-{lower_bound + bin_width - 1}" for lower_bound in lower_bounds]
+
+# On crée une fonction qui nettoie et regroupe les données en une seule passe : les années et âges exclus sont filtrés avec un seul masque,
+# les années sont regroupées en intervalles par arithmétique entière (comme dans l'exemple de l'article 1 pour la méthode de Lee Carter)
+# et les décès et populations de toutes les catégories sont sommés avec un seul groupby sur des clés catégorielles.
+# Avec bin_width=1 on garde les années civiles des lignes du fichier. Avec open_age, les âges à partir de open_age sont regroupés
+# dans un groupe ouvert (par exemple '95+') au lieu d'être retirés.
+def aggregate_life_death_table(df, excluded_years=(), excluded_ages=(), bin_width=5, value_columns=LIFE_DEATH_VALUE_COLUMNS, open_age=None):
+    mask = ~(df['Year'].isin(excluded_years) | df['Age'].isin(excluded_ages) | df['Age'].isna()).to_numpy()
+
+    years = df['Year'].to_numpy()[mask]
+    lower_bounds, interval_codes = np.unique(years // bin_width * bin_width, return_inverse=True)
+    year_interval = pd.Categorical.from_codes(interval_codes, categories=period_labels(lower_bounds, bin_width), ordered=True)
+
+    # Les libellés d'âge sont rangés par âge croissant et non par ordre alphabétique ('100-104' après '95-99')
+    age = pd.Categorical(df['Age'].to_numpy()[mask])
+    age_lower_bounds, _ = age_group_bounds(age.categories)
+    if open_age is not None:
+        is_open = age_lower_bounds[age.codes] >= open_age
+        age = pd.Categorical(np.where(is_open, f"{open_age}+", np.asarray(age, dtype=object)))
+        age_lower_bounds, _ = age_group_bounds(age.categories)
+    age = age.reorder_categories(age.categories[np.argsort(age_lower_bounds, kind='stable')], ordered=True)
+
+    aggregated_df = df.loc[mask, list(value_columns)].groupby([year_interval, age], observed=True).sum()
+    aggregated_df.index.names = ['Year Interval', 'Age']
+
+    return aggregated_df
+
+# Lecture par morceaux d'un extrait CSV ou Parquet (par exemple des enregistrements individuels de décès) : un seul morceau de
+# chunk_size lignes est en mémoire à la fois. pyarrow n'est importé que pour les fichiers Parquet.
+def iter_table_chunks(path, chunk_size=1_000_000, columns=None):
+    extension = path.lower().removesuffix('.gz')
+    if extension.endswith('.csv'):
+        # Les âges sont lus comme des chaînes ('01-04' et 0 dans la même colonne)
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=columns, dtype={'Age': str})
+    elif extension.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Format non reconnu pour {path!r} : on attend un fichier .csv ou .parquet")
+
+# Agrégation en flux : chaque morceau (un DataFrame avec Year, Age et les colonnes de valeurs) est ajouté avec np.bincount dans un
+# tableau valeur × libellé d'âge × année alloué à l'avance, agrandi seulement quand un nouveau libellé d'âge ou une nouvelle année
+# apparaît. La mémoire ne dépend donc que du nombre de libellés et d'années, pas du nombre de lignes. Le petit tableau obtenu est
+# ensuite regroupé par aggregate_life_death_table (périodes, âges exclus, groupe ouvert) : le résultat est le même qu'avec le fichier
+# entier en mémoire. Une ligne par décès convient aussi, avec une colonne de valeurs égale à 1.
+def aggregate_life_death_chunks(chunks, excluded_years=(), excluded_ages=(), bin_width=5, value_columns=LIFE_DEATH_VALUE_COLUMNS, open_age=None):
+    value_columns = list(value_columns)
+    age_codes = {}
+    first_year = None
+    # La dernière ligne compte les lignes de chaque case, pour ne garder que les cases présentes dans les données
+    counts = np.zeros((len(value_columns) + 1, 0, 0))
+
+    for chunk in chunks:
+        # Les libellés ne sont normalisés qu'une fois par valeur distincte du morceau, pas pour chaque ligne
+        codes, raw_labels = pd.factorize(chunk['Age'])
+        labels = [normalize_age_label(label) for label in raw_labels]
+        for label in labels:
+            age_codes.setdefault(label, len(age_codes))
+        keep = codes >= 0
+        if not keep.any():
+            continue
+        ages = np.asarray([age_codes[label] for label in labels], dtype=np.int64)[codes[keep]]
+        years = chunk['Year'].to_numpy(dtype=np.int64)[keep]
+
+        # On agrandit le tableau si le morceau contient de nouveaux âges ou des années hors de l'intervalle déjà couvert
+        chunk_first, chunk_last = years.min(), years.max()
+        if first_year is None:
+            first_year = chunk_first
+        n_years = counts.shape[2]
+        new_first, new_last = min(first_year, chunk_first), max(first_year + n_years - 1, chunk_last)
+        if len(age_codes) > counts.shape[1] or new_first < first_year or new_last - new_first + 1 > n_years:
+            counts = np.pad(counts, ((0, 0), (0, len(age_codes) - counts.shape[1]), (first_year - new_first, new_last - first_year - n_years + 1)))
+            first_year = new_first
+
+        n_ages, n_years = counts.shape[1:]
+        cells = ages * n_years + (years - first_year)
+        for v, name in enumerate(value_columns):
+            counts[v] += np.bincount(cells, weights=np.nan_to_num(chunk[name].to_numpy(dtype=np.float64)[keep]), minlength=n_ages * n_years).reshape(n_ages, n_years)
+        counts[-1] += np.bincount(cells, minlength=n_ages * n_years).reshape(n_ages, n_years)
+
+    # Aucune ligne avec un âge (extrait vide, ou seulement des lignes sans âge) : il n'y a rien à regrouper
+    if first_year is None:
+        raise ValueError("Aucune ligne avec un âge renseigné dans les morceaux : impossible de construire la table")
+
+    age_index, year_index = np.nonzero(counts[-1])
+    labels = np.array(list(age_codes), dtype=object)
+    compact_df = pd.DataFrame({
+        'Year': first_year + year_index,
+        'Age': pd.Categorical(labels[age_index], categories=list(age_codes)),
+        **{name: counts[v, age_index, year_index] for v, name in enumerate(value_columns)}
+    })
+
+    return aggregate_life_death_table(compact_df, excluded_years, excluded_ages, bin_width, value_columns, open_age)
+
+class MortalityCube:
+
+    def __init__(self, deaths, exposures, populations, sexes, ages, periods, rates=None):
+        self.deaths = np.ascontiguousarray(deaths, dtype=np.float64)
+        self.exposures = np.ascontiguousarray(exposures, dtype=np.float64)
+
+        self.populations = list(populations)
+        self.sexes = list(sexes)
+        self.ages = list(ages)
+        self.periods = list(periods)
+
+        # Correspondance entre les libellés et les positions entières des axes
+        self.population_index = {population: i for i, population in enumerate(self.populations)}
+        self.sex_index = {sex: i for i, sex in enumerate(self.sexes)}
+        self.age_index = {age: i for i, age in enumerate(self.ages)}
+        self.period_index = {period: i for i, period in enumerate(self.periods)}
+
+        # Les taux déjà calculés peuvent être fournis (append_periods ne calcule que ceux des nouvelles périodes)
+        if rates is not None:
+            self.mortality_rate, self.death_rate = rates
+            return
+
+        # On calcule le taux de mortalité puis le taux de décès ln(1 / (1 - q)) sans tableau intermédiaire
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.mortality_rate = self.deaths / self.exposures
+            self.death_rate = np.subtract(1, self.mortality_rate)
+            np.divide(1, self.death_rate, out=self.death_rate)
+            np.log(self.death_rate, out=self.death_rate)
+
+    @classmethod
+    def from_aggregated(cls, aggregated_dfs, sexes=('Total', 'Male', 'Female'), ages=None, periods=None):
+        if ages is None:
+            ages = list(dict.fromkeys(age for df in aggregated_dfs.values() for age in df.index.levels[1]))
+            ages = [ages[i] for i in np.argsort(age_group_bounds(ages)[0], kind='stable')]
+        if periods is None:
+            periods = sorted(set(period for df in aggregated_dfs.values() for period in df.index.levels[0]))
+
+        shape = (len(aggregated_dfs), len(sexes), len(ages), len(periods))
+        deaths = np.full(shape, np.nan)
+        exposures = np.full(shape, np.nan)
+
+        # Les cases absentes (sexe non fourni, périodes hors du fichier) restent à NaN
+        for p, aggregated_df in enumerate(aggregated_dfs.values()):
+            age_pos = pd.Index(ages).get_indexer(aggregated_df.index.get_level_values('Age'))
+            period_pos = pd.Index(periods).get_indexer(aggregated_df.index.get_level_values('Year Interval'))
+            keep = (age_pos >= 0) & (period_pos >= 0)
+
+            for s, sex in enumerate(sexes):
+                if f'{sex} Death' not in aggregated_df.columns:
+                    continue
+                deaths[p, s, age_pos[keep], period_pos[keep]] = aggregated_df[f'{sex} Death'].to_numpy()[keep]
+                exposures[p, s, age_pos[keep], period_pos[keep]] = aggregated_df[f'{sex} Population'].to_numpy()[keep]
+
+        return cls(deaths, exposures, aggregated_dfs.keys(), sexes, ages, periods)
+
+    # Ajout des périodes nouvellement publiées : aggregated_dfs ne contient que les lignes agrégées des nouvelles périodes (par
+    # population, les populations absentes restent à NaN). Les périodes déjà agrégées et leurs taux sont repris tels quels.
+    def append_periods(self, aggregated_dfs):
+        new = MortalityCube.from_aggregated(aggregated_dfs, sexes=self.sexes, ages=self.ages)
+        if set(new.periods) & set(self.periods) or new.periods[0] <= self.periods[-1]:
+            raise ValueError("Les nouvelles périodes doivent suivre les périodes déjà présentes")
+
+        positions = [self.population_index[population] for population in new.populations]
+        arrays = []
+        for name in ['deaths', 'exposures', 'mortality_rate', 'death_rate']:
+            values = np.full(self.deaths.shape[:3] + (len(new.periods),), np.nan)
+            values[positions] = getattr(new, name)
+            arrays.append(np.concatenate([getattr(self, name), values], axis=3))
+
+        return MortalityCube(*arrays[:2], self.populations, self.sexes, self.ages, self.periods + new.periods, rates=arrays[2:])
+
+    def period_slice(self, periods=None):
+        # On utilise une tranche et non une liste d'indices pour que numpy renvoie une vue et pas une copie
+        if periods is None:
+            return slice(None)
+        positions = [self.period_index[period] for period in periods]
+        if positions != list(range(positions[0], positions[-1] + 1)):
+            raise ValueError("Les périodes doivent être consécutives et dans l'ordre pour obtenir une vue")
+        return slice(positions[0], positions[-1] + 1)
+
+    def matrix(self, name, population, sex='Total', periods=None):
+        values = getattr(self, name)
+        return values[self.population_index[population], self.sex_index[sex], :, self.period_slice(periods)]
+
+    def frame(self, name, population, sex='Total', periods=None):
+        return pd.DataFrame(
+            self.matrix(name, population, sex, periods),
+            index=self.ages,
+            columns=self.periods[self.period_slice(periods)],
+            copy=False
+        )
@@ -0,0 +1,438 @@
+"""Estimation du modèle de Lee Carter : SVD, réestimation de kt, Newton Raphson, ajustement simultané de plusieurs populations, mise à jour incrémentale, modèle cohérent de Li et Lee et maximum de vraisemblance de Poisson"""
+
+import time
+import numpy as np
+import pandas as pd
+
+# On ne calcule que les premiers triplets singuliers dont on a besoin. Pour de petites matrices la SVD complète est la plus rapide,
+# pour de grandes matrices (âges simples, années simples, sous-populations) on utilise une SVD randomisée avec itérations de puissance
+# (Halko, Martinsson et Tropp) ou l'algorithme de Lanczos de scipy. A peut être une matrice ou une pile de matrices (population × âge × période).
+def truncated_svd(A, rank=1, method='auto', n_oversamples=5, n_power_iter=4, random_state=0):
+    A = np.asarray(A, dtype=np.float64)
+    stacked = A.ndim == 3
+    if not stacked:
+        A = A[np.newaxis]
+    n, m = A.shape[1:]
+    rank = min(rank, n, m)
+
+    if method == 'auto':
+        method = 'full' if min(n, m) <= 64 else 'randomized'
+    # svds exige rank < min(n, m) et ARPACK est peu fiable quand rank en est proche : on calcule alors la SVD complète
+    if method == 'lanczos' and rank >= min(n, m) - 1:
+        method = 'full'
+
+    if method == 'full':
+        U, sigma, Vt = np.linalg.svd(A, full_matrices=False)
+        U, sigma, Vt = U[:, :, :rank], sigma[:, :rank], Vt[:, :rank, :]
+    elif method == 'randomized':
+        rng = np.random.default_rng(random_state)
+        size = min(rank + n_oversamples, n, m)
+        At = A.transpose(0, 2, 1)
+
+        Q, _ = np.linalg.qr(A @ rng.standard_normal((A.shape[0], m, size)))
+        for _ in range(n_power_iter):
+            Z, _ = np.linalg.qr(At @ Q)
+            Q, _ = np.linalg.qr(A @ Z)
+
+        U_small, sigma, Vt = np.linalg.svd(Q.transpose(0, 2, 1) @ A, full_matrices=False)
+        U, sigma, Vt = (Q @ U_small)[:, :, :rank], sigma[:, :rank], Vt[:, :rank, :]
+    elif method == 'lanczos':
+        from scipy.sparse.linalg import svds
+
+        # svds renvoie les valeurs singulières dans l'ordre croissant
+        results = [svds(matrix, k=rank) for matrix in A]
+        U = np.stack([u[:, ::-1] for u, _, _ in results])
+        sigma = np.stack([s[::-1] for _, s, _ in results])
+        Vt = np.stack([vt[::-1] for _, _, vt in results])
+    else:
+        raise ValueError(f"method doit valoir 'auto', 'full', 'randomized' ou 'lanczos', pas {method!r}")
+
+    if not stacked:
+        return U[0], sigma[0], Vt[0]
+    return U, sigma, Vt
+
+# Modèle de Lee Carter de rang supérieur : log m_xt = ax + sum_i bx_i kt_i, chaque couple (bx_i, kt_i) venant d'un triplet singulier.
+# bx est de taille âge × rang et kt de taille rang × période, chaque bx_i est normalisé pour que sa somme soit égale à 1.
+def lee_carter_svd(log_m_xt, rank=1, method='auto'):
+    log_m_xt = np.asarray(log_m_xt, dtype=np.float64)
+
+    ax = log_m_xt.mean(axis=1)
+    U, sigma, Vt = truncated_svd(log_m_xt - ax[:, np.newaxis], rank=rank, method=method)
+
+    sum_bx = U.sum(axis=0)
+    bx = U / sum_bx
+    kt = (sigma * sum_bx)[:, np.newaxis] * Vt
+
+    return ax, bx, kt, sigma
+
+def objective_function(kt, ax, bx, D_xt, E_xt):
+    expected_deaths = np.sum(np.asarray(E_xt) * np.exp(ax[:, np.newaxis] + bx[:, np.newaxis] * kt), axis=0)
+    observed_deaths = np.sum(np.asarray(D_xt), axis=0)
+    return np.sum((observed_deaths - expected_deaths)**2)
+
+# Chaque kt_t n'intervient que dans le terme de la période t : on résout donc pour chaque t l'équation
+# sum_x E_xt exp(ax + bx kt) = sum_x D_xt par la méthode de Newton, pour toutes les périodes à la fois.
+# La dérivée est analytique : d/dkt sum_x E_xt exp(ax + bx kt) = sum_x bx E_xt exp(ax + bx kt)
+def reestimate_kt(ax, bx, D_xt, E_xt, initial_kt, bounds=(-np.inf, np.inf), max_iter=50, tol=1e-10):
+    ax = np.asarray(ax, dtype=np.float64)
+    bx = np.asarray(bx, dtype=np.float64)
+    E_xt = np.asarray(E_xt, dtype=np.float64)
+    observed_deaths = np.sum(np.asarray(D_xt, dtype=np.float64), axis=0)
+
+    kt = np.clip(np.array(initial_kt, dtype=np.float64), *bounds)
+
+    for iteration in range(max_iter):
+        expected_deaths_xt = E_xt * np.exp(ax[:, np.newaxis] + bx[:, np.newaxis] * kt)
+        expected_deaths = expected_deaths_xt.sum(axis=0)
+        derivative = bx @ expected_deaths_xt
+
+        kt_new = np.clip(kt - (expected_deaths - observed_deaths) / derivative, *bounds)
+
+        converged = np.max(np.abs(kt_new - kt)) < tol * (1 + np.max(np.abs(kt)))
+        kt = kt_new
+        if converged:
+            break
+
+    return kt
+
+# initial permet un départ à chaud à partir d'un ajustement précédent (ax, bx, kt). Si kt est plus court que le nombre de périodes
+# (par exemple quand une nouvelle période est ajoutée), les nouvelles périodes partent de la projection de log m_xt - ax sur bx,
+# puis on normalise pour que ax soit déjà la moyenne des log taux corrigés : on évite ainsi la lente dérive de la normalisation.
+def lee_carter_newton_raphson(log_m_xt, max_iter=100, tol=1e-6, initial=None):
+    log_m_xt = np.asarray(log_m_xt, dtype=np.float64)
+    n, m = log_m_xt.shape
+
+    if initial is None:
+        ax = np.zeros(n)
+        bx = np.ones(n) / n
+        kt = np.zeros(m)
+    else:
+        ax, bx, kt = (np.array(values, dtype=np.float64) for values in initial)
+        kt = np.concatenate([kt[:m], bx @ (log_m_xt[:, len(kt):] - ax[:, np.newaxis]) / (bx @ bx)])
+        ax, bx, kt = (values[0] for values in normalize_lee_carter(
+            ax[np.newaxis], bx[np.newaxis], kt[np.newaxis], np.ones((1, m), dtype=bool)))
+
+    # On garde pour chaque itération les écarts entre deux itérations, la somme des carrés des résidus et le temps écoulé
+    trace = []
+    start_time = time.perf_counter()
+    converged = False
+
+    for iteration in range(max_iter):
+        ax_old = ax
+        bx_old = bx
+        kt_old = kt
+
+        # Les mêmes mises à jour que la méthode de l'article, écrites sous forme matricielle pour tous les x et tous les t à la fois
+        ax = ax_old + (log_m_xt.sum(axis=1) - m * ax_old - bx_old * kt_old.sum()) / (m + 1)
+
+        centered_log_m_xt = log_m_xt - ax[:, np.newaxis]
+
+        sum_bx_squared = bx_old @ bx_old
+        kt = kt_old + (bx_old @ centered_log_m_xt - sum_bx_squared * kt_old) / sum_bx_squared
+
+        sum_k_squared = kt @ kt
+        bx = bx_old + (centered_log_m_xt @ kt - bx_old * sum_k_squared) / sum_k_squared
+
+        residuals = centered_log_m_xt - bx[:, np.newaxis] * kt
+        trace.append({
+            'iteration': iteration + 1,
+            'delta_ax': np.max(np.abs(ax - ax_old)),
+            'delta_bx': np.max(np.abs(bx - bx_old)),
+            'delta_kt': np.max(np.abs(kt - kt_old)),
+            'objective': np.sum(residuals ** 2),
+            'wall_time': time.perf_counter() - start_time
+        })
+
+        # On vérifie la convergence
+        if (trace[-1]['delta_ax'] < tol and
+            trace[-1]['delta_bx'] < tol and
+            trace[-1]['delta_kt'] < tol):
+            converged = True
+            break
+
+    trace = pd.DataFrame(trace).set_index('iteration')
+    trace.attrs['converged'] = converged
+
+    a_xNR = ax
+    b_xNR = bx
+    k_tNR = kt
+
+    return a_xNR, b_xNR, k_tNR, trace
+
+def print_convergence(trace):
+    if trace.attrs['converged']:
+        print(f"coverge en {len(trace)} iterations.")
+    else:
+        print("On a atteint le maximum d'itérations sans que la convergence a été atteinte.")
+
+# Ajustement simultané de plusieurs populations : log_m_pxt est un tableau population × âge × période.
+# Les cases masquées (par exemple les périodes absentes pour les populations Maori) ne participent pas aux mises à jour. Un âge sans
+# aucune case observée dans une population (un groupe sans décès dans une réplique du bootstrap par exemple) n'a ni ax ni bx : ils
+# valent NaN, sans empêcher l'ajustement des autres âges.
+def lee_carter_batch(log_m_pxt, mask=None, max_iter=100, tol=1e-6, init='svd', normalize=True, svd_method='auto'):
+    log_m_pxt = np.asarray(log_m_pxt, dtype=np.float64)
+    P, n, m = log_m_pxt.shape
+
+    if mask is None:
+        mask = np.isfinite(log_m_pxt)
+    mask = np.broadcast_to(mask if np.ndim(mask) == 3 else np.asarray(mask)[:, np.newaxis, :], log_m_pxt.shape)
+    W = mask.astype(np.float64)
+    L = np.where(mask, log_m_pxt, 0.0)
+
+    n_obs = W.sum(axis=2)
+    valid_periods = mask.any(axis=1)
+    valid_ages = n_obs > 0
+
+    if init == 'svd':
+        # On part de la solution SVD (premier triplet singulier seulement) calculée sur toutes les matrices empilées en un seul appel
+        ax = L.sum(axis=2) / np.maximum(n_obs, 1)
+        U, sigma, Vt = truncated_svd(W * (L - ax[:, :, np.newaxis]), rank=1, method=svd_method)
+        bx = np.where(valid_ages, U[:, :, 0], 0.0)
+        kt = sigma[:, 0, np.newaxis] * Vt[:, 0, :]
+        ax, bx, kt = normalize_lee_carter(ax, bx, kt, valid_periods)
+    elif init == 'zeros':
+        # Même point de départ que lee_carter_newton_raphson
+        ax = np.zeros((P, n))
+        bx = np.where(valid_ages, 1.0, 0.0) / np.maximum(valid_ages.sum(axis=1, keepdims=True), 1)
+        kt = np.zeros((P, m))
+    else:
+        raise ValueError(f"init doit valoir 'svd' ou 'zeros', pas {init!r}")
+
+    iterations = np.zeros(P, dtype=int)
+    active = np.ones(P, dtype=bool)
+    start_time = time.perf_counter()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for iteration in range(max_iter):
+            ax_old, bx_old, kt_old = ax, bx, kt
+
+            residuals = W * (L - ax_old[:, :, np.newaxis] - bx_old[:, :, np.newaxis] * kt_old[:, np.newaxis, :])
+            ax = ax_old + residuals.sum(axis=2) / (n_obs + 1)
+
+            centered = W * (L - ax[:, :, np.newaxis])
+
+            # Un dénominateur nul (période ou âge sans case observée) laisse le paramètre inchangé au lieu de donner 0 / 0
+            sum_bx_squared = np.einsum('px,pxt->pt', bx_old ** 2, W)
+            kt = np.where(sum_bx_squared > 0, kt_old + (np.einsum('px,pxt->pt', bx_old, centered) - sum_bx_squared * kt_old) / sum_bx_squared, kt_old)
+            kt = np.where(valid_periods, kt, 0.0)
+
+            sum_k_squared = np.einsum('pxt,pt->px', W, kt ** 2)
+            bx = np.where(sum_k_squared > 0, bx_old + (np.einsum('pxt,pt->px', centered, kt) - bx_old * sum_k_squared) / sum_k_squared, bx_old)
+
+            # Les populations qui ont déjà convergé ne sont plus modifiées
+            ax = np.where(active[:, np.newaxis], ax, ax_old)
+            bx = np.where(active[:, np.newaxis], bx, bx_old)
+            kt = np.where(active[:, np.newaxis], kt, kt_old)
+            iterations += active
+
+            delta = np.maximum.reduce([
+                np.max(np.abs(ax - ax_old), axis=1),
+                np.max(np.abs(bx - bx_old), axis=1),
+                np.max(np.abs(kt - kt_old), axis=1)
+            ])
+            active &= ~(delta < tol)
+            if not active.any():
+                break
+
+    if normalize:
+        ax, bx, kt = normalize_lee_carter(ax, bx, kt, valid_periods)
+
+    residuals = W * (L - ax[:, :, np.newaxis] - bx[:, :, np.newaxis] * kt[:, np.newaxis, :])
+    trace = pd.DataFrame({
+        'iterations': iterations,
+        'converged': ~active,
+        'objective': np.sum(residuals ** 2, axis=(1, 2))
+    })
+    trace.index.name = 'population'
+    trace.attrs['wall_time'] = time.perf_counter() - start_time
+
+    ax = np.where(valid_ages, ax, np.nan)
+    bx = np.where(valid_ages, bx, np.nan)
+    kt = np.where(valid_periods, kt, np.nan)
+
+    return ax, bx, kt, trace
+
+# On impose la somme des bx égale à 1 et la moyenne des kt (sur les périodes observées) égale à 0, sans changer les taux ajustés
+def normalize_lee_carter(ax, bx, kt, valid_periods):
+    sum_bx = bx.sum(axis=1, keepdims=True)
+    bx = bx / sum_bx
+    kt = kt * sum_bx
+
+    kt_mean = np.sum(np.where(valid_periods, kt, 0.0), axis=1, keepdims=True) / valid_periods.sum(axis=1, keepdims=True)
+    ax = ax + bx * kt_mean
+    kt = np.where(valid_periods, kt - kt_mean, 0.0)
+
+    return ax, bx, kt
+
+# Mise à jour incrémentale du modèle de Lee Carter quand une nouvelle période est publiée. La solution des moindres carrés (la même
+# surface ajustée que lee_carter_svd et lee_carter_newton_raphson) ne dépend des log taux que par leur moyenne par âge et leur matrice
+# de dispersion âge × âge : on ne garde que ces statistiques, mises à jour par la formule de Chan et al. pour ajouter un bloc de
+# colonnes, plus la somme des t l_t et les première et dernière colonnes pour la tendance et la dérive de kt. Ajouter une période coûte
+# O(âges²) et le calcul de ax et bx une décomposition âge × âge, quel que soit le nombre de périodes déjà vues.
+class IncrementalLeeCarter:
+
+    def __init__(self, log_m_xt):
+        log_m_xt = np.asarray(log_m_xt, dtype=np.float64)
+        n = log_m_xt.shape[0]
+
+        self.n_periods = 0
+        self.mean = np.zeros(n)
+        self.scatter = np.zeros((n, n))
+        self.sum_time_log = np.zeros(n)
+        self.first = log_m_xt[:, 0].copy()
+        self.last = None
+
+        self.append(log_m_xt)
+
+    def append(self, log_m_xt):
+        log_m_xt = np.asarray(log_m_xt, dtype=np.float64)
+        if log_m_xt.ndim == 1:
+            log_m_xt = log_m_xt[:, np.newaxis]
+        m, k = self.n_periods, log_m_xt.shape[1]
+
+        block_mean = log_m_xt.mean(axis=1)
+        block_centered = log_m_xt - block_mean[:, np.newaxis]
+        delta = block_mean - self.mean
+
+        self.scatter += block_centered @ block_centered.T + np.outer(delta, delta) * (m * k / (m + k))
+        self.mean = self.mean + delta * (k / (m + k))
+        self.sum_time_log += log_m_xt @ np.arange(m, m + k)
+        self.last = log_m_xt[:, -1].copy()
+        self.n_periods = m + k
+
+        return self
+
+    def parameters(self):
+        _, eigenvectors = np.linalg.eigh(self.scatter)
+        u = eigenvectors[:, -1]
+        return self.mean, u / u.sum()
+
+    # kt est la projection des log taux centrés sur bx (la moyenne des kt sur les périodes vues est nulle)
+    def kt(self, log_m_xt):
+        ax, bx = self.parameters()
+        return bx @ (np.asarray(log_m_xt, dtype=np.float64) - ax[:, np.newaxis]) / (bx @ bx)
+
+    # Tendance linéaire de kt en t = 0, 1, ... (comme fit_linear_trends) et dérive de la marche aléatoire, sans relire l'historique
+    def kt_trend(self):
+        ax, bx = self.parameters()
+        m = self.n_periods
+        t = np.arange(m)
+
+        sum_time_kt = bx @ (self.sum_time_log - ax * t.sum()) / (bx @ bx)
+        beta = sum_time_kt / np.sum((t - t.mean()) ** 2)
+        alpha = -beta * t.mean()
+        drift = bx @ (self.last - self.first) / (bx @ bx) / (m - 1)
+
+        return alpha, beta, drift
+
+    # Prévision de kt pour les horizon périodes suivantes, par régression linéaire ('linear') ou marche aléatoire avec dérive ('drift')
+    def forecast_kt(self, horizon, method='linear'):
+        alpha, beta, drift = self.kt_trend()
+        steps = np.arange(1, horizon + 1)
+
+        if method == 'linear':
+            return alpha + beta * (self.n_periods - 1 + steps)
+        if method == 'drift':
+            return self.kt(self.last[:, np.newaxis])[0] + drift * steps
+        raise ValueError(f"method doit valoir 'linear' ou 'drift', pas {method!r}")
+
+# Modèle cohérent de Li et Lee : log m_pxt = a_px + Bx Kt + b_px k_pt. Le facteur commun Bx Kt est partagé par toutes les populations
+# et les facteurs b_px k_pt ne décrivent que l'écart de chaque population à la tendance commune. Comme Li et Lee, on estime en deux
+# temps (un ajustement joint glisse le long de la direction où Kt et les k_pt se compensent) : le facteur commun est le premier
+# triplet singulier de la moyenne des log taux centrés des populations observées à chaque case, puis les facteurs propres sont
+# ajustés en un seul appel à lee_carter_batch sur la pile des résidus, qui tient compte du masque (périodes de prédiction des Maori
+# par exemple). Kt est défini sur toutes les périodes où au moins une population est observée.
+def li_lee(log_m_pxt, mask=None, max_iter=100, tol=1e-6, svd_method='auto'):
+    log_m_pxt = np.asarray(log_m_pxt, dtype=np.float64)
+    P, n, m = log_m_pxt.shape
+
+    if mask is None:
+        mask = np.isfinite(log_m_pxt)
+    mask = np.broadcast_to(mask if np.ndim(mask) == 3 else np.asarray(mask)[:, np.newaxis, :], log_m_pxt.shape)
+    W = mask.astype(np.float64)
+    L = np.where(mask, log_m_pxt, 0.0)
+
+    common_periods = mask.any(axis=(0, 1))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ax = L.sum(axis=2) / W.sum(axis=2)
+        pooled = np.nan_to_num(np.sum(W * (L - ax[:, :, np.newaxis]), axis=0) / W.sum(axis=0))
+
+    # Le décalage que la normalisation retire de Kt reste dans les résidus ci-dessous : lee_carter_batch le reporte sur residual_ax
+    U, sigma, Vt = truncated_svd(pooled, rank=1, method=svd_method)
+    _, (Bx,), (Kt,) = normalize_lee_carter(
+        np.zeros((1, n)), U[np.newaxis, :, 0], sigma[0] * Vt[np.newaxis, 0], common_periods[np.newaxis])
+
+    residual_ax, bx, kt, trace = lee_carter_batch(
+        np.where(mask, L - ax[:, :, np.newaxis] - np.outer(Bx, Kt), np.nan), mask=mask, max_iter=max_iter, tol=tol, svd_method=svd_method)
+    ax = ax + residual_ax
+
+    return ax, Bx, Kt, bx, kt, trace
+
+# Estimation de Lee Carter par maximum de vraisemblance de Poisson (modèle log-bilinéaire de Brouhns, Denuit et Vermunt) :
+# D_xt ~ Poisson(E_xt exp(ax + bx kt)). Chaque groupe de paramètres est mis à jour par une étape de Newton sur toute la matrice,
+# en partant de la solution SVD. Même interface que lee_carter_newton_raphson : on renvoie ax, bx, kt et la trace des itérations.
+def lee_carter_poisson(D_xt, E_xt, max_iter=500, tol=1e-6):
+    D_xt = np.asarray(D_xt, dtype=np.float64)
+    E_xt = np.asarray(E_xt, dtype=np.float64)
+
+    # Les cases sans décès ou sans population observés ne participent pas à la vraisemblance. Une case observée avec zéro décès y
+    # participe : ce masque sert aux mises à jour comme à la déviance.
+    W = np.isfinite(D_xt) & np.isfinite(E_xt) & (E_xt > 0)
+    D_xt = np.where(W, D_xt, 0.0)
+    E_xt = np.where(W, E_xt, 0.0)
+
+    # Point de départ : solution SVD sur le logarithme des taux observés, sans les cases à zéro décès dont le logarithme est infini
+    with np.errstate(divide='ignore'):
+        log_m_xt = np.log(D_xt / np.where(W, E_xt, 1.0))
+    start_mask = W & np.isfinite(log_m_xt)
+    ax, bx, kt, _ = lee_carter_batch(log_m_xt[np.newaxis], mask=start_mask[np.newaxis], max_iter=0)
+    ax, bx, kt = ax[0], bx[0], np.nan_to_num(kt[0])
+
+    def expected_deaths(ax, bx, kt):
+        return E_xt * np.exp(ax[:, np.newaxis] + bx[:, np.newaxis] * kt)
+
+    def deviance(D_hat):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_ratio = np.where(D_xt > 0, np.log(D_xt / D_hat), 0.0)
+        return 2 * np.sum(np.where(W, D_xt * log_ratio - (D_xt - D_hat), 0.0))
+
+    trace = []
+    start_time = time.perf_counter()
+    converged = False
+
+    for iteration in range(max_iter):
+        ax_old, bx_old, kt_old = ax, bx, kt
+
+        D_hat = expected_deaths(ax, bx, kt)
+        ax = ax + (D_xt - D_hat).sum(axis=1) / D_hat.sum(axis=1)
+
+        D_hat = expected_deaths(ax, bx, kt)
+        kt = kt + bx @ (D_xt - D_hat) / (bx ** 2 @ D_hat)
+
+        D_hat = expected_deaths(ax, bx, kt)
+        bx = bx + (D_xt - D_hat) @ kt / (D_hat @ kt ** 2)
+
+        # On renormalise à chaque itération pour que les écarts entre deux itérations soient comparables
+        ax, bx, kt = (values[0] for values in normalize_lee_carter(
+            ax[np.newaxis], bx[np.newaxis], kt[np.newaxis], W.any(axis=0)[np.newaxis]))
+
+        trace.append({
+            'iteration': iteration + 1,
+            'delta_ax': np.max(np.abs(ax - ax_old)),
+            'delta_bx': np.max(np.abs(bx - bx_old)),
+            'delta_kt': np.max(np.abs(kt - kt_old)),
+            'objective': deviance(expected_deaths(ax, bx, kt)),
+            'wall_time': time.perf_counter() - start_time
+        })
+
+        if (trace[-1]['delta_ax'] < tol and
+            trace[-1]['delta_bx'] < tol and
+            trace[-1]['delta_kt'] < tol):
+            converged = True
+            break
+
+    trace = pd.DataFrame(trace, columns=['iteration', 'delta_ax', 'delta_bx', 'delta_kt', 'objective', 'wall_time']).set_index('iteration')
+    trace.attrs['converged'] = converged
+
+    return ax, bx, kt, trace
@@ -0,0 +1,79 @@
+"""Tables de mortalité (lx, dx, Lx, Tx, ex) et facteurs de rente viagère, du moment et par génération"""
+
+import numpy as np
+
+# Bornes des groupes d'âge à partir de leurs libellés : groupes ('0', '01-04', ..., '95-99'), âges simples ('0', '1', ..., '109')
+# et groupe ouvert ('95+', '110+') dont la borne supérieure est infinie
+def age_group_bounds(age_groups):
+    labels = [str(group).strip() for group in age_groups]
+    lower_bounds = np.array([int(label.split('-')[0].rstrip('+')) for label in labels], dtype=np.float64)
+    upper_bounds = np.array([np.inf if label.endswith('+') else int(label.split('-')[-1]) for label in labels], dtype=np.float64)
+    return lower_bounds, upper_bounds
+
+# Largeur des groupes d'âge. Le dernier groupe est traité comme un groupe ouvert (largeur infinie) : soit il l'est ('95+'),
+# soit les âges plus élevés ont été retirés.
+def age_group_widths(age_groups):
+    lower_bounds, _ = age_group_bounds(age_groups)
+    return np.append(np.diff(lower_bounds), np.inf)
+
+# Âge moyen de chaque groupe ((début + fin) / 2, l'âge lui-même pour un âge simple). Pour le groupe ouvert on prend le milieu d'un
+# groupe de même largeur que le précédent.
+def age_group_midpoints(age_groups):
+    lower_bounds, upper_bounds = age_group_bounds(age_groups)
+    if len(lower_bounds) > 1 and np.isinf(upper_bounds[-1]):
+        upper_bounds[-1] = lower_bounds[-1] + lower_bounds[-1] - lower_bounds[-2] - 1
+    return (lower_bounds + np.where(np.isinf(upper_bounds), lower_bounds, upper_bounds)) / 2
+
+# Table de mortalité à partir des taux de décès (force de mortalité supposée constante dans chaque groupe d'âge). death_rates est de taille
+# (..., âge, période), par exemple âge × période ou trajectoire × âge × période : les produits cumulés sont faits sur l'axe des âges
+# pour toutes les périodes et toutes les trajectoires à la fois.
+# kind='period' donne la table du moment de chaque période. kind='cohort' suit en diagonale la génération qui a le premier âge pendant
+# chaque période (une période de plus tous les period_width ans d'âge) : les générations qui sortent des périodes disponibles donnent des NaN.
+# Les âges des groupes sont retrouvés à partir de first_age, l'âge du premier groupe (0 pour une table complète, 65 pour une table
+# qui commence à 65 ans), et des largeurs age_widths.
+# Avec interest_rate on ajoute les facteurs de rente viagère continue, qui sont l'espérance de vie calculée avec la force de mortalité
+# augmentée de la force d'intérêt log(1 + i). Une force nulle donne la limite lx × largeur pour Lx.
+def life_table(death_rates, age_widths, kind='period', period_width=5, interest_rate=None, radix=1.0, first_age=0):
+    death_rates = np.asarray(death_rates, dtype=np.float64)
+    widths = np.asarray(age_widths, dtype=np.float64)
+    n, m = death_rates.shape[-2:]
+
+    if kind == 'cohort':
+        lower_bounds = first_age + np.concatenate([[0.0], np.cumsum(widths[:-1])])
+        offsets = (lower_bounds // period_width - first_age // period_width).astype(int)
+        periods = np.arange(m)[np.newaxis, :] + offsets[:, np.newaxis]
+        death_rates = np.where(periods < m, death_rates[..., np.arange(n)[:, np.newaxis], np.minimum(periods, m - 1)], np.nan)
+    elif kind != 'period':
+        raise ValueError(f"kind doit valoir 'period' ou 'cohort', pas {kind!r}")
+
+    def survivorship(forces):
+        survival = np.exp(-widths[:, np.newaxis] * forces)
+        lx = np.cumprod(survival, axis=-2)
+        lx = np.concatenate([np.ones_like(lx[..., :1, :]), lx[..., :-1, :]], axis=-2)
+
+        # Nombre d'années vécues dans chaque groupe : lx (1 - px) / mu, ce qui donne lx / mu pour le groupe ouvert,
+        # et sa limite lx × largeur quand mu est nul
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Lx = np.where(forces != 0, lx * (1 - survival) / forces, lx * widths[:, np.newaxis])
+        Tx = np.flip(np.cumsum(np.flip(Lx, axis=-2), axis=-2), axis=-2)
+
+        return lx, survival, Lx, Tx
+
+    lx, survival, Lx, Tx = survivorship(death_rates)
+    table = {
+        'lx': radix * lx,
+        'dx': radix * lx * (1 - survival),
+        'Lx': radix * Lx,
+        'Tx': radix * Tx,
+        'ex': Tx / lx
+    }
+
+    if interest_rate is not None:
+        discounted_lx, _, _, discounted_Tx = survivorship(death_rates + np.log1p(interest_rate))
+        table['annuity'] = discounted_Tx / discounted_lx
+
+    return table
+
+# Espérance de vie du moment à partir des taux de décès, de taille (..., âge, période)
+def period_life_expectancy(death_rates, age_widths):
+    return life_table(death_rates, age_widths)['ex']
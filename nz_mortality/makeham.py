@@ -0,0 +1,88 @@
+"""Ajustement du modèle de Gompertz-Makeham m(x) = A + B exp(Cx) période par période
+
+scipy.optimize n'est importé qu'au premier ajustement.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+def gompertz_makeham(x, A, B, C):
+    return A + B * np.exp(C * x)
+
+# Jacobien analytique de A + B exp(Cx) par rapport à (A, B, C)
+def gompertz_makeham_jacobian(x, A, B, C):
+    exp_Cx = np.exp(C * x)
+    return np.column_stack([np.ones_like(x), exp_Cx, B * x * exp_Cx])
+
+# Ajustement de Gompertz-Makeham sur chaque période (colonne de death_rates, de taille âge × période) : chaque période part des paramètres
+# (A, B, C) de la période précédente. On renvoie les paramètres (période × 3) et leurs matrices de covariance (période × 3 × 3).
+def fit_gompertz_makeham(age_midpoints, death_rates, p0=None):
+    from scipy.optimize import curve_fit
+
+    death_rates = np.asarray(death_rates, dtype=np.float64)
+    n_periods = death_rates.shape[1]
+
+    params = np.empty((n_periods, 3))
+    covariances = np.empty((n_periods, 3, 3))
+
+    for t in range(n_periods):
+        popt, pcov = curve_fit(gompertz_makeham, age_midpoints, death_rates[:, t], p0=p0,
+                               jac=gompertz_makeham_jacobian, bounds=(0, np.inf))
+        params[t] = popt
+        covariances[t] = pcov
+        p0 = popt
+
+    return params, covariances
+
+def fit_gompertz_makeham_chunk(task):
+    age_midpoints, death_rates = task
+    return fit_gompertz_makeham(age_midpoints, death_rates)
+
+# Ajustement de plusieurs populations en parallèle. Les périodes de chaque population sont découpées en blocs consécutifs
+# (au plus un bloc par processus disponible) : les départs à chaud se font à l'intérieur de chaque bloc et les blocs sont répartis sur les processus.
+# Avec un cache, seules les populations dont la matrice n'a pas déjà été ajustée sont recalculées.
+# On renvoie des tableaux population × période × 3 et population × période × 3 × 3.
+def fit_gompertz_makeham_populations(age_midpoints, death_rate_matrices, n_jobs=None, cache=None):
+    death_rate_matrices = [np.asarray(matrix, dtype=np.float64) for matrix in death_rate_matrices]
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    cached_fits = {}
+    if cache is not None:
+        keys = [cache.key(fit_gompertz_makeham, age_midpoints, matrix) for matrix in death_rate_matrices]
+        for p, key in enumerate(keys):
+            found, fit = cache.get(key)
+            if found:
+                cached_fits[p] = fit
+    pending = [p for p in range(len(death_rate_matrices)) if p not in cached_fits]
+
+    chunks_per_population = max(1, n_jobs // max(len(pending), 1))
+    tasks = []
+    for p in pending:
+        matrix = death_rate_matrices[p]
+        for periods in np.array_split(np.arange(matrix.shape[1]), min(chunks_per_population, matrix.shape[1])):
+            tasks.append((p, periods, (age_midpoints, matrix[:, periods])))
+
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = [fit_gompertz_makeham_chunk(task) for _, _, task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as executor:
+            results = list(executor.map(fit_gompertz_makeham_chunk, [task for _, _, task in tasks]))
+
+    n_periods = max(matrix.shape[1] for matrix in death_rate_matrices)
+    params = np.full((len(death_rate_matrices), n_periods, 3), np.nan)
+    covariances = np.full((len(death_rate_matrices), n_periods, 3, 3), np.nan)
+    for (p, periods, _), (chunk_params, chunk_covariances) in zip(tasks, results):
+        params[p, periods] = chunk_params
+        covariances[p, periods] = chunk_covariances
+
+    for p, (population_params, population_covariances) in cached_fits.items():
+        params[p, :len(population_params)] = population_params
+        covariances[p, :len(population_params)] = population_covariances
+    if cache is not None:
+        for p in pending:
+            n_population_periods = death_rate_matrices[p].shape[1]
+            cache.put(keys[p], (params[p, :n_population_periods], covariances[p, :n_population_periods]))
+
+    return params, covariances
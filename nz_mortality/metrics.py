@@ -0,0 +1,137 @@
+"""Mesures d'erreur (MAPE, MAD, RMSE, erreur logarithmique) et diagnostics de la régression linéaire de kt"""
+
+import numpy as np
+import pandas as pd
+
+from .projection import fit_linear_trends
+
+def calculate_mape(actual_df, forecast_df):
+    mape = np.mean(np.abs((actual_df.values - forecast_df.values) / actual_df.values)) * 100
+    return mape
+
+# Bornes des intervalles d'interprétation du MAPE, utilisées avec np.digitize
+MAPE_BANDS = [10, 20, 50]
+
+MAPE_INTERPRETATIONS = np.array([
+    "Estimation très précise (MAPE < 10%).",
+    "Bonne estimation (10% <= MAPE < 20%).",
+    "Estimation raisonnable (20% <= MAPE < 50%).",
+    "Estimation peu précise (MAPE >= 50%)."
+])
+
+def interpret_mape(mape):
+    return MAPE_INTERPRETATIONS[np.digitize(mape, MAPE_BANDS)]
+
+# Moyenne sur les axes donnés en ignorant les NaN (périodes absentes), sans avertissement quand toutes les valeurs manquent
+def masked_mean(values, axis):
+    valid = np.isfinite(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sum(np.where(valid, values, 0.0), axis=axis) / np.sum(valid, axis=axis)
+
+# Calcul de toutes les mesures d'erreur en une seule passe. actual et forecast sont des tableaux modèle × population × âge × période
+# (actual peut être population × âge × période et est alors le même pour tous les modèles). Les cases NaN sont ignorées.
+# On renvoie un seul tableau avec une ligne par modèle, population et groupe d'âge, plus une ligne 'Tous' pour l'ensemble des âges.
+def compute_error_metrics(actual, forecast, models, populations, ages):
+    forecast = np.asarray(forecast, dtype=np.float64)
+    actual = np.broadcast_to(np.asarray(actual, dtype=np.float64), forecast.shape)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        errors = forecast - actual
+        relative_errors = np.abs(errors / actual)
+        log_errors = np.abs(np.log(forecast / actual))
+
+    metrics = {}
+    for name, values in [('MAPE', relative_errors * 100), ('MAD', np.abs(errors)), ('RMSE', errors ** 2), ('Log Error', log_errors)]:
+        # Par groupe d'âge (moyenne sur les périodes) puis sur tous les âges et toutes les périodes
+        per_age = masked_mean(values, axis=-1)
+        overall = masked_mean(values, axis=(-2, -1))
+        metrics[name] = np.concatenate([per_age, overall[..., np.newaxis]], axis=-1)
+    metrics['RMSE'] = np.sqrt(metrics['RMSE'])
+
+    M, P, n = metrics['MAPE'].shape
+    results_df = pd.DataFrame({
+        'Model': np.repeat(models, P * n),
+        'Population': np.tile(np.repeat(populations, n), M),
+        'Age': np.tile(list(ages) + ['Tous'], M * P),
+        **{name: values.ravel() for name, values in metrics.items()}
+    })
+    results_df['Interpretation'] = np.where(
+        np.isfinite(results_df['MAPE']),
+        MAPE_INTERPRETATIONS[np.digitize(np.nan_to_num(results_df['MAPE'], nan=0.0), MAPE_BANDS)],
+        None
+    )
+
+    return results_df
+
+# Empile des dataframes âge × période (listes éventuellement imbriquées, par exemple [modèle][population]) dans un seul tableau numpy.
+# Les périodes absentes d'un dataframe et les combinaisons non calculées (None) sont remplies de NaN.
+def stack_frames(frames, ages, periods):
+    if frames is None:
+        return np.full((len(ages), len(periods)), np.nan)
+    if isinstance(frames, pd.DataFrame):
+        return frames.reindex(index=ages, columns=periods).to_numpy(dtype=np.float64)
+    return np.stack([stack_frames(frame, ages, periods) for frame in frames])
+
+def calculate_mape_per_age_group(actual_df, forecast_df):
+
+    mape_series = np.mean(np.abs((actual_df - forecast_df) / actual_df), axis=1) * 100
+
+    return mape_series
+
+# Diagnostics de la régression linéaire de kt sur le temps pour chaque série de kt (tableau (..., période), NaN en fin de série ignorés) :
+# R², corrélation, Durbin-Watson, test F, Kolmogorov-Smirnov des résidus standardisés et Breusch-Pagan (version de Koenker, comme
+# het_breuschpagan de statsmodels). On renvoie un tableau avec une ligne par série.
+def regression_diagnostics(kt):
+    from scipy import stats
+
+    # Les séries vides (aucune période observée) donnent des NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha, beta, residuals, W = fit_linear_trends(kt)
+        kt = np.where(W, kt, 0.0)
+        n = W.sum(axis=-1)
+
+        # Correlation (r), Coefficient de Determination (r²), et Durbin-Watson Test
+        ssr = np.sum(residuals ** 2, axis=-1)
+        sst = np.sum(np.where(W, kt - (kt.sum(axis=-1) / n)[..., np.newaxis], 0.0) ** 2, axis=-1)
+        r_squared = 1 - ssr / sst
+        correlation = np.sign(beta) * np.sqrt(r_squared)
+        consecutive = W[..., 1:] & W[..., :-1]
+        dw_statistic = np.sum(np.where(consecutive, np.diff(residuals, axis=-1), 0.0) ** 2, axis=-1) / ssr
+
+        # F-Test
+        f_value = (sst - ssr) / (ssr / (n - 2))
+        p_value_f_test = stats.f.sf(f_value, 1, n - 2)
+
+        # Kolmogorov-Smirnov : loi normale de même moyenne et même écart-type que les résidus, p-value exacte
+        mean = residuals.sum(axis=-1) / n
+        std = np.sqrt(np.sum(np.where(W, residuals - mean[..., np.newaxis], 0.0) ** 2, axis=-1) / n)
+        cdf = stats.norm.cdf(np.sort(np.where(W, (residuals - mean[..., np.newaxis]) / std[..., np.newaxis], np.inf), axis=-1))
+        rank = np.arange(1, kt.shape[-1] + 1)
+        sorted_valid = rank <= n[..., np.newaxis]
+        ks_statistic = np.maximum(
+            np.max(np.where(sorted_valid, rank / n[..., np.newaxis] - cdf, -np.inf), axis=-1),
+            np.max(np.where(sorted_valid, cdf - (rank - 1) / n[..., np.newaxis], -np.inf), axis=-1)
+        )
+        p_value_ks = stats.kstwo.sf(ks_statistic, n)
+
+        # Test de Breusch-Pagan : n fois le R² de la régression des carrés des résidus sur le temps
+        squared_residuals = np.where(W, residuals ** 2, np.nan)
+        _, _, auxiliary_residuals, _ = fit_linear_trends(squared_residuals)
+        auxiliary_sst = np.sum(np.where(W, squared_residuals - (ssr / n)[..., np.newaxis], 0.0) ** 2, axis=-1)
+        bp_statistic = n * (1 - np.sum(auxiliary_residuals ** 2, axis=-1) / auxiliary_sst)
+        p_value_bp = stats.chi2.sf(bp_statistic, 1)
+
+    return pd.DataFrame({
+        'n': n.ravel(),
+        'alpha': alpha.ravel(),
+        'beta': beta.ravel(),
+        'R-squared': r_squared.ravel(),
+        'Correlation': correlation.ravel(),
+        'Durbin-Watson': dw_statistic.ravel(),
+        'F-statistic': f_value.ravel(),
+        'F p-value': p_value_f_test.ravel(),
+        'KS-statistic': ks_statistic.ravel(),
+        'KS p-value': p_value_ks.ravel(),
+        'BP-statistic': bp_statistic.ravel(),
+        'BP p-value': p_value_bp.ravel()
+    })
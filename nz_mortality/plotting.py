@@ -0,0 +1,177 @@
+"""Rendu des graphiques
+
+Les graphiques ne sont pas affichés au fil des calculs : chaque graphique est mis dans une file d'attente avec ses données, puis tous les graphiques sont dessinés à la fin, sans interface graphique, par des processus séparés qui écrivent des fichiers PNG dans PLOT_OUTPUT_DIR. Les graphiques d'un même type réutilisent la même figure et on ne fait que mettre à jour les données des courbes (set_data). matplotlib n'est importé qu'au moment du rendu.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .metrics import interpret_mape
+
+PLOT_OUTPUT_DIR = 'figures'
+
+class FigureQueue:
+
+    def __init__(self):
+        self.jobs = []
+
+    def add(self, kind, filename, **data):
+        self.jobs.append(dict(data, kind=kind, filename=filename))
+
+    def render(self, output_dir=PLOT_OUTPUT_DIR, n_jobs=None, skip=False):
+        jobs, self.jobs = self.jobs, []
+        if skip or not jobs:
+            return []
+
+        os.makedirs(output_dir, exist_ok=True)
+        if n_jobs is None:
+            n_jobs = os.cpu_count() or 1
+
+        # On garde ensemble les graphiques d'un même type pour réutiliser leur figure, chaque type étant découpé en au plus n_jobs lots
+        batches = []
+        for kind in dict.fromkeys(job['kind'] for job in jobs):
+            kind_jobs = [job for job in jobs if job['kind'] == kind]
+            for chunk in np.array_split(np.arange(len(kind_jobs)), min(n_jobs, len(kind_jobs))):
+                batches.append(([kind_jobs[k] for k in chunk], output_dir))
+
+        if n_jobs == 1 or len(batches) == 1:
+            paths = [render_figure_batch(batch) for batch in batches]
+        else:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(batches))) as executor:
+                paths = list(executor.map(render_figure_batch, batches))
+
+        return [path for batch_paths in paths for path in batch_paths]
+
+figures = FigureQueue()
+
+# La figure n'est réutilisée que pour les mêmes groupes d'âge : les barres sont placées sur un axe catégoriel dont les libellés
+# sont fixés à la création
+def draw_mape_bars(job, figure, artists):
+    if figure is None or artists[2] != list(job['labels']):
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=(12, 8))
+        ax = figure.subplots()
+        bars = ax.bar(job['labels'], job['values'])
+
+        ax.set_title("MAPE par groupe d'âge", fontsize=16)
+        ax.set_xlabel('Age Group', fontsize=14)
+        ax.set_ylabel('MAPE (%)', fontsize=14)
+        ax.tick_params(axis='x', labelrotation=45)
+        artists = (ax, bars, list(job['labels']))
+
+    ax, bars, _ = artists
+    for bar, value, color in zip(bars, job['values'], job['colors']):
+        bar.set_height(value)
+        bar.set_color(color)
+    ax.set_ylim(0, max(job['values']) + 10)
+
+    return figure, artists
+
+def draw_age_group_grid(job, figure, artists):
+    n = len(job['age_groups'])
+    if figure is None or len(artists) != n:
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=(10, 5 * n))
+        axes = figure.subplots(n, 1, sharex=True)
+        artists = [(ax, ax.plot([], [], label='Actual', color='green')[0], ax.plot([], [], label='Estimate', color='blue')[0]) for ax in axes]
+
+    x = np.arange(len(job['periods']))
+    for (ax, actual_line, estimated_line), age_group, actual, estimated in zip(artists, job['age_groups'], job['actual'], job['estimated']):
+        actual_line.set_data(x, actual)
+        estimated_line.set_data(x, estimated)
+        ax.set_title(f"{job['title_prefix']} {age_group}")
+        ax.set_xlabel(job['xlabel'])
+        ax.set_ylabel(job['ylabel'])
+        ax.set_xticks(x, job['periods'])
+        ax.relim()
+        ax.autoscale_view()
+        ax.legend()
+
+    return figure, artists
+
+# Les couleurs, le style et la taille sont fixés à la création des courbes : ils font partie de la clé de réutilisation de la figure.
+# Les libellés des graduations et des courbes sont remis à jour à chaque graphique.
+def draw_age_curves(job, figure, artists):
+    key = (list(job['colors']), repr(job.get('style', {})), job.get('figsize', (10, 6)))
+    if figure is None or artists[2] != key:
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=job.get('figsize', (10, 6)))
+        ax = figure.subplots()
+        lines = [ax.plot([], [], **job.get('style', {}), color=color)[0] for color in job['colors']]
+        artists = (ax, lines, key)
+
+    ax, lines, _ = artists
+    for line, y, label in zip(lines, job['curves'], job['labels']):
+        line.set_data(job['x'], y)
+        line.set_label(label)
+    ax.set_title(job['title'])
+    ax.set_xlabel(job['xlabel'])
+    ax.set_ylabel(job['ylabel'])
+    ax.set_xticks(job['x'], job['xticklabels'], rotation=45)
+    ax.relim()
+    ax.autoscale_view()
+    ax.legend()
+
+    return figure, artists
+
+FIGURE_RENDERERS = {
+    'mape_bars': draw_mape_bars,
+    'age_group_grid': draw_age_group_grid,
+    'age_curves': draw_age_curves,
+    'prediction_comparison': draw_age_curves
+}
+
+# Rendu d'un lot de graphiques dans un processus : la figure et ses artistes sont conservés d'un graphique à l'autre du même type
+def render_figure_batch(batch):
+    jobs, output_dir = batch
+
+    paths = []
+    figure, artists, kind = None, None, None
+    for job in jobs:
+        if job['kind'] != kind:
+            figure, artists, kind = None, None, job['kind']
+        figure, artists = FIGURE_RENDERERS[kind](job, figure, artists)
+
+        figure.tight_layout()
+        path = os.path.join(output_dir, job['filename'])
+        figure.savefig(path)
+        paths.append(path)
+
+    return paths
+
+def plot_mape_per_age_group(mape_series, filename='mape_par_groupe_age.png'):
+
+    interpretations = [interpret_mape(mape) for mape in mape_series]
+
+    colors = ['green' if "Estimation très précise (MAPE < 10%)." in interp else
+              'yellow' if "Bonne estimation (10% <= MAPE < 20%)." in interp else
+              'orange' if "Estimation raisonnable (20% <= MAPE < 50%)." in interp else
+              'red' for interp in interpretations]
+
+    figures.add('mape_bars', filename, labels=list(mape_series.index), values=np.asarray(mape_series.values, dtype=np.float64), colors=colors)
+
+def plot_actual_vs_estimate_per_age_group(actual_df, estimated_df, filename, title_prefix='Group age', xlabel='Year', ylabel='Mortality Rate'):
+    figures.add(
+        'age_group_grid', filename,
+        age_groups=list(actual_df.index), periods=list(actual_df.columns),
+        actual=np.asarray(actual_df, dtype=np.float64), estimated=np.asarray(estimated_df, dtype=np.float64),
+        title_prefix=title_prefix, xlabel=xlabel, ylabel=ylabel
+    )
+
+def plot_death_rates_comparison(actual_df, forecast_df, title="Comparaison entre le taux de mortalité prédit et le taux actuel", filename='comparaison_prediction.png'):
+    actual = np.asarray(actual_df, dtype=np.float64).T
+    forecast = np.asarray(forecast_df, dtype=np.float64).T
+
+    figures.add(
+        'prediction_comparison', filename,
+        x=np.arange(len(actual_df.index)), xticklabels=list(actual_df.index),
+        curves=[*actual, *forecast],
+        labels=['Actuel'] * len(actual) + ['Prévisionnel'] * len(forecast),
+        colors=['blue'] * len(actual) + ['orange'] * len(forecast),
+        style={'marker': 'o'},
+        title=title, xlabel='Age du groupe', ylabel='Taux de mortalité'
+    )
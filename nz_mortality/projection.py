@@ -0,0 +1,109 @@
+"""Prévision de kt par régression linéaire et projection des taux de décès et de mortalité
+
+Ce module ne dépend que de numpy (pandas n'est importé que par Prediction_death_rates) : il peut être importé sans payer le coût de statsmodels, scipy ou matplotlib.
+"""
+
+import warnings
+import numpy as np
+
+def create_sequential_time_variable(time_periods):
+    return np.arange(len(time_periods)).reshape(-1, 1)
+
+# Régression linéaire de kt sur l'indice de période t = 0, 1, ... par les formules fermées des moindres carrés.
+# kt est de taille (..., période) : toutes les séries sont ajustées à la fois, les valeurs NaN (périodes absentes en fin de série) sont ignorées.
+# On renvoie l'intercept, la pente, les résidus (nuls sur les périodes absentes) et le masque des périodes observées.
+def fit_linear_trends(kt):
+    kt = np.asarray(kt, dtype=np.float64)
+    W = np.isfinite(kt)
+    y = np.where(W, kt, 0.0)
+    t = np.where(W, np.arange(kt.shape[-1], dtype=np.float64), 0.0)
+
+    n = W.sum(axis=-1)
+    sum_t, sum_y = t.sum(axis=-1), y.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = (n * np.sum(t * y, axis=-1) - sum_t * sum_y) / (n * np.sum(t * t, axis=-1) - sum_t ** 2)
+        alpha = (sum_y - beta * sum_t) / n
+
+    residuals = np.where(W, y - alpha[..., np.newaxis] - beta[..., np.newaxis] * t, 0.0)
+
+    return alpha, beta, residuals, W
+
+def linear_regression(kt, time_periods, periods_to_forecast=2):
+
+    #On applique la régression linéaire
+    alpha, beta, _, _ = fit_linear_trends(kt)
+
+    # Forecast future periods based on the sequential index
+    t_future = np.arange(len(time_periods), len(time_periods) + periods_to_forecast)
+    RL_prevision_kt = alpha + beta * t_future
+
+    return RL_prevision_kt, alpha, beta
+
+# Moteur de projection : la surface âge × horizon est le produit extérieur bx kt, calculé pour toutes les trajectoires de kt à la fois.
+# kt peut être un vecteur (horizon) ou un tableau (trajectoires × horizon), le résultat est alors de taille (trajectoires × âge × horizon).
+# Les calculs se font dans le tableau de sortie, que l'on peut fournir déjà alloué avec out.
+def project_death_rates(ax, bx, kt, out=None):
+    ax = np.asarray(ax, dtype=np.float64)
+    bx = np.asarray(bx, dtype=np.float64)
+    kt = np.asarray(kt, dtype=np.float64)
+
+    if out is None:
+        out = np.empty(kt.shape[:-1] + (len(ax), kt.shape[-1]), dtype=np.float64)
+
+    np.multiply(bx[:, np.newaxis], kt[..., np.newaxis, :], out=out)
+    out += ax[:, np.newaxis]
+    np.exp(out, out=out)
+
+    return out
+
+# Même projection convertie en taux de mortalité 1 - exp(-m) = -expm1(-m) sans tableau intermédiaire
+def project_mortality_rates(ax, bx, kt, out=None):
+    out = project_death_rates(ax, bx, kt, out=out)
+
+    np.negative(out, out=out)
+    np.expm1(out, out=out)
+    np.negative(out, out=out)
+
+    return out
+
+# Projection cohérente du modèle de Li et Lee : Kt suit une marche aléatoire avec dérive et chaque k_pt un AR(1) sans constante
+# k_pt = phi_p k_p(t-1), estimé sur ses périodes observées. Avec |phi_p| < 1 les écarts entre populations restent bornés et les
+# projections ne divergent pas : un phi_p estimé hors de [-max_phi, max_phi] est ramené à cette borne avec un avertissement.
+# Une population sans deux périodes observées consécutives (ou avec k_pt nul) n'a pas d'AR(1) estimable : phi_p vaut 0 et k_pt
+# revient à zéro, la population suit alors la tendance commune. kt peut contenir des NaN en fin de série (périodes masquées) :
+# k_pt est alors prolongé par l'AR(1) dès sa dernière période observée, alors que Kt est connu jusqu'à la fin de l'ajustement.
+# On renvoie les log taux de décès ajustés puis projetés (population × âge × (période + horizon)) et les coefficients phi_p.
+def project_li_lee(ax, Bx, Kt, bx, kt, horizon, max_phi=0.99):
+    ax, Bx, Kt, bx, kt = (np.asarray(values, dtype=np.float64) for values in (ax, Bx, Kt, bx, kt))
+    m = len(Kt)
+
+    drift = (Kt[-1] - Kt[0]) / (m - 1) if m > 1 else 0.0
+    Kt = np.concatenate([Kt, Kt[-1] + drift * np.arange(1, horizon + 1)])
+
+    observed = np.isfinite(kt)
+    pairs = observed[:, 1:] & observed[:, :-1]
+    k = np.where(observed, kt, 0.0)
+    numerator = np.sum(np.where(pairs, k[:, 1:] * k[:, :-1], 0.0), axis=1)
+    denominator = np.sum(np.where(pairs, k[:, :-1] ** 2, 0.0), axis=1)
+    phi = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+    explosive = np.abs(phi) > max_phi
+    if explosive.any():
+        warnings.warn(f"|phi| > {max_phi} pour les populations {np.flatnonzero(explosive).tolist()} : phi est ramené à ±{max_phi}", RuntimeWarning)
+        phi = np.clip(phi, -max_phi, max_phi)
+
+    # Nombre de pas depuis la dernière période observée de chaque population
+    last_observed = m - 1 - np.argmax(observed[:, ::-1], axis=1)
+    steps = np.arange(m + horizon) - last_observed[:, np.newaxis]
+    kt = np.where(steps <= 0, np.pad(k, ((0, 0), (0, horizon))), k[np.arange(len(k)), last_observed][:, np.newaxis] * phi[:, np.newaxis] ** np.maximum(steps, 0))
+
+    log_m_pxt = ax[:, :, np.newaxis] + Bx[:, np.newaxis] * Kt + bx[:, :, np.newaxis] * kt[:, np.newaxis, :]
+
+    return log_m_pxt, phi
+
+def Prediction_death_rates(ax, bx, forecasted_kt, age_groups, prediction_periods):
+    import pandas as pd
+
+    forecasted_kt = np.asarray(forecasted_kt)[:len(prediction_periods)]
+
+    return pd.DataFrame(project_death_rates(ax, bx, forecasted_kt), index=age_groups, columns=prediction_periods)
@@ -0,0 +1,105 @@
+"""Simulation stochastique de kt et intervalles de prédiction par Monte Carlo
+
+On ajuste un processus ARIMA (par défaut une marche aléatoire avec dérive, ARIMA(0,1,0)) sur kt, on simule un grand nombre de trajectoires de kt en un seul tirage par bloc, puis on les projette avec le modèle de Lee Carter pour obtenir des intervalles de prédiction des taux de mortalité et de l'espérance de vie
+"""
+
+import numpy as np
+
+from .life_tables import period_life_expectancy
+from .projection import project_death_rates
+
+# On estime le processus de kt une seule fois. Un ARIMA est linéaire en ses innovations : une trajectoire simulée est la prévision ponctuelle
+# plus les innovations propagées par les poids psi de sa représentation moyenne mobile. Pour une marche aléatoire avec dérive tout est explicite,
+# sinon on ajuste l'ARIMA avec statsmodels et on en déduit la prévision et les poids psi.
+def fit_kt_process(kt, horizon, arima_order=(0, 1, 0), drift=True):
+    kt = np.asarray(kt, dtype=np.float64)
+    p, d, q = arima_order
+
+    if (p, d, q) == (0, 1, 0):
+        differences = np.diff(kt)
+        mu = differences.mean() if drift else 0.0
+        sigma = differences.std(ddof=1) if drift else np.sqrt(np.mean(differences ** 2))
+        forecast = kt[-1] + mu * np.arange(1, horizon + 1)
+        psi = np.ones(horizon)
+    else:
+        from statsmodels.tsa.arima.model import ARIMA
+        from statsmodels.tsa.arima_process import arma2ma
+
+        trend = ('t' if d == 1 else 'c') if drift and d <= 1 else 'n'
+        model_fit = ARIMA(kt, order=arima_order, trend=trend).fit()
+        sigma = np.sqrt(dict(zip(model_fit.model.param_names, model_fit.params))['sigma2'])
+        forecast = np.asarray(model_fit.forecast(steps=horizon))
+
+        psi = arma2ma(np.r_[1, -model_fit.arparams], np.r_[1, model_fit.maparams], lags=horizon)
+        for _ in range(d):
+            psi = np.cumsum(psi)
+
+    # Matrice triangulaire supérieure : l'innovation de la période j agit sur les périodes h >= j avec le poids psi[h - j]
+    lags = np.arange(horizon)[np.newaxis, :] - np.arange(horizon)[:, np.newaxis]
+    propagation = np.where(lags >= 0, psi[np.clip(lags, 0, None)], 0.0)
+
+    return {'forecast': forecast, 'sigma': sigma, 'propagation': propagation}
+
+# Simulation de n_paths trajectoires de kt : toutes les innovations sont tirées en une seule fois et propagées par un seul produit matriciel
+def simulate_kt_paths(process, n_paths, rng):
+    shocks = process['sigma'] * rng.standard_normal((n_paths, len(process['forecast'])))
+
+    return process['forecast'] + shocks @ process['propagation']
+
+# Intervalles de prédiction par Monte Carlo. À chaque horizon h, le taux de mortalité d'un âge x est une fonction monotone du seul kt_h
+# (croissante si bx > 0, décroissante sinon) : ses quantiles empiriques sont ceux de kt_h transportés par le modèle, y compris
+# l'interpolation linéaire entre deux statistiques d'ordre de np.quantile. Il en va de même de l'espérance de vie à l'âge x dès que bx
+# garde le même signe sur les âges >= x. On ne garde donc que les trajectoires de kt (trajectoires × horizon), simulées par blocs de
+# chunk_size, et non les surfaces âge × horizon de chaque trajectoire : la mémoire ne dépend plus du nombre d'âges.
+# Pour les espérances de vie où bx change de signe, la fonction n'est plus monotone : leurs quantiles sont calculés sur les
+# max_stored_paths premières trajectoires (un sous-échantillon aléatoire, les trajectoires étant indépendantes), ce qui borne
+# la mémoire à max_stored_paths × âge × horizon.
+# On renvoie les quantiles (quantile × âge × horizon) des taux de mortalité et de l'espérance de vie à chaque âge.
+def simulate_mortality_fan(ax, bx, kt, horizon, n_paths=10000, arima_order=(0, 1, 0), drift=True,
+                           quantiles=(0.05, 0.5, 0.95), age_widths=None, chunk_size=10000, max_stored_paths=10000, random_state=None):
+    process = fit_kt_process(kt, horizon, arima_order, drift)
+    rng = np.random.default_rng(random_state)
+
+    ax = np.asarray(ax, dtype=np.float64)
+    bx = np.asarray(bx, dtype=np.float64)
+    n = len(ax)
+    if age_widths is None:
+        age_widths = np.append(np.ones(n - 1), np.inf)
+
+    kt_paths = np.empty((n_paths, horizon))
+    for start in range(0, n_paths, chunk_size):
+        size = min(chunk_size, n_paths - start)
+        kt_paths[start:start + size] = simulate_kt_paths(process, size, rng)
+    sample = kt_paths[:max_stored_paths].copy()
+    kt_paths.sort(axis=0)
+
+    # Position de chaque quantile parmi les statistiques d'ordre, comme la méthode linéaire de np.quantile
+    positions = np.asarray(quantiles, dtype=np.float64) * (n_paths - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, n_paths - 1)
+    fraction = (positions - lower)[:, np.newaxis, np.newaxis]
+
+    # Statistiques d'ordre de kt qui encadrent chaque quantile, pour une fonction croissante puis décroissante de kt
+    kt_bounds = np.stack([kt_paths[lower], kt_paths[upper], kt_paths[n_paths - 1 - lower], kt_paths[n_paths - 1 - upper]])
+    death_rates = project_death_rates(ax, bx, kt_bounds)
+    life_expectancy = period_life_expectancy(death_rates, age_widths)
+    mortality = -np.expm1(-death_rates)
+
+    def interpolate(values, increasing):
+        rising = values[0] + fraction * (values[1] - values[0])
+        falling = values[2] + fraction * (values[3] - values[2])
+        return np.where(increasing[:, np.newaxis], rising, falling)
+
+    mortality_fan = interpolate(mortality, bx > 0)
+
+    # L'espérance de vie à l'âge x décroît avec kt si bx >= 0 sur les âges >= x, croît si bx <= 0
+    nonnegative = np.logical_and.accumulate((bx >= 0)[::-1])[::-1]
+    nonpositive = np.logical_and.accumulate((bx <= 0)[::-1])[::-1]
+    life_expectancy_fan = interpolate(life_expectancy, nonpositive & ~nonnegative)
+
+    mixed = ~(nonnegative | nonpositive)
+    if mixed.any():
+        sample_life_expectancy = period_life_expectancy(project_death_rates(ax, bx, sample), age_widths)[:, mixed]
+        life_expectancy_fan[:, mixed] = np.quantile(sample_life_expectancy, quantiles, axis=0)
+
+    return mortality_fan, life_expectancy_fan
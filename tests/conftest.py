@@ -0,0 +1,38 @@
+"""Données synthétiques communes aux tests
+
+Les surfaces sont tirées d'un modèle de Lee Carter connu, avec ou sans bruit, pour pouvoir comparer les estimations aux vrais paramètres
+ou à une solution fermée. Le cache des ajustements sur disque est désactivé : les tests ne lisent ni n'écrivent rien dans .mortality_cache.
+"""
+
+import numpy as np
+import pytest
+
+import nz_mortality.cache
+
+@pytest.fixture(autouse=True)
+def no_fit_cache(monkeypatch):
+    monkeypatch.setattr(nz_mortality.cache, 'FIT_CACHE_ENABLED', False)
+
+# Paramètres de Lee Carter déjà normalisés (somme des bx égale à 1, moyenne des kt nulle)
+def lee_carter_parameters(n_ages=8, n_periods=20, seed=0):
+    rng = np.random.default_rng(seed)
+    ax = np.linspace(-8.0, -1.5, n_ages)
+    bx = rng.uniform(0.5, 1.5, n_ages)
+    bx /= bx.sum()
+    kt = np.linspace(15.0, -15.0, n_periods) + rng.normal(0.0, 1.0, n_periods)
+    kt -= kt.mean()
+    return ax, bx, kt
+
+# Décès et expositions d'une surface de Lee Carter : les décès sont tirés d'une loi de Poisson, ou égaux à leur espérance
+# (non entiers) quand exact=True, ce qui donne une vraisemblance maximale atteinte exactement aux vrais paramètres
+def lee_carter_deaths(ax, bx, kt, exposure=50000.0, exact=False, seed=0):
+    E_xt = np.full((len(ax), len(kt)), exposure)
+    D_xt = E_xt * np.exp(ax[:, np.newaxis] + bx[:, np.newaxis] * kt)
+    if not exact:
+        D_xt = np.random.default_rng(seed).poisson(D_xt).astype(np.float64)
+    return D_xt, E_xt
+
+@pytest.fixture
+def lee_carter_surface():
+    ax, bx, kt = lee_carter_parameters()
+    return ax, bx, kt, ax[:, np.newaxis] + bx[:, np.newaxis] * kt
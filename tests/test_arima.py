@@ -0,0 +1,52 @@
+import pickle
+import warnings
+import numpy as np
+import pytest
+
+import nz_mortality.arima
+from nz_mortality.arima import fit_arima, select_arima_orders
+
+from conftest import lee_carter_parameters
+
+# Le meilleur ordre de chaque population minimise le critère parmi les ordres estimés
+def test_select_arima_orders_minimizes_criterion():
+    kt_series = [lee_carter_parameters(n_periods=n_periods, seed=seed)[2] for seed, n_periods in ((0, 20), (1, 16))]
+    orders = [(0, 1, 0), (1, 1, 0)]
+
+    results_df, best_orders = select_arima_orders(kt_series, ['A', 'B'], orders, n_jobs=1)
+
+    assert list(best_orders) == ['A', 'B']
+    for population, rows in results_df.groupby('Population'):
+        assert best_orders[population] == rows.loc[rows['BIC'].idxmin(), 'Order']
+
+# Si aucun ordre n'est estimable pour une population, on garde default_order avec un avertissement
+def test_select_arima_orders_falls_back_to_default(monkeypatch):
+    kt_series = [lee_carter_parameters(seed=seed)[2] for seed in range(2)]
+    fit_arima_task = nz_mortality.arima.fit_arima_task
+    failing = kt_series[1].tobytes()
+    monkeypatch.setattr(nz_mortality.arima, 'fit_arima_task', lambda task: None if failing.startswith(task[0].tobytes()) else fit_arima_task(task))
+    monkeypatch.setattr(nz_mortality.arima, 'ARIMA_FIT_CACHE', {})
+
+    with pytest.warns(RuntimeWarning, match='B'):
+        results_df, best_orders = select_arima_orders(kt_series, ['A', 'B'], [(1, 1, 0)], n_jobs=1, default_order=(0, 1, 0))
+
+    assert best_orders == {'A': (1, 1, 0), 'B': (0, 1, 0)}
+    assert results_df.loc[results_df['Population'] == 'B', 'BIC'].isna().all()
+    assert nz_mortality.arima.ARIMA_FIT_CACHE
+
+# L'ajustement gardé en cache ne contient que la série et les paramètres : relu, il redonne l'AIC, le BIC et les prévisions de statsmodels
+def test_cached_arima_fit_is_small_and_forecasts_like_statsmodels():
+    from statsmodels.tsa.arima.model import ARIMA
+
+    kt = lee_carter_parameters(n_periods=40)[2]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model_fit = ARIMA(kt, order=(1, 1, 1)).fit()
+        payload = pickle.dumps(fit_arima(kt, (1, 1, 1)))
+        cached = pickle.loads(payload)
+
+        assert len(payload) < 5000
+        assert cached.results is None
+        np.testing.assert_allclose(cached.forecast(steps=3), model_fit.forecast(steps=3), rtol=1e-10)
+    assert cached.aic == pytest.approx(model_fit.aic) and cached.bic == pytest.approx(model_fit.bic)
+    assert cached.sigma2 == pytest.approx(model_fit.params[-1])
@@ -0,0 +1,42 @@
+import numpy as np
+
+from nz_mortality.backtest import rolling_origin_backtest
+
+from conftest import lee_carter_parameters
+
+def backtest_surfaces():
+    surfaces = []
+    for seed, n_periods in ((0, 14), (1, 11)):
+        ax, bx, kt = lee_carter_parameters(n_periods=n_periods, seed=seed)
+        noise = np.random.default_rng(seed).normal(0.0, 0.05, (len(ax), n_periods))
+        surfaces.append(ax[:, np.newaxis] + bx[:, np.newaxis] * kt + noise)
+    return surfaces
+
+# Chaque origine n'utilise que les périodes antérieures : modifier les données à partir d'une origine ne change pas ses prévisions
+def test_backtest_does_not_use_future_periods():
+    surfaces = backtest_surfaces()
+    origins = [8, 10, 12]
+    forecasts, actual, kts, _ = rolling_origin_backtest(surfaces, origins, n_jobs=1)
+
+    perturbed = [surface.copy() for surface in surfaces]
+    perturbed[0][:, 10:] += 1.0
+    perturbed_forecasts, perturbed_actual, perturbed_kts, _ = rolling_origin_backtest(perturbed, origins, n_jobs=1)
+
+    np.testing.assert_array_equal(perturbed_forecasts[:, 0, :2], forecasts[:, 0, :2])
+    np.testing.assert_array_equal(perturbed_kts[0, :2], kts[0, :2])
+    assert not np.allclose(perturbed_forecasts[:, 0, 2], forecasts[:, 0, 2])
+    assert not np.allclose(perturbed_actual[0, 1], actual[0, 1])
+
+    # La deuxième population n'a que 11 périodes : l'origine 12 ne laisse rien à prévoir
+    assert np.isnan(forecasts[:, 1, 2]).all() and np.isnan(actual[1, 2]).all()
+    assert np.isnan(actual[1, 1, :, 1]).all() and np.isfinite(actual[1, 1, :, 0]).all()
+
+# Une population trop courte pour toutes les origines n'a aucune tâche : ses prévisions restent NaN, sans erreur
+def test_backtest_skips_population_without_origins():
+    surfaces = backtest_surfaces()
+    surfaces[1] = surfaces[1][:, :6]
+    forecasts, actual, _, fits_df = rolling_origin_backtest(surfaces, [8, 10], n_jobs=2)
+
+    assert np.isnan(forecasts[:, 1]).all() and np.isnan(actual[1]).all()
+    assert np.isfinite(forecasts[:, 0]).all()
+    assert (fits_df.loc[fits_df['Population'] == 1, 'Iterations'] == 0).all()
@@ -0,0 +1,86 @@
+import numpy as np
+import warnings
+import pytest
+
+from nz_mortality.bootstrap import random_walk_forecast, bootstrap_lee_carter
+from nz_mortality.lee_carter import lee_carter_batch
+
+from conftest import lee_carter_parameters, lee_carter_deaths
+
+# Chaque série est prolongée depuis sa dernière période observée avec la dérive moyenne de ses différences
+def test_random_walk_forecast_with_masked_tail():
+    kt = np.array([[0.0, -1.0, -3.0, -4.0], [2.0, 1.0, 1.5, np.nan]])
+    forecast = random_walk_forecast(kt, 3)
+
+    np.testing.assert_allclose(forecast[0], -4.0 - 4.0 / 3.0 * np.arange(1, 4))
+    np.testing.assert_allclose(forecast[1], 1.5 - 0.25 * np.arange(1, 4))
+
+def bootstrap_data():
+    deaths, exposures = [], []
+    for seed in range(2):
+        # Taux plus faibles que ceux de lee_carter_parameters pour que les décès restent inférieurs aux expositions
+        ax, bx, kt = lee_carter_parameters(n_ages=6, n_periods=12, seed=seed)
+        D_xt, E_xt = lee_carter_deaths(ax - 3.0, bx, kt, seed=seed)
+        deaths.append(D_xt)
+        exposures.append(E_xt)
+    return np.stack(deaths), np.stack(exposures)
+
+# Chaque bloc a sa propre graine : le résultat ne dépend que de random_state, pas du nombre de processus
+def test_bootstrap_is_reproducible_across_processes():
+    deaths, exposures = bootstrap_data()
+    options = dict(n_replicates=30, chunk_size=10, random_state=7, tol=1e-8, max_iter=500)
+
+    single = bootstrap_lee_carter(deaths, exposures, n_jobs=1, **options)
+    again = bootstrap_lee_carter(deaths, exposures, n_jobs=1, **options)
+    parallel = bootstrap_lee_carter(deaths, exposures, n_jobs=2, **options)
+
+    for single_values, again_values, parallel_values in zip(single[:3], again[:3], parallel[:3]):
+        np.testing.assert_array_equal(single_values, again_values)
+        np.testing.assert_array_equal(single_values, parallel_values)
+    assert (single[3]['replicates'] == 30).all()
+
+# Bandes ordonnées, périodes masquées sans kt, et médiane de bx proche de l'ajustement des décès observés
+def test_bootstrap_bands_are_ordered_and_centered():
+    deaths, exposures = bootstrap_data()
+    mask = np.ones(deaths.shape, dtype=bool)
+    mask[1, :, -3:] = False
+
+    for method in ('poisson', 'residuals'):
+        bx_bands, kt_bands, forecast_bands, _ = bootstrap_lee_carter(
+            deaths, exposures, mask=mask, n_replicates=40, method=method, chunk_size=10, n_jobs=1, random_state=1, tol=1e-8, max_iter=500)
+
+        for bands in (bx_bands, kt_bands[:, 0], kt_bands[:, 1, :-3], forecast_bands):
+            assert np.all(bands[0] <= bands[1]) and np.all(bands[1] <= bands[2])
+        assert np.isnan(kt_bands[:, 1, -3:]).all()
+
+        with np.errstate(divide='ignore'):
+            log_m_xt = np.log(-np.log1p(-deaths / exposures))
+        _, bx, _, _ = lee_carter_batch(log_m_xt, mask=mask & np.isfinite(log_m_xt), tol=1e-8)
+        np.testing.assert_allclose(bx_bands[1], bx, atol=0.02)
+
+# Les ajustements arrêtés avant convergence sont comptés, signalés et écartés des bandes au lieu de disparaître des quantiles
+def test_bootstrap_reports_failed_replicates():
+    deaths, exposures = bootstrap_data()
+
+    with pytest.warns(RuntimeWarning, match='sans convergence'):
+        bx_bands, kt_bands, forecast_bands, trace = bootstrap_lee_carter(
+            deaths, exposures, n_replicates=20, chunk_size=10, n_jobs=1, random_state=3, max_iter=1, tol=1e-12)
+    assert (trace['failed_replicates'] == 20).all()
+    assert (trace['incomplete_replicates'] == 0).all()
+    assert np.isnan(bx_bands).all() and np.isnan(kt_bands).all() and np.isnan(forecast_bands).all()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        _, _, _, trace = bootstrap_lee_carter(deaths, exposures, n_replicates=20, chunk_size=10, n_jobs=1, random_state=3, max_iter=500)
+    assert (trace['failed_replicates'] == 0).all()
+
+# Un âge sans aucun décès tiré n'a pas de bx dans la réplique : elle est comptée dans incomplete_replicates
+def test_bootstrap_reports_ages_without_deaths():
+    deaths, exposures = bootstrap_data()
+    deaths[0, 0] = 0.05
+
+    with pytest.warns(RuntimeWarning, match='sans décès tiré'):
+        bx_bands, _, _, trace = bootstrap_lee_carter(deaths, exposures, n_replicates=20, chunk_size=10, n_jobs=1, random_state=3)
+    assert 0 < trace.loc[0, 'incomplete_replicates'] <= 20
+    assert trace.loc[1, 'incomplete_replicates'] == 0
+    assert np.isfinite(bx_bands).all()
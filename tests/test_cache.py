@@ -0,0 +1,51 @@
+import os
+import numpy as np
+
+import nz_mortality.cache
+from nz_mortality.cache import FitCache, code_fingerprint
+
+def squares(values, offset=0.0):
+    return np.asarray(values) ** 2 + offset
+
+# La clé dépend des données et des hyperparamètres, et le résultat relu est celui qui a été calculé
+def test_fit_cache_round_trip(tmp_path):
+    cache = FitCache(cache_dir=str(tmp_path), enabled=True)
+    values = np.arange(4.0)
+
+    np.testing.assert_array_equal(cache.call(squares, values, offset=1.0), values ** 2 + 1.0)
+    np.testing.assert_array_equal(cache.call(squares, values, offset=1.0), values ** 2 + 1.0)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.key(squares, values, offset=1.0) != cache.key(squares, values, offset=2.0)
+    assert cache.key(squares, values) != cache.key(squares, values + 1.0)
+
+# Une entrée illisible est supprimée et recalculée au lieu de faire échouer l'exécution
+def test_fit_cache_replaces_corrupt_entry(tmp_path):
+    cache = FitCache(cache_dir=str(tmp_path), enabled=True)
+    key = cache.key(squares, [1.0, 2.0])
+    with open(cache.path(key), 'wb') as f:
+        f.write(b'not a pickle')
+
+    assert cache.get(key) == (False, None)
+    assert not os.path.exists(cache.path(key))
+    np.testing.assert_array_equal(cache.call(squares, [1.0, 2.0]), [1.0, 4.0])
+    assert cache.get(key)[0]
+
+# Les paramètres laissés à None suivent les constantes du module modifiées après la création du cache
+def test_fit_cache_reads_defaults_at_call_time(tmp_path, monkeypatch):
+    cache = FitCache()
+    monkeypatch.setattr(nz_mortality.cache, 'FIT_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(nz_mortality.cache, 'FIT_CACHE_ENABLED', True)
+    monkeypatch.setattr(nz_mortality.cache, 'FIT_CACHE_MAX_BYTES', 0)
+
+    assert cache.directory() == str(tmp_path) and cache.is_enabled()
+    cache.call(squares, [3.0])
+    # Avec une taille maximale nulle, l'entrée est évincée dès son écriture
+    assert os.listdir(tmp_path) == []
+
+# Les fonctions du paquet partagent l'empreinte de tout son code : modifier lee_carter.py invalide aussi les bootstraps en cache
+def test_code_fingerprint_covers_the_whole_package():
+    from nz_mortality.bootstrap import bootstrap_lee_carter
+    from nz_mortality.lee_carter import lee_carter_batch
+
+    assert code_fingerprint(bootstrap_lee_carter) == code_fingerprint(lee_carter_batch)
+    assert code_fingerprint(squares) != code_fingerprint(bootstrap_lee_carter)
@@ -0,0 +1,122 @@
+import numpy as np
+
+import nz_mortality.cohort
+from nz_mortality.cohort import (
+    cohort_indices, cohort_log_rates, extend_cohort_effect, poisson_deviance, age_period_cohort, renshaw_haberman
+)
+
+from conftest import lee_carter_parameters
+
+N_AGES, N_PERIODS = 8, 20
+
+# Effet de génération lisse, sans tendance linéaire (elle serait reportée sur ax et kt par la normalisation)
+def cohort_effect(n_cohorts):
+    c = np.arange(n_cohorts)
+    gc = 0.1 * np.sin(c / 3.0)
+    slope, intercept = np.polyfit(c, gc, 1)
+    return gc - intercept - slope * c
+
+# Décès égaux à leur espérance : la déviance de l'optimum est nulle et les taux ajustés sont exactement ceux du modèle
+def exact_cohort_deaths(log_m_xt, exposure=50000.0):
+    E_xt = np.full(log_m_xt.shape, exposure)
+    return E_xt * np.exp(log_m_xt), E_xt
+
+def test_cohort_indices_follow_diagonals():
+    cohorts = cohort_indices(3, 4)
+    np.testing.assert_array_equal(cohorts, [[2, 3, 4, 5], [1, 2, 3, 4], [0, 1, 2, 3]])
+
+    # Groupes de 5 ans avec des périodes de 5 ans : un groupe d'âge de plus décale d'une période
+    np.testing.assert_array_equal(cohort_indices(3, 2, age_offsets=[0, 1, 2]), cohort_indices(3, 2))
+
+def test_extend_cohort_effect_random_walk_with_drift():
+    gc = np.array([np.nan, 0.0, 1.0, 3.0, np.nan])
+    np.testing.assert_allclose(extend_cohort_effect(gc, 6), [np.nan, 0.0, 1.0, 3.0, 4.5, 6.0])
+
+def test_age_period_cohort_reproduces_exact_rates():
+    ax, _, kt = lee_carter_parameters(N_AGES, N_PERIODS, seed=0)
+    cohorts = cohort_indices(N_AGES, N_PERIODS)
+    log_m_xt = ax[:, np.newaxis] + kt / N_AGES + cohort_effect(cohorts.max() + 1)[cohorts]
+    D_xt, E_xt = exact_cohort_deaths(log_m_xt)
+
+    fitted_ax, fitted_kt, fitted_gc, fitted_cohorts, trace = age_period_cohort(D_xt, E_xt, min_cohort_cells=1, tol=1e-10)
+
+    assert trace.attrs['converged']
+    assert trace['objective'].iloc[-1] < 1e-8
+    np.testing.assert_array_equal(fitted_cohorts, cohorts)
+    np.testing.assert_allclose(cohort_log_rates(fitted_ax, fitted_kt, fitted_gc, cohorts), log_m_xt, atol=1e-7)
+
+# Les générations observées dans moins de min_cohort_cells cases (les coins) ne sont pas estimées
+def test_age_period_cohort_drops_sparse_cohorts():
+    ax, _, kt = lee_carter_parameters(N_AGES, N_PERIODS, seed=1)
+    D_xt, E_xt = exact_cohort_deaths(ax[:, np.newaxis] + kt / N_AGES)
+
+    _, _, gc, _, _ = age_period_cohort(D_xt, E_xt, min_cohort_cells=3)
+
+    assert np.isnan(gc[[0, 1, -2, -1]]).all()
+    assert np.isfinite(gc[2:-2]).all()
+
+# Avec des décès exacts la déviance atteint zéro à la précision machine : on ne vérifie que les taux ajustés
+def test_renshaw_haberman_reproduces_exact_rates():
+    ax, bx, kt = lee_carter_parameters(N_AGES, N_PERIODS, seed=2)
+    cohorts = cohort_indices(N_AGES, N_PERIODS)
+    log_m_xt = ax[:, np.newaxis] + bx[:, np.newaxis] * kt + cohort_effect(cohorts.max() + 1)[cohorts]
+    D_xt, E_xt = exact_cohort_deaths(log_m_xt)
+
+    fitted_ax, fitted_bx, fitted_kt, fitted_b0x, fitted_gc, _, trace = renshaw_haberman(D_xt, E_xt, min_cohort_cells=1)
+
+    np.testing.assert_allclose(fitted_bx.sum(), 1.0)
+    assert abs(trace['objective'].iloc[-1]) < 1e-8
+    np.testing.assert_allclose(
+        cohort_log_rates(fitted_ax, fitted_kt, fitted_gc, cohorts, bx=fitted_bx, b0x=fitted_b0x), log_m_xt, atol=1e-7)
+
+def test_renshaw_haberman_converges_on_poisson_deaths():
+    ax, bx, kt = lee_carter_parameters(N_AGES, N_PERIODS, seed=3)
+    cohorts = cohort_indices(N_AGES, N_PERIODS)
+    log_m_xt = ax[:, np.newaxis] + bx[:, np.newaxis] * kt + cohort_effect(cohorts.max() + 1)[cohorts]
+    E_xt = np.full(log_m_xt.shape, 50000.0)
+    D_xt = np.random.default_rng(3).poisson(E_xt * np.exp(log_m_xt)).astype(np.float64)
+
+    fitted_ax, fitted_bx, fitted_kt, fitted_b0x, fitted_gc, _, trace = renshaw_haberman(D_xt, E_xt)
+
+    # Le maximum de vraisemblance fait au moins aussi bien que les vrais paramètres sur les cases ajustées
+    fitted = cohort_log_rates(fitted_ax, fitted_kt, fitted_gc, cohorts, bx=fitted_bx, b0x=fitted_b0x)
+    observed = np.isfinite(fitted)
+    true_deviance = poisson_deviance(D_xt[observed], E_xt[observed] * np.exp(log_m_xt[observed]), True)
+
+    assert trace.attrs['converged']
+    assert np.all(np.diff(trace['objective'].to_numpy()) <= 0)
+    assert trace['objective'].iloc[-1] <= true_deviance
+    np.testing.assert_allclose(poisson_deviance(D_xt[observed], E_xt[observed] * np.exp(fitted[observed]), True), trace['objective'].iloc[-1])
+
+# Si aucun pas ne fait diminuer la déviance, l'ajustement revient à l'itéré précédent et s'arrête sans convergence
+def test_renshaw_haberman_reverts_failed_steps(monkeypatch):
+    ax, bx, kt = lee_carter_parameters(N_AGES, N_PERIODS, seed=4)
+    cohorts = cohort_indices(N_AGES, N_PERIODS)
+    log_m_xt = ax[:, np.newaxis] + bx[:, np.newaxis] * kt + cohort_effect(cohorts.max() + 1)[cohorts]
+    E_xt = np.full(log_m_xt.shape, 50000.0)
+    D_xt = np.random.default_rng(4).poisson(E_xt * np.exp(log_m_xt)).astype(np.float64)
+
+    # On compte les pas des deux premières itérations, puis tous les pas suivants partent dans la mauvaise direction
+    fisher_scoring_step = nz_mortality.cohort.fisher_scoring_step
+    calls = []
+    def counted_step(*args):
+        if len(args) == 6:
+            calls.append(args)
+        return fisher_scoring_step(*args)
+    monkeypatch.setattr(nz_mortality.cohort, 'fisher_scoring_step', counted_step)
+    reference = renshaw_haberman(D_xt, E_xt, max_iter=2)
+    n_reference_calls, calls[:] = len(calls), []
+
+    def uphill_step(*args):
+        step = counted_step(*args)
+        return -step if len(args) == 6 and len(calls) > n_reference_calls else step
+    monkeypatch.setattr(nz_mortality.cohort, 'fisher_scoring_step', uphill_step)
+
+    fitted = renshaw_haberman(D_xt, E_xt, max_iter=50)
+    trace = fitted[-1]
+
+    assert not trace.attrs['converged']
+    assert len(trace) == 2
+    np.testing.assert_allclose(trace['objective'], reference[-1]['objective'])
+    for position in (0, 1, 2, 3, 4):
+        np.testing.assert_allclose(fitted[position], reference[position])
@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from nz_mortality.data import (
+    normalize_age_label, load_life_death_table, aggregate_life_death_table, iter_table_chunks,
+    aggregate_life_death_chunks, MortalityCube
+)
+
+VALUE_COLUMNS = ['Total Death', 'Total Population']
+
+def life_death_rows():
+    rng = np.random.default_rng(0)
+    ages = [0, ' 01-04', '05-09', '90-94', '95-99', '100-104', None]
+    rows = pd.DataFrame([(year, age) for year in range(1950, 1963) for age in ages], columns=['Year', 'Age'])
+    rows['Total Death'] = rng.integers(0, 100, len(rows)).astype(np.float64)
+    rows['Total Population'] = rng.integers(1000, 5000, len(rows)).astype(np.float64)
+    return rows.sample(frac=1.0, random_state=0, ignore_index=True)
+
+# Le classeur n'est lu qu'une fois : la deuxième lecture relit les colonnes en cache, et une modification du contenu reconstruit le cache
+def test_columnar_cache_round_trip(tmp_path, monkeypatch):
+    rows = life_death_rows()
+    path = str(tmp_path / 'table.xlsx')
+    rows.to_excel(path, index=False)
+
+    first = load_life_death_table(path)
+    assert os.path.exists(tmp_path / '.mortality_cache' / 'table' / 'meta.json')
+    np.testing.assert_array_equal(first['Year'], rows['Year'])
+    np.testing.assert_array_equal(first[VALUE_COLUMNS], rows[VALUE_COLUMNS])
+    ages = first['Age'].astype(object)
+    assert list(ages.where(ages.notna(), None)) == [normalize_age_label(age) for age in rows['Age']]
+
+    def no_excel(*args, **kwargs):
+        raise AssertionError('le classeur ne doit pas être relu')
+    with monkeypatch.context() as patch:
+        patch.setattr(pd, 'read_excel', no_excel)
+        pd.testing.assert_frame_equal(load_life_death_table(path), first)
+
+    rows.loc[0, 'Total Death'] += 1.0
+    rows.to_excel(path, index=False)
+    assert load_life_death_table(path)['Total Death'].iloc[0] == rows['Total Death'].iloc[0]
+
+# Regroupement en périodes de 5 ans, les années et âges exclus et les lignes sans âge étant retirés
+def test_aggregate_groups_periods():
+    rows = life_death_rows()
+    rows['Age'] = [normalize_age_label(age) for age in rows['Age']]
+
+    aggregated = aggregate_life_death_table(rows, excluded_years=[1951], excluded_ages=['05-09', '95-99', '100-104'], value_columns=VALUE_COLUMNS)
+
+    assert list(aggregated.index.levels[0]) == ['1950-1954', '1955-1959', '1960-1964']
+    assert list(aggregated.index.levels[1]) == ['0', '01-04', '90-94']
+    kept = rows[(rows['Year'] != 1951) & rows['Age'].isin(['0', '01-04', '90-94'])]
+    for (period, age), values in aggregated.iterrows():
+        first_year = int(period[:4])
+        cells = kept[(kept['Age'] == age) & (kept['Year'] >= first_year) & (kept['Year'] < first_year + 5)]
+        np.testing.assert_allclose(values, cells[VALUE_COLUMNS].sum())
+
+# Mode annuel : les périodes sont les années civiles, et les âges à partir de open_age forment un groupe ouvert rangé après les autres
+# ('100-104' n'est pas rangé avant '95-99' par ordre alphabétique)
+def test_aggregate_annual_periods_and_open_age():
+    rows = life_death_rows()
+    rows['Age'] = [normalize_age_label(age) for age in rows['Age']]
+
+    annual = aggregate_life_death_table(rows, value_columns=VALUE_COLUMNS, bin_width=1)
+    assert list(annual.index.levels[0]) == [str(year) for year in range(1950, 1963)]
+    assert list(annual.index.levels[1]) == ['0', '01-04', '05-09', '90-94', '95-99', '100-104']
+    np.testing.assert_allclose(annual.sum(), rows.loc[rows['Age'].notna(), VALUE_COLUMNS].sum())
+
+    grouped = aggregate_life_death_table(rows, value_columns=VALUE_COLUMNS, open_age=95)
+    assert list(grouped.index.levels[1]) == ['0', '01-04', '05-09', '90-94', '95+']
+    open_group = rows[rows['Age'].isin(['95-99', '100-104']) & (rows['Year'] >= 1955) & (rows['Year'] <= 1959)]
+    np.testing.assert_allclose(grouped.loc[('1955-1959', '95+')], open_group[VALUE_COLUMNS].sum())
+
+def aggregated_populations():
+    rows = life_death_rows()
+    rows['Age'] = [normalize_age_label(age) for age in rows['Age']]
+    nz = aggregate_life_death_table(rows, excluded_ages=['95-99', '100-104'], value_columns=VALUE_COLUMNS)
+    maori = aggregate_life_death_table(rows[rows['Year'] < 1955], excluded_ages=['95-99', '100-104'], value_columns=VALUE_COLUMNS)
+    return {'NZ': nz, 'Maori': maori}
+
+# Un seul tableau population × sexe × âge × période : les cases absentes restent NaN et les matrices sont des vues sans copie
+def test_mortality_cube_from_aggregated():
+    aggregated = aggregated_populations()
+    cube = MortalityCube.from_aggregated(aggregated, sexes=('Total', 'Male'))
+
+    assert cube.deaths.shape == (2, 2, 4, 3)
+    assert cube.ages == ['0', '01-04', '05-09', '90-94']
+    np.testing.assert_array_equal(cube.frame('deaths', 'NZ').T.stack(), aggregated['NZ']['Total Death'].to_numpy())
+    assert np.isnan(cube.deaths[:, 1]).all()
+    assert np.isnan(cube.matrix('deaths', 'Maori')[:, 1:]).all()
+
+    rates = cube.matrix('mortality_rate', 'NZ')
+    np.testing.assert_allclose(rates, cube.matrix('deaths', 'NZ') / cube.matrix('exposures', 'NZ'))
+    np.testing.assert_allclose(cube.matrix('death_rate', 'NZ'), -np.log1p(-rates))
+
+    view = cube.matrix('deaths', 'NZ', periods=['1955-1959', '1960-1964'])
+    assert np.shares_memory(view, cube.deaths)
+    with pytest.raises(ValueError):
+        cube.matrix('deaths', 'NZ', periods=['1950-1954', '1960-1964'])
+
+# Ajouter les périodes nouvellement publiées donne le même cube que tout agréger à nouveau
+def test_append_periods_matches_full_cube():
+    rows = life_death_rows()
+    rows['Age'] = [normalize_age_label(age) for age in rows['Age']]
+    options = dict(excluded_ages=['95-99', '100-104'], value_columns=VALUE_COLUMNS)
+    full = MortalityCube.from_aggregated({'NZ': aggregate_life_death_table(rows, **options)}, sexes=('Total',))
+
+    cube = MortalityCube.from_aggregated({'NZ': aggregate_life_death_table(rows[rows['Year'] < 1960], **options)}, sexes=('Total',))
+    cube = cube.append_periods({'NZ': aggregate_life_death_table(rows[rows['Year'] >= 1960], **options)})
+
+    assert cube.periods == full.periods
+    for name in ('deaths', 'exposures', 'mortality_rate', 'death_rate'):
+        np.testing.assert_array_equal(getattr(cube, name), getattr(full, name))
+    with pytest.raises(ValueError):
+        cube.append_periods({'NZ': aggregate_life_death_table(rows[rows['Year'] >= 1960], **options)})
+
+# L'agrégation par morceaux donne la même table que l'agrégation du fichier entier, quel que soit le découpage en morceaux
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_chunks_match_whole_table(chunk_size):
+    rows = life_death_rows()
+    options = dict(excluded_years=[1951], excluded_ages=['05-09'], value_columns=VALUE_COLUMNS, open_age=95)
+
+    whole = rows.copy()
+    whole['Age'] = whole['Age'].map(lambda age: None if age is None else str(age).strip())
+    expected = aggregate_life_death_table(whole, **options)
+    chunks = (rows.iloc[start:start + chunk_size] for start in range(0, len(rows), chunk_size))
+    aggregated = aggregate_life_death_chunks(chunks, **options)
+
+    pd.testing.assert_frame_equal(aggregated, expected)
+    assert list(aggregated.index.get_level_values('Age').categories) == ['0', '01-04', '90-94', '95+']
+
+def test_chunks_without_ages_raise():
+    rows = life_death_rows()
+    with pytest.raises(ValueError):
+        aggregate_life_death_chunks([], value_columns=VALUE_COLUMNS)
+    with pytest.raises(ValueError):
+        aggregate_life_death_chunks([rows[rows['Age'].isna()]], value_columns=VALUE_COLUMNS)
+
+# Un extrait CSV lu par morceaux donne la même table que les lignes en mémoire ; les âges sont lus comme des chaînes
+def test_csv_extract_in_chunks(tmp_path):
+    rows = life_death_rows()
+    path = str(tmp_path / 'extract.csv.gz')
+    rows.to_csv(path, index=False)
+
+    aggregated = aggregate_life_death_chunks(iter_table_chunks(path, chunk_size=10), value_columns=VALUE_COLUMNS, open_age=95)
+    expected = aggregate_life_death_chunks([rows], value_columns=VALUE_COLUMNS, open_age=95)
+    pd.testing.assert_frame_equal(aggregated, expected)
+    with pytest.raises(ValueError):
+        next(iter_table_chunks(str(tmp_path / 'extract.xlsx')))
+
@@ -0,0 +1,221 @@
+import numpy as np
+import pytest
+
+from nz_mortality.lee_carter import (
+    truncated_svd, lee_carter_svd, lee_carter_newton_raphson, lee_carter_batch, normalize_lee_carter, reestimate_kt,
+    IncrementalLeeCarter, li_lee, lee_carter_poisson
+)
+from nz_mortality.projection import fit_linear_trends
+
+from conftest import lee_carter_parameters, lee_carter_deaths
+
+def normalized(ax, bx, kt):
+    ax, bx, kt = normalize_lee_carter(ax[np.newaxis], bx[np.newaxis], kt[np.newaxis], np.ones((1, len(kt)), dtype=bool))
+    return ax[0], bx[0], kt[0]
+
+# Toutes les méthodes donnent les premiers triplets singuliers de numpy, y compris quand le rang demandé atteint ou dépasse
+# min(n, m) - 1 (lanczos se replie alors sur la SVD complète)
+@pytest.mark.parametrize('method', ['full', 'randomized', 'lanczos'])
+@pytest.mark.parametrize('rank', [1, 3, 5, 9])
+def test_truncated_svd_matches_numpy(method, rank):
+    A = np.random.default_rng(0).normal(size=(5, 8))
+    U, sigma, Vt = truncated_svd(A, rank=rank, method=method)
+
+    U_full, sigma_full, Vt_full = np.linalg.svd(A, full_matrices=False)
+    k = min(rank, 5)
+    np.testing.assert_allclose(sigma, sigma_full[:k], rtol=1e-8)
+    np.testing.assert_allclose((U * sigma) @ Vt, (U_full[:, :k] * sigma_full[:k]) @ Vt_full[:k], atol=1e-8)
+
+# Sur une surface exactement de rang 1, Newton Raphson retrouve les paramètres normalisés
+def test_newton_raphson_recovers_exact_surface(lee_carter_surface):
+    ax, bx, kt, log_m_xt = lee_carter_surface
+
+    fitted_ax, fitted_bx, fitted_kt, trace = lee_carter_newton_raphson(log_m_xt, max_iter=2000, tol=1e-10)
+    fitted_ax, fitted_bx, fitted_kt = normalized(fitted_ax, fitted_bx, fitted_kt)
+
+    assert trace.attrs['converged']
+    np.testing.assert_allclose(fitted_ax, ax, atol=1e-6)
+    np.testing.assert_allclose(fitted_bx, bx, atol=1e-6)
+    np.testing.assert_allclose(fitted_kt, kt, atol=1e-4)
+
+# Avec du bruit, l'optimum des moindres carrés est la solution SVD de rang 1 : Newton Raphson doit atteindre la même surface
+def test_newton_raphson_reaches_svd_least_squares(lee_carter_surface):
+    _, _, _, log_m_xt = lee_carter_surface
+    log_m_xt = log_m_xt + np.random.default_rng(1).normal(0.0, 0.05, log_m_xt.shape)
+
+    ax, bx, kt, trace = lee_carter_newton_raphson(log_m_xt, max_iter=5000, tol=1e-10)
+    svd_ax, svd_bx, svd_kt, _ = lee_carter_svd(log_m_xt)
+
+    np.testing.assert_allclose(ax[:, np.newaxis] + np.outer(bx, kt), svd_ax[:, np.newaxis] + svd_bx @ svd_kt, atol=1e-6)
+    assert np.all(np.diff(trace['objective'].to_numpy()) <= 1e-9)
+
+# Un départ à chaud depuis l'ajustement d'une période de moins converge vers le même optimum
+def test_newton_raphson_warm_start(lee_carter_surface):
+    _, _, _, log_m_xt = lee_carter_surface
+    log_m_xt = log_m_xt + np.random.default_rng(2).normal(0.0, 0.05, log_m_xt.shape)
+
+    previous = lee_carter_newton_raphson(log_m_xt[:, :-1], max_iter=5000, tol=1e-10)[:3]
+    cold = lee_carter_newton_raphson(log_m_xt, max_iter=5000, tol=1e-10)
+    warm = lee_carter_newton_raphson(log_m_xt, max_iter=5000, tol=1e-10, initial=previous)
+
+    assert len(warm[3]) < len(cold[3])
+    for cold_values, warm_values in zip(normalized(*cold[:3]), normalized(*warm[:3])):
+        np.testing.assert_allclose(warm_values, cold_values, atol=1e-5)
+
+# L'ajustement simultané donne pour chaque population le même ajustement que seule, les périodes masquées étant ignorées. En partant
+# de zéro, l'optimum n'est atteint que par les mises à jour de Newton et non par l'initialisation SVD.
+@pytest.mark.parametrize('init', ['svd', 'zeros'])
+def test_batch_matches_single_population_fits(init):
+    surfaces = []
+    for seed in range(3):
+        ax, bx, kt = lee_carter_parameters(seed=seed)
+        noise = np.random.default_rng(10 + seed).normal(0.0, 0.05, (len(ax), len(kt)))
+        surfaces.append(ax[:, np.newaxis] + bx[:, np.newaxis] * kt + noise)
+    log_m_pxt = np.stack(surfaces)
+    mask = np.ones(log_m_pxt.shape, dtype=bool)
+    mask[2, :, -4:] = False
+
+    ax, bx, kt, trace = lee_carter_batch(np.where(mask, log_m_pxt, 99.0), mask=mask, max_iter=20000, tol=1e-12, init=init)
+
+    assert trace['converged'].all()
+    assert np.isnan(kt[2, -4:]).all()
+    for p, periods in enumerate([20, 20, 16]):
+        svd_ax, svd_bx, svd_kt, _ = lee_carter_svd(log_m_pxt[p, :, :periods])
+        np.testing.assert_allclose(
+            ax[p, :, np.newaxis] + np.outer(bx[p], kt[p, :periods]), svd_ax[:, np.newaxis] + svd_bx @ svd_kt, atol=1e-6)
+
+# Un âge sans aucune case observée dans une population n'a ni ax ni bx (NaN), mais les autres âges de cette population sont ajustés
+# comme s'il n'existait pas, au lieu que le 0 / 0 de sa mise à jour ne gagne tous les kt de la population
+@pytest.mark.parametrize('init', ['svd', 'zeros'])
+def test_batch_with_unobserved_age(init):
+    surfaces = []
+    for seed in range(2):
+        ax, bx, kt = lee_carter_parameters(seed=seed)
+        surfaces.append(ax[:, np.newaxis] + bx[:, np.newaxis] * kt + np.random.default_rng(30 + seed).normal(0.0, 0.05, (len(ax), len(kt))))
+    log_m_pxt = np.stack(surfaces)
+    mask = np.ones(log_m_pxt.shape, dtype=bool)
+    mask[1, 3] = False
+
+    ax, bx, kt, trace = lee_carter_batch(np.where(mask, log_m_pxt, np.nan), mask=mask, max_iter=20000, tol=1e-12, init=init)
+
+    assert trace['converged'].all()
+    assert np.isnan(ax[1, 3]) and np.isnan(bx[1, 3])
+    assert np.isfinite(np.delete(ax, 3, axis=1)).all() and np.isfinite(np.delete(bx, 3, axis=1)).all() and np.isfinite(kt).all()
+    observed_ages = np.arange(len(ax[1])) != 3
+    svd_ax, svd_bx, svd_kt, _ = lee_carter_svd(log_m_pxt[1, observed_ages])
+    np.testing.assert_allclose(
+        ax[1, observed_ages, np.newaxis] + np.outer(bx[1, observed_ages], kt[1]), svd_ax[:, np.newaxis] + svd_bx @ svd_kt, atol=1e-6)
+    np.testing.assert_allclose(np.nansum(bx, axis=1), 1.0)
+
+# Pour des populations identiques, le facteur commun est le premier triplet singulier et les facteurs propres ajustent le reste au
+# rang 1 : la surface de Li et Lee est l'approximation de rang 2 de Lee Carter
+def test_li_lee_identical_populations_is_rank_two(lee_carter_surface):
+    _, _, _, log_m_xt = lee_carter_surface
+    log_m_xt = log_m_xt + np.random.default_rng(3).normal(0.0, 0.05, log_m_xt.shape)
+
+    ax, Bx, Kt, bx, kt, _ = li_lee(np.stack([log_m_xt, log_m_xt]), max_iter=20000, tol=1e-13)
+    svd_ax, svd_bx, svd_kt, _ = lee_carter_svd(log_m_xt, rank=2)
+
+    np.testing.assert_allclose(Bx, svd_bx[:, 0], atol=1e-8)
+    np.testing.assert_allclose(Kt, svd_kt[0], atol=1e-6)
+    fitted = ax[:, :, np.newaxis] + np.outer(Bx, Kt) + bx[:, :, np.newaxis] * kt[:, np.newaxis, :]
+    np.testing.assert_allclose(fitted, np.broadcast_to(svd_ax[:, np.newaxis] + svd_bx @ svd_kt, fitted.shape), atol=1e-6)
+
+# Quand les écarts propres se compensent entre populations, la moyenne des log taux centrés n'a que le facteur commun et les résidus de
+# chaque population sont exactement de rang 1 : Li et Lee reproduit exactement la surface
+def test_li_lee_reproduces_exact_model():
+    ax, Bx, Kt = lee_carter_parameters(seed=4)
+    offsets = np.random.default_rng(5).normal(0.0, 0.1, (2, len(ax)))
+    b = lee_carter_parameters(seed=6)[1]
+    k = np.sin(np.arange(len(Kt)))
+    k -= k.mean()
+    log_m_pxt = (ax + offsets)[:, :, np.newaxis] + np.outer(Bx, Kt) + np.stack([np.outer(b, k), -np.outer(b, k)])
+
+    fitted_ax, fitted_Bx, fitted_Kt, fitted_bx, fitted_kt, trace = li_lee(log_m_pxt, max_iter=5000, tol=1e-12)
+    fitted = fitted_ax[:, :, np.newaxis] + np.outer(fitted_Bx, fitted_Kt) + fitted_bx[:, :, np.newaxis] * fitted_kt[:, np.newaxis, :]
+
+    np.testing.assert_allclose(fitted_Bx, Bx, atol=1e-8)
+    np.testing.assert_allclose(fitted, log_m_pxt, atol=1e-6)
+
+# Avec un masque partiel (périodes de prédiction d'une population absentes), Kt n'est pas centré sur les périodes de chaque population :
+# les paramètres renvoyés doivent quand même reproduire la surface ajustée, dont la somme des carrés des résidus est l'objectif de la trace
+def test_li_lee_parameters_reproduce_masked_fit():
+    surfaces = []
+    for seed in range(3):
+        ax, bx, kt = lee_carter_parameters(seed=seed)
+        surfaces.append(ax[:, np.newaxis] + bx[:, np.newaxis] * kt + np.random.default_rng(20 + seed).normal(0.0, 0.05, (len(ax), len(kt))))
+    log_m_pxt = np.stack(surfaces)
+    mask = np.ones(log_m_pxt.shape, dtype=bool)
+    mask[2, :, -6:] = False
+
+    ax, Bx, Kt, bx, kt, trace = li_lee(np.where(mask, log_m_pxt, np.nan), mask=mask, max_iter=5000, tol=1e-10)
+
+    fitted = ax[:, :, np.newaxis] + np.outer(Bx, Kt) + bx[:, :, np.newaxis] * np.nan_to_num(kt)[:, np.newaxis, :]
+    ssr = np.sum(np.where(mask, log_m_pxt - fitted, 0.0) ** 2, axis=(1, 2))
+    np.testing.assert_allclose(ssr, trace['objective'], rtol=1e-10)
+
+# Après des ajouts successifs, les statistiques incrémentales donnent les mêmes ax, bx, kt et la même tendance qu'un ajustement complet
+def test_incremental_update_matches_full_fit(lee_carter_surface):
+    _, _, _, log_m_xt = lee_carter_surface
+    log_m_xt = log_m_xt + np.random.default_rng(6).normal(0.0, 0.05, log_m_xt.shape)
+
+    model = IncrementalLeeCarter(log_m_xt[:, :10])
+    model.append(log_m_xt[:, 10:15])
+    for t in range(15, log_m_xt.shape[1]):
+        model.append(log_m_xt[:, t])
+
+    ax, bx = model.parameters()
+    svd_ax, svd_bx, svd_kt, _ = lee_carter_svd(log_m_xt)
+    np.testing.assert_allclose(ax, svd_ax, atol=1e-10)
+    np.testing.assert_allclose(bx, svd_bx[:, 0], atol=1e-10)
+
+    kt = model.kt(log_m_xt)
+    np.testing.assert_allclose(kt, svd_kt[0], atol=1e-8)
+
+    alpha, beta, drift = model.kt_trend()
+    expected_alpha, expected_beta, _, _ = fit_linear_trends(kt)
+    np.testing.assert_allclose([alpha, beta], [expected_alpha, expected_beta], atol=1e-8)
+    np.testing.assert_allclose(drift, (kt[-1] - kt[0]) / (len(kt) - 1), atol=1e-10)
+    np.testing.assert_allclose(model.forecast_kt(3, method='drift'), kt[-1] + drift * np.arange(1, 4), atol=1e-8)
+
+# kt réestimé égalise les décès observés et ajustés de chaque période ; avec des décès exacts on retrouve les vrais kt, et les bornes
+# sont respectées
+def test_reestimate_kt_matches_observed_deaths():
+    ax, bx, kt = lee_carter_parameters(seed=5)
+    D_xt, E_xt = lee_carter_deaths(ax, bx, kt, exact=True)
+    np.testing.assert_allclose(reestimate_kt(ax, bx, D_xt, E_xt, np.zeros_like(kt)), kt, atol=1e-8)
+
+    D_xt, E_xt = lee_carter_deaths(ax, bx, kt, seed=5)
+    fitted_kt = reestimate_kt(ax, bx, D_xt, E_xt, kt)
+    np.testing.assert_allclose((E_xt * np.exp(ax[:, np.newaxis] + bx[:, np.newaxis] * fitted_kt)).sum(axis=0), D_xt.sum(axis=0), rtol=1e-10)
+
+    bounded_kt = reestimate_kt(ax, bx, D_xt, E_xt, kt, bounds=(-5.0, 5.0))
+    np.testing.assert_allclose(bounded_kt, np.clip(fitted_kt, -5.0, 5.0), atol=1e-8)
+
+# Avec des décès égaux à leur espérance, le maximum de vraisemblance de Poisson est atteint aux vrais paramètres
+def test_poisson_recovers_exact_parameters():
+    ax, bx, kt = lee_carter_parameters(seed=8)
+    D_xt, E_xt = lee_carter_deaths(ax, bx, kt, exact=True)
+
+    fitted_ax, fitted_bx, fitted_kt, trace = lee_carter_poisson(D_xt, E_xt, max_iter=2000, tol=1e-10)
+
+    assert trace.attrs['converged']
+    np.testing.assert_allclose(fitted_ax, ax, atol=1e-6)
+    np.testing.assert_allclose(fitted_bx, bx, atol=1e-6)
+    np.testing.assert_allclose(fitted_kt, kt, atol=1e-4)
+    assert trace['objective'].iloc[-1] < 1e-6
+
+# Les cases observées sans décès participent à la vraisemblance : à l'optimum, les décès ajustés de chaque âge sommés sur toutes les
+# cases observées sont égaux aux décès observés, et les cases masquées (exposition nulle) sont ignorées
+def test_poisson_score_equations_with_zero_deaths():
+    ax, bx, kt = lee_carter_parameters(n_ages=10, n_periods=15, seed=9)
+    D_xt, E_xt = lee_carter_deaths(ax, bx, kt, exposure=400.0, seed=9)
+    E_xt[3, 4] = 0.0
+    assert (D_xt[E_xt > 0] == 0).any()
+
+    fitted_ax, fitted_bx, fitted_kt, trace = lee_carter_poisson(D_xt, E_xt, max_iter=2000, tol=1e-10)
+
+    observed = E_xt > 0
+    D_hat = E_xt * np.exp(fitted_ax[:, np.newaxis] + fitted_bx[:, np.newaxis] * fitted_kt)
+    np.testing.assert_allclose(np.where(observed, D_xt - D_hat, 0.0).sum(axis=1), 0.0, atol=1e-5)
+    assert np.isfinite(trace['objective']).all()
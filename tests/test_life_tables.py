@@ -0,0 +1,63 @@
+import numpy as np
+
+from nz_mortality.life_tables import age_group_bounds, age_group_widths, age_group_midpoints, life_table, period_life_expectancy
+
+AGE_GROUPS = ['0', '01-04', '05-09', '95+']
+
+# Libellés groupés, âges simples et groupe ouvert ; la largeur d'un groupe va jusqu'au groupe suivant
+def test_age_group_bounds_widths_and_midpoints():
+    lower_bounds, upper_bounds = age_group_bounds(AGE_GROUPS)
+    np.testing.assert_array_equal(lower_bounds, [0, 1, 5, 95])
+    np.testing.assert_array_equal(upper_bounds, [0, 4, 9, np.inf])
+    np.testing.assert_array_equal(age_group_widths(AGE_GROUPS), [1, 4, 90, np.inf])
+    np.testing.assert_array_equal(age_group_midpoints(['90-94', '95+']), [92, 97])
+
+    lower_bounds, upper_bounds = age_group_bounds(['7', '8', '110+'])
+    np.testing.assert_array_equal(lower_bounds, [7, 8, 110])
+    np.testing.assert_array_equal(upper_bounds, [7, 8, np.inf])
+
+# Force de mortalité constante mu sur tous les âges : l'espérance de vie est 1 / mu à tout âge, et le facteur de rente continue
+# 1 / (mu + log(1 + i))
+def test_constant_force_closed_form():
+    mu, interest_rate = 0.02, 0.03
+    widths = np.array([1.0, 4.0, 5.0, 10.0, np.inf])
+    death_rates = np.full((len(widths), 3), mu)
+
+    table = life_table(death_rates, widths, interest_rate=interest_rate, radix=1000.0)
+
+    np.testing.assert_allclose(table['ex'], 1 / mu)
+    np.testing.assert_allclose(table['annuity'], 1 / (mu + np.log1p(interest_rate)))
+    np.testing.assert_allclose(table['lx'][:, 0], 1000.0 * np.exp(-mu * np.r_[0.0, np.cumsum(widths[:-1])]))
+    np.testing.assert_allclose(table['dx'].sum(axis=0), 1000.0)
+    np.testing.assert_allclose(period_life_expectancy(death_rates, widths), table['ex'])
+
+# Un taux nul donne la limite lx × largeur pour Lx, et non 0 / 0
+def test_zero_force_uses_limit():
+    widths = np.array([1.0, 4.0, np.inf])
+    table = life_table(np.array([[0.0], [0.01], [0.1]]), widths)
+
+    np.testing.assert_allclose(table['Lx'][:, 0], [1.0, (1 - np.exp(-0.04)) / 0.01, np.exp(-0.04) / 0.1])
+    np.testing.assert_allclose(table['ex'][0, 0], 1.0 + table['ex'][1, 0])
+    assert np.isfinite(table['ex']).all()
+
+# Table par génération : chaque âge est lu dans la période où la génération l'atteint, calculée à partir de first_age
+def test_cohort_table_follows_diagonal_from_first_age():
+    death_rates = np.array([
+        [0.01, 0.02, 0.03],
+        [0.04, 0.05, 0.06],
+        [0.07, 0.08, 0.09]
+    ])
+    widths = np.array([5.0, 5.0, np.inf])
+
+    cohort = life_table(death_rates, widths, kind='cohort', period_width=5, first_age=65)
+    diagonal = life_table(np.array([[0.01], [0.05], [0.09]]), widths)
+    np.testing.assert_allclose(cohort['ex'][:, 0], diagonal['ex'][:, 0])
+    assert np.isnan(cohort['ex'][:, 1:]).all()
+
+    # Avec first_age=3 les groupes 3-4, 5-9 et 10+ tombent dans trois périodes successives, alors que des âges comptés depuis 0
+    # (0-1, 2-6, 7+) mettraient les deux premiers dans la même période
+    widths = np.array([2.0, 5.0, np.inf])
+    death_rates = np.array([[0.01], [0.02], [0.03]]) * np.arange(1, 5)
+    cohort = life_table(death_rates, widths, kind='cohort', period_width=5, first_age=3)
+    diagonal = life_table(np.array([[0.01], [0.04], [0.09]]), widths)
+    np.testing.assert_allclose(cohort['ex'][:, 0], diagonal['ex'][:, 0])
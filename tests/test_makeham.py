@@ -0,0 +1,58 @@
+import numpy as np
+
+from nz_mortality.makeham import gompertz_makeham, gompertz_makeham_jacobian, fit_gompertz_makeham_populations
+from nz_mortality.cache import FitCache
+
+AGE_MIDPOINTS = np.arange(2.5, 100.0, 5.0)
+
+# Taux exacts de Gompertz-Makeham dont B diminue d'une période à l'autre
+def exact_parameters(n_periods, scale=1.0):
+    return np.column_stack([np.full(n_periods, 5e-4 * scale), 3e-5 * scale * 0.9 ** np.arange(n_periods), np.full(n_periods, 0.1)])
+
+def exact_rates(params):
+    return np.column_stack([gompertz_makeham(AGE_MIDPOINTS, *period_params) for period_params in params])
+
+def test_jacobian_matches_finite_differences():
+    params = np.array([5e-4, 3e-5, 0.1])
+    steps = params * 1e-6
+    numerical = np.column_stack([
+        (gompertz_makeham(AGE_MIDPOINTS, *(params + step)) - gompertz_makeham(AGE_MIDPOINTS, *(params - step))) / (2 * step[i])
+        for i, step in enumerate(np.diag(steps))
+    ])
+    np.testing.assert_allclose(gompertz_makeham_jacobian(AGE_MIDPOINTS, *params), numerical, rtol=1e-6)
+
+# Chaque période retrouve ses paramètres exacts ; les populations plus courtes sont complétées par des NaN
+def test_fit_recovers_exact_parameters():
+    params = [exact_parameters(6), exact_parameters(4, scale=2.0)]
+    fitted, covariances = fit_gompertz_makeham_populations(AGE_MIDPOINTS, [exact_rates(p) for p in params], n_jobs=1)
+
+    np.testing.assert_allclose(fitted[0], params[0], rtol=1e-5)
+    np.testing.assert_allclose(fitted[1, :4], params[1], rtol=1e-5)
+    assert np.isnan(fitted[1, 4:]).all() and np.isnan(covariances[1, 4:]).all()
+
+# Les processus reçoivent les mêmes blocs de périodes qu'en séquentiel : le résultat est identique. Découper une population en
+# plusieurs blocs (départs à chaud seulement à l'intérieur de chaque bloc) donne le même ajustement à la précision de l'optimiseur.
+def test_process_pool_matches_sequential_fit():
+    rng = np.random.default_rng(0)
+    matrices = [exact_rates(exact_parameters(6)) * rng.lognormal(0.0, 0.05, (len(AGE_MIDPOINTS), 6)) for _ in range(2)]
+
+    sequential = fit_gompertz_makeham_populations(AGE_MIDPOINTS, matrices, n_jobs=1)
+    parallel = fit_gompertz_makeham_populations(AGE_MIDPOINTS, matrices, n_jobs=2)
+    for sequential_values, parallel_values in zip(sequential, parallel):
+        np.testing.assert_array_equal(parallel_values, sequential_values)
+
+    chunked, _ = fit_gompertz_makeham_populations(AGE_MIDPOINTS, matrices[:1], n_jobs=3)
+    np.testing.assert_allclose(chunked[0], sequential[0][0], rtol=1e-4)
+
+# Avec un cache, une population déjà ajustée est relue et seules les matrices modifiées sont réajustées
+def test_cached_populations_are_not_refitted(tmp_path):
+    cache = FitCache(cache_dir=str(tmp_path), enabled=True)
+    matrices = [exact_rates(exact_parameters(5)), exact_rates(exact_parameters(5, scale=2.0))]
+
+    first = fit_gompertz_makeham_populations(AGE_MIDPOINTS, matrices, n_jobs=1, cache=cache)
+    matrices[1] = exact_rates(exact_parameters(5, scale=3.0))
+    second = fit_gompertz_makeham_populations(AGE_MIDPOINTS, matrices, n_jobs=1, cache=cache)
+
+    assert (cache.hits, cache.misses) == (1, 3)
+    np.testing.assert_array_equal(second[0][0], first[0][0])
+    np.testing.assert_allclose(second[0][1], exact_parameters(5, scale=3.0), rtol=1e-5)
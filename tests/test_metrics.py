@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nz_mortality.metrics import (
+    MAPE_INTERPRETATIONS, interpret_mape, compute_error_metrics, calculate_mape_per_age_group, regression_diagnostics
+)
+
+ACTUAL = np.array([[[1.0, 2.0, np.nan], [4.0, 5.0, 10.0]]])
+FORECAST = np.array([
+    [[[1.1, 1.8, 3.0], [4.0, 6.0, np.nan]]],
+    [[[2.0, 2.0, 2.0], [np.nan, np.nan, np.nan]]]
+])
+
+# Exemple calculé à la main : les cases où la valeur observée ou prévue manque ne comptent ni au numérateur ni au dénominateur
+def test_error_metrics_hand_computed_with_missing_cells():
+    results_df = compute_error_metrics(ACTUAL, FORECAST, ['A', 'B'], ['NZ'], ['0', '01-04']).set_index(['Model', 'Age'])
+
+    np.testing.assert_allclose(results_df.loc[('A', '0'), ['MAPE', 'MAD', 'RMSE']].to_numpy(dtype=float), [10.0, 0.15, np.sqrt(0.025)])
+    np.testing.assert_allclose(results_df.loc[('A', '01-04'), ['MAPE', 'MAD', 'RMSE']].to_numpy(dtype=float), [10.0, 0.5, np.sqrt(0.5)])
+    np.testing.assert_allclose(results_df.loc[('A', 'Tous'), ['MAPE', 'MAD', 'RMSE']].to_numpy(dtype=float), [10.0, 0.325, np.sqrt(0.2625)])
+    np.testing.assert_allclose(results_df.loc[('A', '0'), 'Log Error'], (np.log(1.1) - np.log(0.9)) / 2)
+
+    # Le modèle B ne prévoit rien pour le deuxième groupe : ses mesures restent NaN, sans interprétation
+    np.testing.assert_allclose(results_df.loc[('B', '0'), 'MAPE'], 50.0)
+    assert results_df.loc[('B', '0'), 'Interpretation'] == MAPE_INTERPRETATIONS[3]
+    assert np.isnan(results_df.loc[('B', '01-04'), 'MAPE']) and pd.isna(results_df.loc[('B', '01-04'), 'Interpretation'])
+    np.testing.assert_allclose(results_df.loc[('B', 'Tous'), 'MAPE'], 50.0)
+    assert (results_df['Population'] == 'NZ').all()
+
+def test_mape_per_age_group_skips_missing_periods():
+    actual_df = pd.DataFrame(ACTUAL[0], index=['0', '01-04'])
+    mape_series = calculate_mape_per_age_group(actual_df, pd.DataFrame(FORECAST[0, 0], index=['0', '01-04']))
+    np.testing.assert_allclose(mape_series, [10.0, 10.0])
+
+# Chaque borne appartient à l'intervalle qui commence à cette borne
+@pytest.mark.parametrize('mape, band', [(0.0, 0), (9.999, 0), (10.0, 1), (19.999, 1), (20.0, 2), (49.999, 2), (50.0, 3), (500.0, 3)])
+def test_mape_band_edges(mape, band):
+    assert interpret_mape(mape) == MAPE_INTERPRETATIONS[band]
+
+# Les diagnostics calculés à partir d'une seule résolution des moindres carrés sont ceux de statsmodels et scipy sur une régression
+# ajustée séparément ; une série terminée par des NaN est diagnostiquée sur ses seules périodes observées
+def test_regression_diagnostics_match_statsmodels():
+    sm = pytest.importorskip('statsmodels.api')
+    from scipy import stats
+    from statsmodels.stats.diagnostic import het_breuschpagan
+    from statsmodels.stats.stattools import durbin_watson
+
+    rng = np.random.default_rng(42)
+    t = np.arange(30, dtype=np.float64)
+    kt = np.stack([
+        3.0 - 0.5 * t + rng.normal(0.0, 1.0 + 0.1 * t),
+        1.0 + 0.2 * t + rng.normal(0.0, 2.0, len(t))
+    ])
+    kt[1, 24:] = np.nan
+
+    diagnostics = regression_diagnostics(kt)
+
+    for series, (_, row) in zip(kt, diagnostics.iterrows()):
+        y = series[np.isfinite(series)]
+        exog = sm.add_constant(t[:len(y)])
+        ols = sm.OLS(y, exog).fit()
+        standardized = (ols.resid - ols.resid.mean()) / ols.resid.std()
+
+        assert row['n'] == len(y)
+        np.testing.assert_allclose(row[['alpha', 'beta']], ols.params, rtol=1e-10)
+        np.testing.assert_allclose(row['R-squared'], ols.rsquared, rtol=1e-10)
+        np.testing.assert_allclose(row['Durbin-Watson'], durbin_watson(ols.resid), rtol=1e-10)
+        np.testing.assert_allclose(row[['F-statistic', 'F p-value']], [ols.fvalue, ols.f_pvalue], rtol=1e-8)
+        np.testing.assert_allclose(row['KS p-value'], stats.kstest(standardized, 'norm', method='exact').pvalue, rtol=1e-8)
+        np.testing.assert_allclose(row[['BP-statistic', 'BP p-value']], het_breuschpagan(ols.resid, exog)[:2], rtol=1e-8)
@@ -0,0 +1,25 @@
+import os
+import sys
+import subprocess
+import importlib
+
+import nz_mortality
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules chargés après l'instruction donnée, dans un nouvel interpréteur
+def loaded_modules(statement):
+    code = f"import sys; before = set(sys.modules); {statement}; print(' '.join(sorted(set(sys.modules) - before)))"
+    return set(subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout.split())
+
+def test_package_import_loads_nothing_heavy():
+    heavy = {'numpy', 'pandas', 'scipy', 'statsmodels', 'matplotlib', 'sklearn'}
+    assert not heavy & loaded_modules('import nz_mortality')
+    assert not (heavy - {'numpy'}) & loaded_modules('import nz_mortality.projection')
+
+# Chaque nom exporté existe dans le module indiqué par SUBMODULES
+def test_every_exported_name_resolves():
+    for module, names in nz_mortality.SUBMODULES.items():
+        submodule = importlib.import_module(f'nz_mortality.{module}')
+        for name in names:
+            assert getattr(nz_mortality, name) is getattr(submodule, name)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('Agg')
+from matplotlib.image import imread
+
+import nz_mortality.plotting
+from nz_mortality.plotting import FigureQueue
+
+def curve_job(queue, filename, scale):
+    x = np.arange(5)
+    queue.add(
+        'age_curves', filename, x=x, xticklabels=[f'{5 * i}-{5 * i + 4}' for i in x], curves=[scale * x, scale * x ** 2],
+        labels=['a', 'b'], colors=['blue', 'orange'], style={'marker': 'o'}, title=f'échelle {scale}', xlabel='âge', ylabel='taux'
+    )
+
+# Deux graphiques de même clé sont dessinés sur la même figure : les deux fichiers sont écrits et le second est identique à un rendu
+# du second graphique sur une figure neuve, il ne garde donc rien du premier
+def test_reused_figure_reflects_new_data(tmp_path, monkeypatch):
+    figure_ids = []
+    draw_age_curves = nz_mortality.plotting.draw_age_curves
+    def recorded_draw(job, figure, artists):
+        figure, artists = draw_age_curves(job, figure, artists)
+        figure_ids.append(id(figure))
+        return figure, artists
+    monkeypatch.setitem(nz_mortality.plotting.FIGURE_RENDERERS, 'age_curves', recorded_draw)
+
+    queue = FigureQueue()
+    curve_job(queue, 'first.png', 1.0)
+    curve_job(queue, 'second.png', 3.0)
+    paths = queue.render(output_dir=str(tmp_path), n_jobs=1)
+
+    assert paths == [str(tmp_path / 'first.png'), str(tmp_path / 'second.png')]
+    assert figure_ids[0] == figure_ids[1]
+    assert queue.jobs == []
+
+    fresh = FigureQueue()
+    curve_job(fresh, 'fresh.png', 3.0)
+    fresh.render(output_dir=str(tmp_path), n_jobs=1)
+
+    first, second, expected = (imread(tmp_path / name) for name in ('first.png', 'second.png', 'fresh.png'))
+    np.testing.assert_array_equal(second, expected)
+    assert not np.array_equal(first, second)
+
+# Le rendu par plusieurs processus écrit les mêmes images que le rendu séquentiel
+def test_process_pool_rendering_matches_sequential(tmp_path):
+    outputs = {}
+    for n_jobs in (1, 2):
+        queue = FigureQueue()
+        for i in range(4):
+            curve_job(queue, f'curve_{i}.png', 1.0 + i)
+        queue.add('mape_bars', 'mape.png', labels=['0', '01-04'], values=np.array([5.0, 30.0]), colors=['green', 'orange'])
+        output_dir = tmp_path / f'jobs_{n_jobs}'
+        paths = queue.render(output_dir=str(output_dir), n_jobs=n_jobs)
+        outputs[n_jobs] = [imread(path) for path in paths]
+        assert len(paths) == 5
+
+    for sequential, parallel in zip(outputs[1], outputs[2]):
+        np.testing.assert_array_equal(parallel, sequential)
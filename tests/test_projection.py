@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from nz_mortality.projection import project_death_rates, project_mortality_rates, project_li_lee, Prediction_death_rates
+
+from conftest import lee_carter_parameters
+
+# La projection diffusée est exp(ax + bx kt) case par case, pour un vecteur kt comme pour un tableau de trajectoires
+def test_projection_matches_cellwise_formula():
+    ax, bx, kt = lee_carter_parameters()
+    paths = np.stack([kt[:3], kt[3:6]])
+
+    projected = project_death_rates(ax, bx, paths)
+    expected = np.array([[[np.exp(ax[x] + bx[x] * path[t]) for t in range(3)] for x in range(len(ax))] for path in paths])
+    np.testing.assert_allclose(projected, expected)
+
+    out = np.empty((len(ax), 3))
+    assert project_mortality_rates(ax, bx, kt[:3], out=out) is out
+    np.testing.assert_allclose(out, 1 - np.exp(-expected[0]))
+
+    frame = Prediction_death_rates(ax, bx, kt[:4], [f'age {x}' for x in range(len(ax))], ['2015', '2016', '2017'])
+    assert list(frame.columns) == ['2015', '2016', '2017']
+    np.testing.assert_allclose(frame.to_numpy(), expected[0])
+
+def li_lee_parameters(kt):
+    kt = np.asarray(kt, dtype=np.float64)
+    P, m = kt.shape
+    ax = np.full((P, 3), -5.0)
+    Bx = np.full(3, 1 / 3)
+    Kt = np.linspace(2.0, -2.0, m)
+    bx = np.full((P, 3), 1 / 3)
+    return ax, Bx, Kt, bx, kt
+
+# phi est la pente sans constante de k_pt sur k_p(t-1) ; k_pt part de sa dernière période observée et Kt suit la dérive
+def test_project_li_lee_ar1_from_last_observed_period():
+    ax, Bx, Kt, bx, kt = li_lee_parameters([[1.0, 0.5, 0.25, 0.125], [2.0, -1.0, np.nan, np.nan]])
+
+    log_m_pxt, phi = project_li_lee(ax, Bx, Kt, bx, kt, horizon=2)
+
+    np.testing.assert_allclose(phi, [0.5, -0.5])
+    expected_kt = np.array([[1.0, 0.5, 0.25, 0.125, 0.0625, 0.03125], [2.0, -1.0, 0.5, -0.25, 0.125, -0.0625]])
+    expected_Kt = np.r_[Kt, Kt[-1] - 4.0 / 3.0 * np.arange(1, 3)]
+    expected = -5.0 + (expected_Kt + expected_kt[:, np.newaxis, :]) / 3
+    np.testing.assert_allclose(log_m_pxt, np.broadcast_to(expected, log_m_pxt.shape))
+
+# Un phi explosif est ramené à max_phi avec un avertissement, et une population sans AR(1) estimable revient à la tendance commune
+def test_project_li_lee_clips_phi_and_handles_zero_denominator():
+    ax, Bx, Kt, bx, kt = li_lee_parameters([[1.0, 2.0, 4.0, 8.0], [0.0, 0.0, 0.0, 0.0], [np.nan, 3.0, np.nan, np.nan]])
+
+    with pytest.warns(RuntimeWarning):
+        log_m_pxt, phi = project_li_lee(ax, Bx, Kt, bx, kt, horizon=3, max_phi=0.9)
+
+    np.testing.assert_allclose(phi, [0.9, 0.0, 0.0])
+    assert np.isfinite(log_m_pxt).all()
+    np.testing.assert_allclose(log_m_pxt[2, :, 4:], log_m_pxt[1, :, 4:])
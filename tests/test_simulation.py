@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from nz_mortality.simulation import fit_kt_process, simulate_kt_paths, simulate_mortality_fan
+from nz_mortality.projection import project_death_rates
+from nz_mortality.life_tables import period_life_expectancy
+
+from conftest import lee_carter_parameters
+
+# Marche aléatoire avec dérive : prévision, écart type et poids psi explicites
+def test_random_walk_process_is_explicit():
+    kt = np.array([0.0, -1.0, -1.5, -3.0, -4.0])
+    process = fit_kt_process(kt, horizon=3)
+
+    np.testing.assert_allclose(process['forecast'], -4.0 - np.arange(1, 4))
+    np.testing.assert_allclose(process['sigma'], np.diff(kt).std(ddof=1))
+    np.testing.assert_allclose(process['propagation'], np.triu(np.ones((3, 3))))
+
+# Pour un AR(1), l'innovation de la première période agit sur la période h avec le poids phi^h, et pour un ARIMA(1, 1, 0) avec la
+# somme cumulée de ces poids
+def test_arima_psi_weights_match_closed_form():
+    from statsmodels.tsa.arima.model import ARIMA
+
+    rng = np.random.default_rng(0)
+    kt = np.zeros(60)
+    for t in range(1, 60):
+        kt[t] = 0.6 * kt[t - 1] + rng.normal()
+
+    phi = ARIMA(kt, order=(1, 0, 0), trend='c').fit().arparams[0]
+    propagation = fit_kt_process(kt, horizon=5, arima_order=(1, 0, 0))['propagation']
+    np.testing.assert_allclose(propagation[0], phi ** np.arange(5), rtol=1e-6)
+    np.testing.assert_allclose(propagation[2], np.r_[0.0, 0.0, phi ** np.arange(3)], rtol=1e-6)
+
+    walk = np.cumsum(kt)
+    phi = ARIMA(walk, order=(1, 1, 0), trend='t').fit().arparams[0]
+    propagation = fit_kt_process(walk, horizon=5, arima_order=(1, 1, 0))['propagation']
+    np.testing.assert_allclose(propagation[0], np.cumsum(phi ** np.arange(5)), rtol=1e-6)
+
+# La variance des trajectoires simulées à l'horizon h est sigma² fois la somme des carrés des poids psi
+def test_simulated_paths_have_psi_weight_variance():
+    _, _, kt = lee_carter_parameters()
+    process = fit_kt_process(kt, horizon=4)
+    paths = simulate_kt_paths(process, 200000, np.random.default_rng(1))
+
+    expected_variance = process['sigma'] ** 2 * np.sum(process['propagation'] ** 2, axis=0)
+    assert np.all(np.abs(paths.mean(axis=0) - process['forecast']) < 4 * np.sqrt(expected_variance / 200000))
+    np.testing.assert_allclose(paths.var(axis=0), expected_variance, rtol=0.02)
+
+def brute_force_fan(ax, bx, kt, horizon, n_paths, chunk_size, quantiles, random_state):
+    process = fit_kt_process(kt, horizon)
+    rng = np.random.default_rng(random_state)
+    paths = np.concatenate([simulate_kt_paths(process, min(chunk_size, n_paths - start), rng) for start in range(0, n_paths, chunk_size)])
+    death_rates = project_death_rates(ax, bx, paths)
+    age_widths = np.append(np.ones(len(ax) - 1), np.inf)
+    return np.quantile(-np.expm1(-death_rates), quantiles, axis=0), np.quantile(period_life_expectancy(death_rates, age_widths), quantiles, axis=0)
+
+# Les quantiles obtenus à partir des seules statistiques d'ordre de kt sont ceux de toutes les trajectoires, que bx soit de signe
+# constant (fonctions monotones de kt) ou non (sous-échantillon, ici égal à toutes les trajectoires)
+@pytest.mark.parametrize('mixed_signs', [False, True])
+def test_mortality_fan_matches_all_paths(mixed_signs):
+    ax, bx, kt = lee_carter_parameters()
+    if mixed_signs:
+        bx = bx.copy()
+        bx[-2] = -0.05
+    quantiles = (0.05, 0.5, 0.95)
+
+    mortality_fan, life_expectancy_fan = simulate_mortality_fan(ax, bx, kt, 5, n_paths=3000, quantiles=quantiles, chunk_size=700, random_state=3)
+    expected_mortality, expected_life_expectancy = brute_force_fan(ax, bx, kt, 5, 3000, 700, quantiles, 3)
+
+    np.testing.assert_allclose(mortality_fan, expected_mortality, rtol=1e-12)
+    np.testing.assert_allclose(life_expectancy_fan, expected_life_expectancy, rtol=1e-12)
+
+# Au-delà de max_stored_paths, les cellules monotones restent exactes : seules les espérances de vie où bx change de signe utilisent
+# le sous-échantillon des max_stored_paths premières trajectoires
+def test_mortality_fan_cap_only_affects_mixed_cells():
+    ax, bx, kt = lee_carter_parameters()
+    bx = bx.copy()
+    bx[-2] = -0.05
+    quantiles = (0.1, 0.9)
+
+    mortality_fan, life_expectancy_fan = simulate_mortality_fan(
+        ax, bx, kt, 4, n_paths=5000, quantiles=quantiles, chunk_size=1000, max_stored_paths=500, random_state=4)
+    expected_mortality, expected_life_expectancy = brute_force_fan(ax, bx, kt, 4, 5000, 1000, quantiles, 4)
+    _, subsample_life_expectancy = brute_force_fan(ax, bx, kt, 4, 500, 1000, quantiles, 4)
+
+    np.testing.assert_allclose(mortality_fan, expected_mortality, rtol=1e-12)
+    np.testing.assert_allclose(life_expectancy_fan[:, -1], expected_life_expectancy[:, -1], rtol=1e-12)
+    np.testing.assert_allclose(life_expectancy_fan[:, :-2], subsample_life_expectancy[:, :-2], rtol=1e-12)